@@ -1,21 +1,25 @@
 import asyncio
+import json
 import os
-from typing import List
+from contextlib import aclosing, suppress
+from typing import Any, Dict, List, Optional
 
 from fastapi import FastAPI, UploadFile, File, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 
-from .services.profiling import profile_datasets
+from .services.profiling import profile_datasets, shutdown_executor, cache_stats as profile_cache_stats
 from .services.pipeline import PipelineRequest, create_pipeline_from_intent, run_pipeline
 from .services.intent import parse_intent
+from .services.intent_classifier import intent_classifier
 from .db.session import init_db
 from .services import vector as vector_store
 from .db.session import fetch_recent_runs
 from .services.reco import recommend_storage, generate_postgres_ddl, generate_clickhouse_ddl
 from .services.scheduler import schedule_daily_pipeline, ensure_scheduler_started
 from .services.airflow_export import dag_from_steps
+from .services.planner import explain as explain_plan
 from .services.semantic_join import suggest_join_keys, build_data_contract
 
 
@@ -23,6 +27,20 @@ class HealthResponse(BaseModel):
     status: str
 
 
+class VectorSearchRequest(BaseModel):
+    namespace: str = "default"
+    query: str = ""
+    top_k: int = 5
+    filter: Optional[Dict[str, Any]] = None  # metadata key -> value, or list of values (any of)
+
+
+class VectorSearchBatchRequest(BaseModel):
+    namespace: str = "default"
+    queries: List[str] = []
+    top_k: int = 5
+    filter: Optional[Dict[str, Any]] = None
+
+
 def create_app() -> FastAPI:
     app = FastAPI(title="DataEngineer AI", version="0.1.0")
 
@@ -39,6 +57,12 @@ def create_app() -> FastAPI:
         await init_db()
         ensure_scheduler_started()
 
+    @app.on_event("shutdown")
+    async def on_shutdown() -> None:
+        shutdown_executor()
+        from .services.llm_client import llm_client
+        await llm_client.aclose()
+
     @app.get("/health", response_model=HealthResponse)
     async def health() -> HealthResponse:
         return HealthResponse(status="ok")
@@ -48,6 +72,10 @@ def create_app() -> FastAPI:
         profiles = await profile_datasets(files)
         return JSONResponse(content={"profiles": profiles})
 
+    @app.get("/upload/profile/cache")
+    async def upload_profile_cache():
+        return profile_cache_stats()
+
     @app.post("/reco/storage")
     async def reco_storage(payload: dict):
         profile = payload.get("profile", {})
@@ -61,7 +89,10 @@ def create_app() -> FastAPI:
         if system in ("postgres", "postgresql"):
             return {"ddl": generate_postgres_ddl(table, columns_info)}
         if system in ("clickhouse", "ch"):
-            return {"ddl": generate_clickhouse_ddl(table, columns_info)}
+            order_by = payload.get("order_by")
+            if isinstance(order_by, str):
+                order_by = [order_by]
+            return {"ddl": generate_clickhouse_ddl(table, columns_info, order_by, payload.get("partition_by"))}
         return JSONResponse(status_code=400, content={"error": "Unsupported system"})
 
     @app.post("/intent/parse")
@@ -70,21 +101,63 @@ def create_app() -> FastAPI:
         result = await parse_intent(text)
         return JSONResponse(content=result)
 
+    @app.get("/intent/stats")
+    async def intent_stats():
+        return intent_classifier.stats()
+
     @app.post("/vector/upsert")
     async def vector_upsert(payload: dict):
         namespace = payload.get("namespace", "default")
         doc_id = payload.get("id") or payload.get("doc_id") or "doc"
         text = payload.get("text", "")
         metadata = payload.get("metadata", {})
-        vector_store.upsert(namespace, doc_id, text, metadata)
+        try:
+            await vector_store.run(vector_store.upsert, namespace, doc_id, text, metadata)
+        except PermissionError as e:
+            return JSONResponse(status_code=403, content={"error": str(e)})
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
         return {"status": "ok"}
 
     @app.post("/vector/search")
-    async def vector_search(payload: dict):
+    async def vector_search(req: VectorSearchRequest):
+        try:
+            results = await vector_store.run(vector_store.search, req.namespace, req.query, req.top_k, req.filter or None)
+            return {"results": results}
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+
+    @app.post("/vector/upsert_batch")
+    async def vector_upsert_batch(payload: dict):
         namespace = payload.get("namespace", "default")
-        query = payload.get("query", "")
-        top_k = int(payload.get("top_k", 5))
-        return {"results": vector_store.search(namespace, query, top_k)}
+        documents = payload.get("documents", [])
+        try:
+            count = await vector_store.run(vector_store.upsert_batch, namespace, documents)
+        except PermissionError as e:
+            return JSONResponse(status_code=403, content={"error": str(e)})
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+        return {"status": "ok", "count": count}
+
+    @app.post("/vector/search_batch")
+    async def vector_search_batch(req: VectorSearchBatchRequest):
+        try:
+            results = await vector_store.run(
+                vector_store.search_batch, req.namespace, req.queries, req.top_k, req.filter or None
+            )
+            return {"results": results}
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
+
+    @app.post("/vector/compact")
+    async def vector_compact(payload: dict):
+        namespace = payload.get("namespace", "default")
+        try:
+            return await vector_store.run(vector_store.compact, namespace)
+        except PermissionError as e:
+            return JSONResponse(status_code=403, content={"error": str(e)})
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": str(e)})
 
     @app.post("/semantic/join_suggest")
     async def semantic_join(payload: dict):
@@ -104,9 +177,38 @@ def create_app() -> FastAPI:
         response = await llm_client.generate_response(message)
         return {"response": response}
 
+    @app.post("/chat/assistant/stream")
+    async def chat_assistant_stream(payload: dict):
+        from .services.llm_client import llm_client
+        message = payload.get("message", "")
+        max_tokens = int(payload.get("max_tokens", 500))
+
+        async def events():
+            # Starlette cancels this generator when the client disconnects
+            async with aclosing(llm_client.stream_response(message, max_tokens)) as tokens:
+                async for token in tokens:
+                    yield f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n"
+            yield "event: done\ndata: {}\n\n"
+
+        return StreamingResponse(
+            events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    @app.get("/llm/cache")
+    async def llm_cache():
+        from .services.llm_client import cache_stats as llm_cache_stats
+        return llm_cache_stats()
+
+    @app.get("/llm/providers")
+    async def llm_providers():
+        from .services.llm_client import llm_client
+        return {"providers": llm_client.provider_stats()}
+
     @app.post("/pipeline/plan")
     async def pipeline_plan(req: PipelineRequest):
         plan = await create_pipeline_from_intent(req)
+        if req.explain:
+            plan["optimized"] = explain_plan(plan.get("steps") or [])
         return JSONResponse(content=plan)
 
     @app.post("/pipeline/run")
@@ -114,6 +216,20 @@ def create_app() -> FastAPI:
         result = await run_pipeline(req)
         return JSONResponse(content=result)
 
+    @app.get("/pipeline/cache")
+    async def pipeline_cache():
+        from .services.step_cache import get_step_cache
+        cache = get_step_cache()
+        return cache.stats() if cache is not None else {"enabled": False}
+
+    @app.delete("/pipeline/cache")
+    async def pipeline_cache_clear():
+        from .services.step_cache import get_step_cache
+        cache = get_step_cache()
+        if cache is not None:
+            cache.clear()
+        return {"status": "ok"}
+
     @app.post("/airflow/export")
     async def airflow_export(req: PipelineRequest):
         plan = await create_pipeline_from_intent(req)
@@ -130,18 +246,49 @@ def create_app() -> FastAPI:
         intent_text = payload.get("intent_text", "etl по user_id")
         hour = int(payload.get("hour", 0))
         minute = int(payload.get("minute", 0))
-        job_id = schedule_daily_pipeline(intent_text=intent_text, hour=hour, minute=minute)
+        incremental = bool(payload.get("incremental", True))
+        job_id = schedule_daily_pipeline(intent_text=intent_text, hour=hour, minute=minute, incremental=incremental)
         return {"job_id": job_id}
 
     @app.websocket("/ws")
     async def websocket_endpoint(ws: WebSocket):
+        # Client sends {"message": ..., "max_tokens": ...} (or plain text) and receives
+        # {"type": "token", "data": ...} frames then {"type": "done"}; {"type": "cancel"}
+        # or a new message stops the answer in progress
+        from .services.llm_client import llm_client
+
+        async def relay(message: str, max_tokens: int) -> None:
+            async with aclosing(llm_client.stream_response(message, max_tokens)) as tokens:
+                async for token in tokens:
+                    # send waits for the socket, so a slow client slows the upstream read
+                    await ws.send_json({"type": "token", "data": token})
+            await ws.send_json({"type": "done"})
+
         await ws.accept()
+        task: Optional[asyncio.Task] = None
         try:
             while True:
-                msg = await ws.receive_text()
-                await ws.send_text(f"echo: {msg}")
+                raw = await ws.receive_text()
+                try:
+                    msg = json.loads(raw)
+                except ValueError:
+                    msg = None
+                if not isinstance(msg, dict):
+                    msg = {"message": raw}
+                if task is not None and not task.done():
+                    task.cancel()
+                    with suppress(asyncio.CancelledError):
+                        await task
+                    await ws.send_json({"type": "cancelled"})
+                if msg.get("type") == "cancel":
+                    continue
+                task = asyncio.create_task(relay(msg.get("message", ""), int(msg.get("max_tokens", 500))))
         except WebSocketDisconnect:
             pass
+        finally:
+            # Closing the token generator closes the provider connection
+            if task is not None:
+                task.cancel()
 
     return app
 
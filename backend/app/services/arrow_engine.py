@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Dict, List
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.json as pajson
+
+from .ch_client import write_arrow as ch_write_arrow
+from .incremental import average, merge_state
+from .parquet_io import read_table as read_parquet, scan_literal, write_dataset as write_parquet
+from .pg_sink import write_postgres
+
+
+# Columnar engine: every intermediate is a pyarrow Table, strings stay in Arrow
+# buffers (no object dtype) and steps that only touch some columns share the rest.
+
+
+def _read_json(path: str) -> pa.Table:
+    with open(path, "rb") as fh:
+        first = fh.read(1024).lstrip()[:1]
+    if first == b"[":
+        # pyarrow only parses JSON lines natively; arrays of records go through the json module
+        with open(path, "rb") as fh:
+            return pa.Table.from_pylist(json.load(fh))
+    return pajson.read_json(path)
+
+
+_COMPARISONS = {
+    "==": pc.equal,
+    "!=": pc.not_equal,
+    ">": pc.greater,
+    ">=": pc.greater_equal,
+    "<": pc.less,
+    "<=": pc.less_equal,
+}
+
+
+def _filter(table: pa.Table, step: Dict[str, Any]) -> pa.Table:
+    column = table[step["column"]]
+    operator = step.get("operator", "==")
+    value = step.get("value")
+    if operator in _COMPARISONS:
+        try:
+            # JSON values: a timestamp bound is an ISO string, which Arrow will not compare with timestamps
+            value = scan_literal(value, column.type)
+        except (pa.ArrowException, ValueError, TypeError):
+            pass
+        mask = _COMPARISONS[operator](column, value)
+    elif operator in ("in", "not_in"):
+        mask = pc.is_in(column, value_set=pa.array(value, type=column.type))
+        if operator == "not_in":
+            mask = pc.invert(mask)
+    elif operator == "notnull":
+        mask = pc.is_valid(column)
+    elif operator == "isnull":
+        mask = pc.is_null(column)
+    else:
+        raise ValueError(f"Unsupported filter operator: {operator}")
+    return table.filter(mask, null_selection_behavior="drop")
+
+
+def _select_columns(table: pa.Table, columns: List[str] | None) -> pa.Table:
+    if columns is None:
+        return table
+    return table.select([c for c in table.column_names if c in columns])
+
+
+def _trim_strings(table: pa.Table) -> pa.Table:
+    for i, field in enumerate(table.schema):
+        if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+            table = table.set_column(i, field.name, pc.utf8_trim_whitespace(table.column(i)))
+    return table
+
+
+def _join(left: pa.Table, right: pa.Table, on: str | List[str]) -> pa.Table:
+    # Table.join emits rows in no particular order; pandas merge(how="left") keeps the
+    # left rows in order, each followed by its matches in right order. Row numbers on
+    # both sides restore that order, so the preview of a join matches the pandas engine.
+    left = left.append_column("__left_row", pa.array(range(left.num_rows), type=pa.int64()))
+    right = right.append_column("__right_row", pa.array(range(right.num_rows), type=pa.int64()))
+    joined = left.join(right, keys=on, join_type="left outer", left_suffix="_x", right_suffix="_y")
+    joined = joined.sort_by([("__left_row", "ascending"), ("__right_row", "ascending")])
+    return joined.drop_columns(["__left_row", "__right_row"])
+
+
+def _aggregate_avg(
+    table: pa.Table, by: str | List[str], column: str, alias: str, state: Dict[str, Any] | None = None
+) -> pa.Table:
+    keys = [by] if isinstance(by, str) else list(by)
+    # pandas groupby drops rows with a null key and sorts by the keys; match that for identical output
+    for key in keys:
+        table = table.filter(pc.is_valid(table[key]))
+    if state is not None:
+        # Incremental run: this delta's sum/count merged into the stored partial state
+        agg = table.group_by(keys).aggregate([(column, "sum"), (column, "count")]).to_pandas()
+        total = agg.set_index(by).rename(columns={f"{column}_sum": "sum", f"{column}_count": "count"})
+        return pa.Table.from_pandas(average(merge_state(total[["sum", "count"]], by, state), by, alias), preserve_index=False)
+    agg = table.group_by(keys).aggregate([(column, "mean")])
+    agg = agg.rename_columns([alias if name == f"{column}_mean" else name for name in agg.column_names])
+    return agg.select(keys + [alias]).sort_by([(key, "ascending") for key in keys])
+
+
+def execute_step(step: Dict[str, Any], context: Dict[str, pa.Table]) -> Dict[str, Any]:
+    def current() -> pa.Table:
+        return context.get("result", list(context.values())[-1])
+
+    op = step.get("op")
+    out = None
+    sink: Dict[str, Any] = {}
+    if op == "read_csv":
+        path = step.get("path", "./data/input.csv")
+        columns = step.get("columns")
+        convert = pacsv.ConvertOptions(include_columns=columns) if columns is not None else None
+        out = context[step.get("name", "csv")] = pacsv.read_csv(path, convert_options=convert)
+    elif op == "read_json":
+        path = step.get("path", "./data/input.json")
+        out = context[step.get("name", "json")] = _select_columns(_read_json(path), step.get("columns"))
+    elif op == "read_parquet":
+        path = step.get("path", "./data/input.parquet")
+        out = context[step.get("name", "parquet")] = read_parquet(path, step.get("columns"), step.get("filters"))
+    elif op == "trim_strings":
+        src = step.get("input") or "csv"
+        out = context[src] = _trim_strings(context[src])
+    elif op == "filter":
+        src = step.get("input") or ("result" if "result" in context else list(context)[-1])
+        out = context[src] = _filter(context[src], step)
+    elif op == "join":
+        left = context[step.get("left", "csv")]
+        right = context[step.get("right", "json")]
+        on = step.get("on", "user_id")
+        out = context["joined"] = _join(left, right, on)
+    elif op == "aggregate":
+        table = context.get("joined")
+        by = step.get("by", "user_id")
+        metric = step.get("metric", "avg")
+        column = step.get("column", "amount")
+        alias = step.get("alias", f"{metric}_{column}")
+        if metric == "avg":
+            out = context["result"] = _aggregate_avg(table, by, column, alias, step.get("state"))
+        else:
+            raise ValueError("Unsupported metric")
+    elif op == "write_postgres":
+        table = step.get("table", "result")
+        data = context[step["input"]] if step.get("input") else current()
+        sink = write_postgres(data.to_batches(), table, step.get("mode"), step.get("key"))
+    elif op == "write_parquet":
+        path = step.get("path", "./data/result.parquet")
+        data = context[step["input"]] if step.get("input") else current()
+        sink = write_parquet([data], path, step.get("partition_by"), step.get("mode"))
+    elif op == "write_clickhouse":
+        table = step.get("table", "default.etl_result")
+        data = context[step["input"]] if step.get("input") else current()
+        sink = ch_write_arrow(data, table, order_by=step.get("order_by"), partition_by=step.get("partition_by"),
+                              async_insert=step.get("async_insert"))
+    else:
+        raise ValueError(f"Unsupported op: {op}")
+
+    return {
+        "rows": out.num_rows if out is not None else None,
+        "nbytes": out.nbytes if out is not None else None,
+        "arrow_allocated_bytes": pa.total_allocated_bytes(),
+        **sink,
+    }
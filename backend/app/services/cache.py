@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class ResultCache:
+    """LRU cache of JSON-serializable results, optionally backed by a directory shared across restarts and workers."""
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        max_bytes: int = 64 << 20,
+        ttl: Optional[float] = None,
+        directory: Optional[str] = None,
+        max_disk_bytes: int = 512 << 20,
+        on_evict: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        # Called with the key of every entry that leaves memory (LRU eviction, expiry, clear)
+        self.on_evict = on_evict
+        # key -> (created_at, serialized value)
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._bytes = 0
+        self._disk_bytes = 0
+        self.counters = {"hits": 0, "misses": 0, "disk_hits": 0, "evictions": 0}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._disk_bytes = sum(size for _, _, size in self._disk_files())
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def _path(self, key: str) -> str:
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory or "", f"{name}.json")
+
+    def _disk_files(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                stat = entry.stat()
+                yield entry.path, stat.st_mtime, stat.st_size
+
+    def _remember(self, key: str, created_at: float, payload: str) -> None:
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old[1])
+        self._entries[key] = (created_at, payload)
+        self._bytes += len(payload)
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            evicted_key, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.counters["evictions"] += 1
+            self._evicted(evicted_key)
+
+    def _evicted(self, key: str) -> None:
+        if self.on_evict is not None:
+            self.on_evict(key)
+
+    def _read_disk(self, key: str) -> Optional[Tuple[float, str]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                record = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        if self._expired(record["created_at"]):
+            self._remove_disk(path)
+            return None
+        os.utime(path)
+        return record["created_at"], json.dumps(record["value"])
+
+    def _write_disk(self, key: str, created_at: float, value: Any) -> None:
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump({"key": key, "created_at": created_at, "value": value}, fh)
+            os.replace(tmp, path)
+            self._disk_bytes += os.path.getsize(path)
+        except OSError:
+            return
+        if self._disk_bytes > self.max_disk_bytes:
+            self._trim_disk()
+
+    def _remove_disk(self, path: str) -> None:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            self._disk_bytes -= size
+        except OSError:
+            pass
+
+    def _trim_disk(self) -> None:
+        # Other workers write to the same directory, so re-measure before trimming
+        files = sorted(self._disk_files(), key=lambda f: f[1])
+        self._disk_bytes = sum(size for _, _, size in files)
+        target = int(self.max_disk_bytes * 0.9)
+        for path, _, _ in files:
+            if self._disk_bytes <= target:
+                break
+            self._remove_disk(path)
+            self.counters["evictions"] += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is not None and self._expired(entry[0]):
+            self._bytes -= len(self._entries.pop(key)[1])
+            self._evicted(key)
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+        elif self.directory:
+            entry = self._read_disk(key)
+            if entry is not None:
+                self.counters["disk_hits"] += 1
+                self._remember(key, *entry)
+        if entry is None:
+            self.counters["misses"] += 1
+            return None
+        self.counters["hits"] += 1
+        # Every caller gets its own copy
+        return json.loads(entry[1])
+
+    def set(self, key: str, value: Any) -> None:
+        created_at = time.time()
+        self._remember(key, created_at, json.dumps(value))
+        if self.directory:
+            self._write_disk(key, created_at, value)
+
+    def clear(self) -> None:
+        keys = list(self._entries)
+        self._entries.clear()
+        for key in keys:
+            self._evicted(key)
+        self._bytes = 0
+        if self.directory:
+            for path, _, _ in list(self._disk_files()):
+                self._remove_disk(path)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "disk_bytes": self._disk_bytes if self.directory else None,
+        }
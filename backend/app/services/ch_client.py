@@ -1,7 +1,28 @@
+import contextlib
 import os
-from typing import Any
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 
 import clickhouse_connect
+import pandas as pd
+import pyarrow as pa
+
+from .reco import generate_clickhouse_ddl
+
+
+# Writers share a small pool of clients: creating one costs a round trip (server
+# version/timezone query), and each pooled client is used by one thread at a time,
+# so its session is never shared. Results are inserted in blocks of INSERT_BLOCK_ROWS,
+# so a large output is never serialized into a single request body.
+
+POOL_SIZE = int(os.getenv('CLICKHOUSE_POOL_SIZE', '4'))
+INSERT_BLOCK_ROWS = int(os.getenv('CLICKHOUSE_INSERT_BLOCK_ROWS', '262144'))
+COMPRESSION = os.getenv('CLICKHOUSE_COMPRESSION', 'lz4')
+ASYNC_INSERT = os.getenv('CLICKHOUSE_ASYNC_INSERT', '0').lower() in ('1', 'true', 'yes')
+
+_SLOTS = threading.BoundedSemaphore(POOL_SIZE)
+_IDLE: List[Any] = []
 
 
 def get_client():
@@ -9,12 +30,95 @@ def get_client():
     # Parse simple http url
     host_port = url.replace('http://','').replace('https://','')
     host, port = host_port.split(':')
-    return clickhouse_connect.get_client(host=host, port=int(port))
+    # compress applies to insert bodies as well as query results
+    return clickhouse_connect.get_client(host=host, port=int(port), compress=COMPRESSION or False)
+
+
+@contextlib.contextmanager
+def pooled_client() -> Iterator[Any]:
+    with _SLOTS:
+        try:
+            client = _IDLE.pop()
+        except IndexError:
+            client = get_client()
+        try:
+            yield client
+        except BaseException:
+            # The connection may be mid-request; do not hand it to the next writer
+            client.close()
+            raise
+        _IDLE.append(client)
+
+
+def _dtypes(chunk: Any) -> Dict[str, str]:
+    if isinstance(chunk, pd.DataFrame):
+        return {str(c): str(t) for c, t in chunk.dtypes.items()}
+    return {f.name: 'datetime64' if pa.types.is_timestamp(f.type) else str(f.type) for f in chunk.schema}
+
+
+def _default_order_by(columns: List[str]) -> List[str]:
+    # Sorting key for point lookups by entity; tuple() when nothing looks like one
+    return [c for c in columns if c == 'id' or c.endswith('_id')][:1]
+
+
+def _chain(first: Any, rest: Iterator[Any]) -> Iterator[Any]:
+    yield first
+    yield from rest
+
+
+def write_chunks(
+    chunks: Iterable[Any],
+    table: str,
+    order_by: Optional[List[str]] = None,
+    partition_by: Optional[str] = None,
+    async_insert: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """Creates table from the first chunk (DataFrame or pyarrow Table) and inserts all chunks in blocks."""
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if first is None:
+        return {'sink': 'clickhouse', 'table': table, 'rows': 0}
+    dtypes = _dtypes(first)
+    if isinstance(order_by, str):
+        order_by = [order_by]
+    order_by = order_by if order_by is not None else _default_order_by(list(dtypes))
+    # Sorting key columns cannot be Nullable; everything else may hold nulls from joins
+    columns_info = {c: {'dtype': t, 'nullable': c not in order_by} for c, t in dtypes.items()}
+    use_async = ASYNC_INSERT if async_insert is None else async_insert
+    settings = {'async_insert': 1, 'wait_for_async_insert': 1} if use_async else None
+
+    started = time.perf_counter()
+    rows = blocks = 0
+    with pooled_client() as client:
+        database, _, _ = table.rpartition('.')
+        if database:
+            client.command(f'CREATE DATABASE IF NOT EXISTS {database}')
+        client.command(generate_clickhouse_ddl(table, columns_info, order_by, partition_by))
+        for chunk in _chain(first, chunks):
+            is_frame = isinstance(chunk, pd.DataFrame)
+            for start in range(0, len(chunk), INSERT_BLOCK_ROWS):
+                if is_frame:
+                    block = chunk.iloc[start:start + INSERT_BLOCK_ROWS]
+                    client.insert_df(table, block, settings=settings)
+                else:
+                    block = chunk.slice(start, INSERT_BLOCK_ROWS)
+                    client.insert_arrow(table, block, settings=settings)
+                rows += len(block)
+                blocks += 1
+    seconds = time.perf_counter() - started
+    return {
+        'sink': 'clickhouse',
+        'table': table,
+        'rows': rows,
+        'blocks': blocks,
+        'insert_seconds': round(seconds, 4),
+        'rows_per_s': round(rows / seconds) if seconds > 0 else None,
+    }
 
 
-def write_dataframe(df, table: str) -> None:
-    client = get_client()
-    client.command(f'CREATE TABLE IF NOT EXISTS {table} AS SELECT * FROM system.one WHERE 1=0')
-    client.insert_df(table, df)
+def write_dataframe(df, table: str, **options: Any) -> Dict[str, Any]:
+    return write_chunks([df], table, **options)
 
 
+def write_arrow(table_data, table: str, **options: Any) -> Dict[str, Any]:
+    return write_chunks([table_data], table, **options)
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from .planner import PlanNode, UnsupportedPlan, resolve
+
+
+# Steps run on a bounded thread pool as soon as the steps they depend on have
+# finished. pandas/pyarrow release the GIL in file I/O, parsing and most
+# kernels, so independent branches (e.g. the two reads of the default plan)
+# overlap; the event loop only awaits.
+
+MAX_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))
+
+StepFn = Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]
+
+
+def build_dependencies(nodes: List[PlanNode]) -> List[Set[int]]:
+    # Data dependencies on dataset names: read-after-write, plus write-after-read
+    # and write-after-write because in-place ops reuse the name
+    last_writer: Dict[str, int] = {}
+    readers: Dict[str, List[int]] = {}
+    deps: List[Set[int]] = []
+    for j, node in enumerate(nodes):
+        mine: Set[int] = set()
+        for name in node.inputs:
+            if name in last_writer:
+                mine.add(last_writer[name])
+        if node.output is not None:
+            if node.output in last_writer:
+                mine.add(last_writer[node.output])
+            mine.update(i for i in readers.get(node.output, []) if i != j)
+        for name in node.inputs:
+            readers.setdefault(name, []).append(j)
+        if node.output is not None:
+            last_writer[node.output] = j
+            readers[node.output] = []
+        deps.append(mine)
+    return deps
+
+
+def _plan(steps: List[Dict[str, Any]], cache: Any = None) -> Tuple[List[Dict[str, Any]], List[Set[int]], Optional[str]]:
+    try:
+        nodes, final = resolve(steps)
+    except UnsupportedPlan:
+        # Unknown shape: keep the original order and let the engine report the error
+        return steps, [{i - 1} if i else set() for i in range(len(steps))], None
+    if cache is not None:
+        # Cached steps load their output; steps only they depended on are dropped
+        nodes = cache.plan(nodes, final)
+    # Resolved steps carry explicit inputs, so execution order no longer matters to the engine
+    return [n.step for n in nodes], build_dependencies(nodes), final
+
+
+async def run_dag(
+    steps: List[Dict[str, Any]],
+    execute: StepFn,
+    max_workers: int = MAX_WORKERS,
+    cache: Any = None,
+) -> Tuple[Dict[str, Any], Optional[str], List[Dict[str, Any]]]:
+    """Executes steps concurrently along their dependencies; returns (context, final name, per-step timings).
+
+    cache is a step_cache.CacheSession for the engine, or None to execute every step.
+    """
+    steps, deps, final = _plan(steps, cache)
+    loop = asyncio.get_running_loop()
+    context: Dict[str, Any] = {}
+    metrics: List[Dict[str, Any]] = [{} for _ in steps]
+    origin = time.perf_counter()
+
+    def run(i: int) -> None:
+        started = time.perf_counter()
+        extra = (cache.run(steps[i], context, execute) if cache is not None else execute(steps[i], context)) or {}
+        finished = time.perf_counter()
+        metrics[i] = {
+            "op": steps[i].get("op"),
+            "depends_on": sorted(deps[i]),
+            "thread": threading.current_thread().name,
+            "start": round(started - origin, 4),
+            "end": round(finished - origin, 4),
+            "seconds": round(finished - started, 4),
+            **extra,
+        }
+
+    waiting = {i: set(d) for i, d in enumerate(deps)}
+    running: Dict[asyncio.Future, int] = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline") as pool:
+        try:
+            while waiting or running:
+                for i in [i for i, d in waiting.items() if not d]:
+                    del waiting[i]
+                    running[loop.run_in_executor(pool, run, i)] = i
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for fut in done:
+                    i = running.pop(fut)
+                    fut.result()
+                    for d in waiting.values():
+                        d.discard(i)
+        except BaseException:
+            # Let steps already on the pool finish before the context goes away
+            if running:
+                await asyncio.wait(running)
+            raise
+    return context, final, metrics
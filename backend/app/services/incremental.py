@@ -0,0 +1,431 @@
+from __future__ import annotations
+
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from ..db.session import fetch_watermarks, save_watermarks
+from .parquet_io import dataset as parquet_dataset, read_table as read_parquet, scan_literal
+from .planner import DEFAULT_PATHS, READ_OPS, UnsupportedPlan, resolve
+
+
+# Incremental runs (PipelineRequest.incremental): every source gets a watermark, stored
+# in the metadata DB next to `runs` (or in a local JSON file without one), and a run
+# only feeds the rows added since the last successful run of the same step list.
+#
+#   fact sources (not the right side of any join)
+#     "watermark_column" set   new rows are last < column <= current max (filter steps); for
+#                              CSV / JSON lines that only grew, just the appended bytes are read
+#     CSV / JSON lines         bytes appended after the last offset, if the prefix is intact
+#   dimension sources (right side of a join) and other facts
+#     fingerprint              any change means a full recompute
+#
+# `aggregate` keeps its mergeable partial state (per-key sum and count for avg) in a
+# Parquet file; a delta run merges the delta's partials into it, so the output is still
+# the aggregate over all rows. Writers of non-aggregated outputs append the delta.
+# Watermarks and the state pointer are committed together after the run succeeds.
+
+STATE_DIR = os.getenv("PIPELINE_STATE_DIR", "./data/state")
+FINGERPRINT_BYTES = 64 * 1024
+
+
+def pipeline_key(name: Optional[str], steps: List[Dict[str, Any]]) -> str:
+    # Watermarks only make sense for the exact step list that consumed them
+    digest = hashlib.sha1(json.dumps(steps, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+    return f"{name or 'pipeline'}:{digest}"
+
+
+def _digest(*parts: bytes) -> str:
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(part)
+    return h.hexdigest()
+
+
+def _read_range(path: str, start: int, end: int) -> bytes:
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        return fh.read(max(end - start, 0))
+
+
+def fingerprint(op: str, path: str) -> Dict[str, Any]:
+    """Cheap change detector: size, mtime and the first/last 64 KiB (file list for Parquet datasets)."""
+    if op == "read_parquet":
+        files = sorted(parquet_dataset(path).files)
+        listing = [(f, os.path.getsize(f), os.stat(f).st_mtime_ns) for f in files]
+        return {"kind": "fingerprint", "digest": _digest(json.dumps(listing).encode("utf-8"))}
+    st = os.stat(path)
+    head = _read_range(path, 0, FINGERPRINT_BYTES)
+    tail = _read_range(path, max(st.st_size - FINGERPRINT_BYTES, 0), st.st_size)
+    return {"kind": "fingerprint", "size": st.st_size, "mtime_ns": st.st_mtime_ns, "digest": _digest(head, tail)}
+
+
+def _committed_end(path: str) -> int:
+    # A writer may be mid-line; only complete lines are consumed
+    size = os.path.getsize(path)
+    start = max(size - FINGERPRINT_BYTES, 0)
+    while True:
+        block = _read_range(path, start, size)
+        cut = block.rfind(b"\n")
+        if cut >= 0:
+            return start + cut + 1
+        if start == 0:
+            return 0
+        size, start = start, max(start - FINGERPRINT_BYTES, 0)
+
+
+def _offset_mark(path: str, offset: int) -> Dict[str, Any]:
+    return {
+        "kind": "offset",
+        "offset": offset,
+        "prefix": _digest(_read_range(path, 0, min(offset, FINGERPRINT_BYTES))),
+        "edge": _digest(_read_range(path, max(offset - FINGERPRINT_BYTES, 0), offset)),
+    }
+
+
+def _appended_since(path: str, mark: Dict[str, Any]) -> bool:
+    # The consumed prefix is still there unchanged: its first and last 64 KiB match
+    offset = int(mark["offset"])
+    return os.path.getsize(path) >= offset and _offset_mark(path, offset) == mark
+
+
+def _is_json_lines(path: str) -> bool:
+    with open(path, "rb") as fh:
+        return fh.read(1024).lstrip()[:1] != b"["
+
+
+def _write_delta(run: "IncrementalRun", i: int, step: Dict[str, Any], path: str, start: int, end: int) -> str:
+    # The bytes [start, end) of a CSV or JSON lines file as a file of their own
+    run.temp_dir = run.temp_dir or tempfile.mkdtemp(prefix="delta_")
+    delta_path = os.path.join(run.temp_dir, f"source_{i}{os.path.splitext(path)[1]}")
+    with open(delta_path, "wb") as fh:
+        if step["op"] == "read_csv":
+            # The header line, then only the appended rows
+            with open(path, "rb") as src:
+                fh.write(src.readline())
+        fh.write(_read_range(path, start, end))
+    run.deltas[f"source:{i}"] = {"bytes": end - start}
+    return delta_path
+
+
+def _column_type(step: Dict[str, Any], path: str, column: str) -> Optional[pa.DataType]:
+    # Known without a scan for Parquet only; CSV/JSON types are whatever the reader infers
+    if step["op"] != "read_parquet":
+        return None
+    return parquet_dataset(path).schema.field(column).type
+
+
+def _mark_value(mark: Dict[str, Any], type_: Optional[pa.DataType]) -> Any:
+    """The stored watermark as a value comparable with the column; JSON keeps temporal values as ISO strings."""
+    value = mark.get("value")
+    if value is None:
+        return None
+    if type_ is not None:
+        value = scan_literal(value, type_)
+        return value.as_py() if isinstance(value, pa.Scalar) else value
+    if str(mark.get("type", "")).startswith(("datetime64", "timestamp", "date")):
+        return pd.Timestamp(value)
+    return value
+
+
+def _json_value(value: Any) -> Any:
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def _column_max(step: Dict[str, Any], path: str, column: str, last: Any) -> Tuple[Any, str]:
+    """(max of column above last or None, the column's type name)."""
+    filters = [{"column": column, "operator": ">", "value": last}] if last is not None else []
+    op = step["op"]
+    if op == "read_parquet":
+        # Only partitions and row groups that can hold newer values are scanned
+        values = read_parquet(path, [column], filters)[column]
+        value, type_ = pc.max(values).as_py(), str(values.type)
+    else:
+        if op == "read_csv":
+            values = pd.read_csv(path, usecols=[column])[column]
+        else:
+            values = pd.read_json(path, lines=_is_json_lines(path))[column]
+        type_ = str(values.dtype)
+        if last is not None:
+            values = values[values > last]
+        value = values.max() if len(values) else None
+    if value is None or value is pd.NaT or (isinstance(value, float) and value != value):
+        return None, type_
+    return (value.item() if hasattr(value, "item") else value), type_
+
+
+def _state_dir(key: str) -> str:
+    # Names may be long free text (scheduled intents); directory names stay short
+    return os.path.join(STATE_DIR, hashlib.sha1(key.encode("utf-8")).hexdigest()[:16])
+
+
+def _load_local(key: str) -> Dict[str, str]:
+    try:
+        with open(os.path.join(_state_dir(key), "watermarks.json"), "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_local(key: str, values: Dict[str, str]) -> None:
+    path = os.path.join(_state_dir(key), "watermarks.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(values, fh)
+    os.replace(tmp, path)
+
+
+def merge_state(total: pd.DataFrame, by: str | List[str], state: Optional[Dict[str, Any]]) -> pd.DataFrame:
+    """Adds the stored partial state to this run's per-key sum/count and saves the result as the new state."""
+    if state is None:
+        return total
+    if state.get("load"):
+        previous = pd.read_parquet(state["load"]).set_index(by)[["sum", "count"]]
+        # A list of group keys is a MultiIndex; every level is part of the key
+        total = pd.concat([previous, total]).groupby(level=list(range(previous.index.nlevels))).sum()
+    os.makedirs(os.path.dirname(state["save"]), exist_ok=True)
+    total.rename_axis(by).reset_index().to_parquet(state["save"], index=False)
+    return total
+
+
+def average(total: pd.DataFrame, by: str | List[str], alias: str) -> pd.DataFrame:
+    """Final avg from per-key sum/count, sorted by key like groupby().mean()."""
+    total = total.sort_index()
+    mean = total["sum"] / total["count"].where(total["count"] > 0)
+    return mean.rename_axis(by).reset_index(name=alias)
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+@dataclass
+class IncrementalRun:
+    key: str
+    steps: List[Dict[str, Any]]
+    mode: str  # "full", "delta", "unchanged" or "disabled"
+    reason: Optional[str] = None
+    marks: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # (op, path, fingerprint/size) of files read in place, re-checked before committing
+    checks: List[Tuple[str, str, Dict[str, Any]]] = field(default_factory=list)
+    temp_dir: Optional[str] = None
+    new_state: List[str] = field(default_factory=list)
+    old_state: List[str] = field(default_factory=list)
+    deltas: Dict[str, Any] = field(default_factory=dict)
+
+    def summary(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"pipeline": self.key, "mode": self.mode}
+        if self.reason:
+            out["reason"] = self.reason
+        if self.deltas:
+            out["sources"] = self.deltas
+        return out
+
+    async def commit(self, run_id: Optional[int]) -> None:
+        if self.mode in ("disabled", "unchanged"):
+            return
+        marks = self.marks
+        for op, path, expected in self.checks:
+            current = {"size": os.path.getsize(path)} if "offset" in expected else fingerprint(op, path)
+            if current != {k: v for k, v in expected.items() if k != "offset"}:
+                # A source changed while it was being read: what was consumed is unknown
+                marks, self.reason = {}, f"{path} changed during the run; the next run is a full one"
+                break
+        values = {source: json.dumps(mark, default=str) for source, mark in marks.items()}
+        if not await save_watermarks(self.key, values, run_id):
+            _save_local(self.key, values)
+        for path in self.old_state:
+            _remove_quietly(path)
+        if marks:
+            # Committed: discard() must keep the new state
+            self.new_state = []
+
+    def discard(self) -> None:
+        # Runs that did not commit leave no state behind
+        for path in self.new_state:
+            _remove_quietly(path)
+        if self.temp_dir:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+
+def _lineage(nodes: List[Any]) -> Tuple[Set[int], Set[int]]:
+    """(indexes of dimension reads, indexes of writers whose input is an aggregate's full output)."""
+    sources: Dict[str, Set[int]] = {}
+    aggregated: Set[str] = set()
+    dims: Set[int] = set()
+    full_writers: Set[int] = set()
+    for i, node in enumerate(nodes):
+        if node.op in READ_OPS:
+            sources[node.output] = {i}
+            aggregated.discard(node.output)
+        elif node.op == "join":
+            left, right = node.inputs
+            dims |= sources.get(right, set())
+            sources[node.output] = sources.get(left, set()) | sources.get(right, set())
+            aggregated.discard(node.output)
+        elif node.op == "aggregate":
+            sources[node.output] = sources.get(node.inputs[0], set())
+            aggregated.add(node.output)
+        elif node.output is None and node.inputs and node.inputs[0] in aggregated:
+            full_writers.add(i)
+    return dims, full_writers
+
+
+def _plan(key: str, steps: List[Dict[str, Any]], stored: Dict[str, str], force_full: Optional[str] = None) -> IncrementalRun:
+    try:
+        nodes, _ = resolve(copy.deepcopy(steps))
+    except UnsupportedPlan as e:
+        return IncrementalRun(key, steps, "disabled", reason=str(e))
+    previous = {source: json.loads(value) for source, value in stored.items()}
+    dims, full_writers = _lineage(nodes)
+    out = [node.step for node in nodes]
+    run = IncrementalRun(key, out, "delta" if previous else "full", None if previous else "no watermarks yet")
+    if force_full:
+        run.mode, run.reason = "full", force_full
+    # Superseded by this run's state once it commits
+    run.old_state = [mark["path"] for source, mark in previous.items() if source.startswith("state:")]
+
+    def go_full(reason: str) -> None:
+        if run.mode == "delta":
+            run.mode, run.reason = "full", reason
+
+    # First pass: watermark kind per read and whether the delta can be taken
+    kinds: Dict[int, str] = {}
+    for i, step in enumerate(out):
+        if step.get("op") not in READ_OPS:
+            continue
+        path = step.get("path", DEFAULT_PATHS[step["op"]])
+        prev = previous.get(f"source:{i}")
+        if i in dims:
+            kinds[i] = "fingerprint"
+        elif step.get("watermark_column"):
+            kinds[i] = "column"
+        elif step["op"] == "read_csv" or (step["op"] == "read_json" and _is_json_lines(path)):
+            kinds[i] = "offset"
+        else:
+            kinds[i] = "fingerprint"
+        if prev is None or prev.get("kind") != kinds[i]:
+            go_full(f"no watermark for source {i}")
+        elif kinds[i] == "fingerprint" and prev != fingerprint(step["op"], path):
+            go_full(f"{path} changed")
+        elif kinds[i] == "offset" and not _appended_since(path, prev):
+            go_full(f"{path} was rewritten, not appended to")
+        elif kinds[i] == "column" and step["op"] == "read_parquet" and prev.get("type") != str(
+            _column_type(step, path, step["watermark_column"])
+        ):
+            go_full(f"type of {step['watermark_column']} in {path} changed")
+
+    for i, step in enumerate(out):
+        if step.get("op") == "aggregate":
+            state = previous.get(f"state:{i}")
+            if state is None or not os.path.exists(state.get("path", "")):
+                go_full(f"no partial state for step {i}")
+
+    # Second pass: rewrite reads to their delta and record the new watermarks
+    extra_filters: List[Tuple[int, Dict[str, Any]]] = []
+    empty: List[int] = []
+    for i, kind in kinds.items():
+        step = out[i]
+        path = step.get("path", DEFAULT_PATHS[step["op"]])
+        prev = previous.get(f"source:{i}") if run.mode == "delta" else None
+        if kind == "fingerprint":
+            mark = fingerprint(step["op"], path)
+            run.checks.append((step["op"], path, mark))
+            if run.mode == "delta" and i not in dims:
+                empty.append(i)
+        elif kind == "offset":
+            end = _committed_end(path)
+            mark = _offset_mark(path, end)
+            if prev is None:
+                run.checks.append((step["op"], path, {"size": os.path.getsize(path), "offset": end}))
+            else:
+                start = int(prev["offset"])
+                if start == end:
+                    empty.append(i)
+                step["path"] = _write_delta(run, i, step, path, start, end)
+        else:
+            column = step["watermark_column"]
+            last = _mark_value(prev, _column_type(step, path, column)) if prev else None
+            scan_path = path
+            appendable = step["op"] == "read_csv" or (step["op"] == "read_json" and _is_json_lines(path))
+            if appendable:
+                end = _committed_end(path)
+                if prev is not None and prev.get("bytes") and _appended_since(path, prev["bytes"]):
+                    # The file only grew: the new rows are in the appended bytes, so neither
+                    # the max nor the run reads what earlier runs consumed
+                    start = int(prev["bytes"]["offset"])
+                    if start < end or step["op"] == "read_csv":
+                        step["path"] = scan_path = _write_delta(run, i, step, path, start, end)
+                    else:
+                        # An empty JSON lines file cannot be parsed; the "in []" filter empties the read
+                        scan_path = None
+            current, type_ = _column_max(step, scan_path, column, last) if scan_path else (None, prev["type"])
+            if current is None:
+                # Nothing new: rows appended while the run reads must not slip in unrecorded
+                extra_filters.append((i, {"column": column, "operator": "in", "value": []}))
+                empty.append(i)
+            else:
+                if last is not None:
+                    extra_filters.append((i, {"column": column, "operator": ">", "value": last}))
+                extra_filters.append((i, {"column": column, "operator": "<=", "value": current}))
+            # Stored with the column's type so the next run can cast the ISO string back
+            value = _json_value(current) if current is not None else (prev or {}).get("value")
+            mark = {"kind": "column", "column": column, "value": value, "type": type_}
+            if appendable:
+                mark["bytes"] = _offset_mark(path, end)
+        run.marks[f"source:{i}"] = mark
+
+    facts = [i for i in kinds if i not in dims]
+    if run.mode == "delta" and facts and all(i in empty for i in facts):
+        run.mode, run.reason = "unchanged", "no new rows in any source"
+        return run
+    if run.mode == "delta" and any(
+        kinds[i] == "fingerprint" or (kinds[i] == "offset" and out[i]["op"] == "read_json") for i in empty if i in facts
+    ):
+        # An empty delta of these formats cannot be read as an input with the right columns
+        run.discard()
+        return _plan(key, steps, stored, "a source without new rows cannot be read as an empty delta")
+
+    for i, step in enumerate(out):
+        if step.get("op") == "aggregate":
+            save = os.path.join(_state_dir(key), f"agg-{i}-{uuid.uuid4().hex}.parquet")
+            load = previous[f"state:{i}"]["path"] if run.mode == "delta" else None
+            step["state"] = {"load": load, "save": save}
+            run.new_state.append(save)
+            run.marks[f"state:{i}"] = {"kind": "state", "path": save}
+        elif run.mode == "delta" and step.get("op") in ("write_postgres", "write_parquet") and i not in full_writers:
+            # Only the new rows reach this writer; keep what earlier runs wrote
+            if step["op"] == "write_postgres" and not step.get("key"):
+                step["mode"] = "append"
+            elif step["op"] == "write_parquet" and step.get("mode") in (None, "overwrite"):
+                step["mode"] = "append"
+
+    # Range filters go right after their read (the planner folds them into Parquet scans)
+    for i, predicate in sorted(extra_filters, key=lambda x: x[0], reverse=True):
+        out.insert(i + 1, {"op": "filter", "input": out[i]["name"], **predicate})
+    run.steps = out
+    return run
+
+
+async def prepare(name: Optional[str], steps: List[Dict[str, Any]]) -> IncrementalRun:
+    key = pipeline_key(name, steps)
+    stored = await fetch_watermarks(key)
+    if stored is None:
+        stored = _load_local(key)
+    # Fingerprints, column maxima and delta files are file I/O
+    return await asyncio.get_running_loop().run_in_executor(None, _plan, key, steps, stored)
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .vector import _embed_batch
+
+
+# Local fast path for LLMClient.parse_intent: a keyword/regex grammar fills the slots and
+# the hashing embedder compares the text with labelled examples. Confident answers are
+# returned immediately; ambiguous texts are escalated to the LLM.
+
+FAST_THRESHOLD = float(os.getenv("INTENT_FAST_THRESHOLD", "0.75"))
+# Confidence is (best similarity / FULL_SIMILARITY) * (margin over the runner-up label /
+# FULL_MARGIN), each capped at 1: a text must be close to some example and clearly
+# closer to it than to the other labels. Small talk scores ~0.3 similarity even when it
+# contains a keyword ("анекдот про etl"), labelled requests 0.5 and up.
+FULL_SIMILARITY = 0.6
+FULL_MARGIN = 0.25
+
+EXAMPLES: Dict[str, List[str]] = {
+    "etl": [
+        "etl по user_id",
+        "объедини csv и json по user_id и загрузи в postgres",
+        "построй пайплайн из csv в clickhouse",
+        "загрузи данные из json в postgres ежедневно",
+        "посчитай средний чек по пользователям и сохрани в clickhouse",
+        "перенеси xml в hdfs каждый час",
+        "join orders and users by user_id and load into clickhouse",
+        "build a daily pipeline from csv to postgres",
+        "load csv into clickhouse",
+    ],
+    "analysis": [
+        "проанализируй данные",
+        "анализ файла csv",
+        "покажи профиль датасета",
+        "изучи структуру json",
+        "найди пропуски и дубликаты в данных",
+        "какие типы колонок в файле",
+        "analyze this dataset",
+        "profile the csv file",
+    ],
+    "connection": [
+        "подключись к базе postgres",
+        "подключение к clickhouse",
+        "настрой соединение с базой данных",
+        "проверь доступ к источнику данных",
+        "connect to postgres database",
+        "add a clickhouse connection",
+    ],
+}
+
+KEYWORDS = {
+    "etl": re.compile(r"\betl\b|пайплайн|конвейер|объедин|соедини\b|загрузи|перенеси|pipeline|\bjoin\b|\bload\b"),
+    "analysis": re.compile(r"анализ|проанализируй|изучи|профил|analy[sz]|profil"),
+    "connection": re.compile(r"подключ|соединение с|\bconnect|доступ к"),
+}
+
+SOURCES = [
+    ("csv", re.compile(r"\bcsv\b")),
+    ("json", re.compile(r"\bjson\b")),
+    ("xml", re.compile(r"\bxml\b")),
+    ("parquet", re.compile(r"parquet")),
+]
+TARGETS = [
+    ("postgres", re.compile(r"postgres|постгрес|\bpg\b")),
+    ("clickhouse", re.compile(r"clickhouse|\bclick\b|кликхаус")),
+    ("hdfs", re.compile(r"hdfs|hadoop")),
+]
+OPERATIONS = [
+    ("join", re.compile(r"\bjoin\b|объедин|соедини\b")),
+    ("aggregate", re.compile(r"\bavg\b|средн|\bsum\b|сумм|\bcount\b|количеств|агрег|group")),
+    ("filter", re.compile(r"filter|фильтр|\bwhere\b|\bгде\b|только")),
+]
+SCHEDULES = [
+    ("@hourly", re.compile(r"hourly|ежечас|каждый час")),
+    ("@daily", re.compile(r"daily|ежедневн|каждый день|раз в день")),
+    ("manual", re.compile(r"вручную|manual|один раз|\bonce\b")),
+]
+# "по user_id": the key of a join when several sources are named, else of a group-by
+KEY_MENTION = re.compile(r"\bпо\s+\w+_id\b|\bby\s+\w+_id\b")
+
+
+def parse_slots(text: str) -> Dict[str, Any]:
+    """Sources, target, operations and schedule mentioned in the text (with the LLM fallback defaults)."""
+    lowered = text.lower()
+    sources = [name for name, rx in SOURCES if rx.search(lowered)]
+    # "из postgres в clickhouse": the target is the last store mentioned
+    positions = [(m.start(), name) for name, rx in TARGETS for m in rx.finditer(lowered)]
+    target = max(positions)[1] if positions else "postgres"
+    # Explicit operation words replace the defaults; a key mention alone does not
+    operations = [name for name, rx in OPERATIONS if rx.search(lowered)]
+    if operations and "join" not in operations and len(sources) > 1 and KEY_MENTION.search(lowered):
+        operations.insert(0, "join")
+    schedule = next((name for name, rx in SCHEDULES if rx.search(lowered)), "@daily")
+    return {
+        "sources": sources or ["csv", "json"],
+        "target": target,
+        "operations": operations or ["join", "aggregate"],
+        "schedule": schedule,
+    }
+
+
+class IntentClassifier:
+    """Nearest labelled example by hashing embedding; keywords of another label lower the confidence."""
+
+    def __init__(self, examples: Dict[str, List[str]] = EXAMPLES) -> None:
+        self.labels = list(examples)
+        texts = [text for label in self.labels for text in examples[label]]
+        self.example_labels = np.array([i for i, label in enumerate(self.labels) for _ in examples[label]])
+        self.matrix = _embed_batch(texts)
+        self.counters = {"requests": 0, "fast_path": 0, "escalated": 0}
+
+    def classify(self, text: str) -> Tuple[str, float]:
+        lowered = text.lower()
+        sims = self.matrix @ _embed_batch([lowered])[0]
+        best = np.array([sims[self.example_labels == i].max() for i in range(len(self.labels))])
+        runner_up, top = np.argsort(best)[-2:]
+        label = self.labels[int(top)]
+        confidence = min(1.0, best[top] / FULL_SIMILARITY) * min(1.0, (best[top] - best[runner_up]) / FULL_MARGIN)
+        # A keyword only counts against the label: on its own it says nothing about the request
+        matched = {name for name, rx in KEYWORDS.items() if rx.search(lowered)}
+        if matched and label not in matched:
+            confidence /= 2
+        return label, max(0.0, float(confidence))
+
+    def fast_parse(self, text: str) -> Optional[Dict[str, Any]]:
+        """parse_intent result when the classifier is confident enough, else None (ask the LLM)."""
+        self.counters["requests"] += 1
+        label, confidence = self.classify(text)
+        if confidence < FAST_THRESHOLD:
+            self.counters["escalated"] += 1
+            return None
+        self.counters["fast_path"] += 1
+        return {"intent": label, **parse_slots(text), "classifier": "rules"}
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.counters["requests"]
+        return {
+            **self.counters,
+            "llm_calls_avoided": self.counters["fast_path"],
+            "fast_path_rate": round(self.counters["fast_path"] / requests, 4) if requests else 0.0,
+            "threshold": FAST_THRESHOLD,
+        }
+
+
+intent_classifier = IntentClassifier()
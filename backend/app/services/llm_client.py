@@ -1,215 +1,549 @@
+import asyncio
+import json
 import os
-import requests
-from typing import Any, Dict, List, Optional
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
 
-try:
-    import openai
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
+import httpx
+import numpy as np
 
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
+from .cache import ResultCache
+from .intent_classifier import intent_classifier
+from .vector import DIM as EMBED_DIM, _embed_batch
 
-# Local models completely disabled - using external APIs only
-TRANSFORMERS_AVAILABLE = False
 
+SYSTEM_PROMPT = "Ты - ассистент по data engineering. Помогаешь создавать ETL пайплайны и анализировать данные."
+
+# Connections are pooled per provider and reused across requests; every provider
+# gets its own read timeout (LLM_TIMEOUT_<NAME> overrides the default below)
+CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "10"))
+# Hedged mode sends the prompt to the two fastest providers at once and keeps the first good answer
+HEDGE = os.getenv("LLM_HEDGE", "0").lower() in ("1", "true", "yes")
+# Circuit breaker: a provider is skipped for BREAKER_COOLDOWN seconds after BREAKER_FAILURES
+# consecutive errors, or when its p50 latency exceeds LATENCY_SLO; then one probe call decides
+HEALTH_WINDOW = int(os.getenv("LLM_HEALTH_WINDOW", "100"))
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+LATENCY_SLO = float(os.getenv("LLM_LATENCY_SLO", "15"))
+SLO_MIN_SAMPLES = int(os.getenv("LLM_SLO_MIN_SAMPLES", "5"))
 
-class LLMClient:
-    def __init__(self):
-        self.openai_client = None
-        self.gemini_model = None
-        
-        # Initialize OpenAI if available
-        if OPENAI_AVAILABLE:
-            api_key = os.getenv("OPENAI_API_KEY")
-            if api_key:
-                self.openai_client = openai.OpenAI(api_key=api_key)
-        
-        # Initialize Gemini if available
-        if GEMINI_AVAILABLE:
-            api_key = os.getenv("GEMINI_API_KEY")
-            print(f"Gemini API key found: {bool(api_key)}")
-            if api_key:
-                try:
-                    genai.configure(api_key=api_key)
-                    self.gemini_model = genai.GenerativeModel('gemini-pro')
-                    print("Gemini model initialized successfully")
-                except Exception as e:
-                    print(f"Gemini initialization error: {e}")
-            else:
-                print("GEMINI_API_KEY not found in environment")
-        else:
-            print("GEMINI_AVAILABLE is False")
-        
-                # Using external APIs only - no local models
-                # This ensures fast startup and reliable performance
-    
-    async def generate_response(self, prompt: str, max_tokens: int = 500) -> str:
-        """Generate response using available LLM"""
-        
-        # Try Groq first (fastest and free)
-        groq_api_key = os.getenv("GROQ_API_KEY")
-        if groq_api_key:
-            try:
-                response = requests.post(
-                    "https://api.groq.com/openai/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {groq_api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "llama3-8b-8192",
-                        "messages": [
-                            {"role": "system", "content": "Ты - ассистент по data engineering. Помогаешь создавать ETL пайплайны и анализировать данные."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        "max_tokens": max_tokens,
-                        "temperature": 0.7
-                    },
-                    timeout=30
-                )
-                if response.status_code == 200:
-                    result = response.json()
-                    return result["choices"][0]["message"]["content"]
-            except Exception as e:
-                print(f"Groq error: {e}")
-        
-        # Try Gemini (fast and free)
-        print(f"Gemini model available: {self.gemini_model is not None}")
-        if self.gemini_model:
-            try:
-                full_prompt = f"""Ты - ассистент по data engineering. Помогаешь создавать ETL пайплайны и анализировать данные.
+
+def _chat_payload(model: str, prompt: str, max_tokens: int) -> Dict[str, Any]:
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        "max_tokens": max_tokens,
+        "temperature": 0.7,
+    }
+
+
+def _chat_stream_payload(model: str, prompt: str, max_tokens: int) -> Dict[str, Any]:
+    return {**_chat_payload(model, prompt, max_tokens), "stream": True}
+
+
+def _chat_text(result: Dict[str, Any]) -> str:
+    return result["choices"][0]["message"]["content"]
+
+
+def _chat_delta(event: Dict[str, Any]) -> str:
+    choices = event.get("choices") or [{}]
+    return choices[0].get("delta", {}).get("content") or ""
+
+
+def _gemini_payload(model: str, prompt: str, max_tokens: int) -> Dict[str, Any]:
+    full_prompt = f"""{SYSTEM_PROMPT}
 
 Пользователь: {prompt}
 
 Ответь кратко и по делу:"""
-                print("Calling Gemini API...")
-                response = self.gemini_model.generate_content(full_prompt)
-                print(f"Gemini response received: {response.text[:100]}...")
-                return response.text
-            except Exception as e:
-                print(f"Gemini error: {e}")
+    return {
+        "contents": [{"parts": [{"text": full_prompt}]}],
+        "generationConfig": {"maxOutputTokens": max_tokens, "temperature": 0.7},
+    }
+
+
+def _gemini_text(result: Dict[str, Any]) -> str:
+    return result["candidates"][0]["content"]["parts"][0]["text"]
+
+
+def _gemini_delta(event: Dict[str, Any]) -> str:
+    # Usage-only and finish-only stream events carry no candidates or no parts
+    candidates = event.get("candidates") or [{}]
+    parts = (candidates[0].get("content") or {}).get("parts") or [{}]
+    return parts[0].get("text") or ""
+
+
+def _yandex_payload(model: str, prompt: str, max_tokens: int) -> Dict[str, Any]:
+    return {
+        "modelUri": f"gpt://{os.getenv('YANDEX_FOLDER_ID', 'b1g...')}/{model}",
+        "completionOptions": {"stream": False, "temperature": 0.7, "maxTokens": max_tokens},
+        "messages": [
+            {"role": "system", "text": SYSTEM_PROMPT},
+            {"role": "user", "text": prompt},
+        ],
+    }
+
+
+def _yandex_stream_payload(model: str, prompt: str, max_tokens: int) -> Dict[str, Any]:
+    body = _yandex_payload(model, prompt, max_tokens)
+    body["completionOptions"]["stream"] = True
+    return body
+
+
+def _yandex_text(result: Dict[str, Any]) -> str:
+    return result["result"]["alternatives"][0]["message"]["text"]
+
+
+@dataclass
+class Provider:
+    name: str
+    model: str
+    url: str  # {model} is replaced by the model name
+    key_env: str
+    auth: str  # header template, {key} is replaced by the API key
+    timeout: float
+    payload: Callable[[str, str, int], Dict[str, Any]]  # (model, prompt, max_tokens)
+    parse: Callable[[Dict[str, Any]], str]
+    # Streaming: request body, URL (defaults to url) and the text carried by one event;
+    # cumulative providers resend the whole text so far in every event
+    stream_payload: Optional[Callable[[str, str, int], Dict[str, Any]]] = None
+    stream_url: Optional[str] = None
+    delta: Optional[Callable[[Dict[str, Any]], str]] = None
+    cumulative: bool = False
+
+    @property
+    def api_key(self) -> Optional[str]:
+        return os.getenv(self.key_env)
+
+    def headers(self) -> Dict[str, str]:
+        name, _, value = self.auth.partition(": ")
+        return {name: value.format(key=self.api_key), "Content-Type": "application/json"}
+
+
+def _timeout(name: str, default: float) -> float:
+    return float(os.getenv(f"LLM_TIMEOUT_{name.upper()}", os.getenv("LLM_TIMEOUT", str(default))))
+
+
+# Preference order when nothing is known about latency yet
+PROVIDERS = [
+    Provider(
+        "groq", "llama3-8b-8192", "https://api.groq.com/openai/v1/chat/completions", "GROQ_API_KEY",
+        "Authorization: Bearer {key}", _timeout("groq", 10), _chat_payload, _chat_text,
+        stream_payload=_chat_stream_payload, delta=_chat_delta,
+    ),
+    Provider(
+        "gemini", os.getenv("GEMINI_MODEL", "gemini-pro"),
+        "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent",
+        "GEMINI_API_KEY", "x-goog-api-key: {key}", _timeout("gemini", 20), _gemini_payload, _gemini_text,
+        stream_payload=_gemini_payload, delta=_gemini_delta,
+        stream_url="https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent?alt=sse",
+    ),
+    Provider(
+        "openai", "gpt-3.5-turbo", "https://api.openai.com/v1/chat/completions", "OPENAI_API_KEY",
+        "Authorization: Bearer {key}", _timeout("openai", 30), _chat_payload, _chat_text,
+        stream_payload=_chat_stream_payload, delta=_chat_delta,
+    ),
+    Provider(
+        "yandex", "yandexgpt", "https://llm.api.cloud.yandex.net/foundationModels/v1/completion", "YANDEX_API_KEY",
+        "Authorization: Api-Key {key}", _timeout("yandex", 30), _yandex_payload, _yandex_text,
+        stream_payload=_yandex_stream_payload, delta=_yandex_text, cumulative=True,
+    ),
+    Provider(
+        "together", "meta-llama/Llama-2-7b-chat-hf", "https://api.together.xyz/v1/chat/completions", "TOGETHER_API_KEY",
+        "Authorization: Bearer {key}", _timeout("together", 30), _chat_payload, _chat_text,
+        stream_payload=_chat_stream_payload, delta=_chat_delta,
+    ),
+]
+
+class _SemanticIndex:
+    """Embeddings of the normalized requests behind cached answers, for near-duplicate lookup.
+
+    Private to this process and kept in memory; a row is dropped when its cache entry leaves memory.
+    """
+
+    def __init__(self) -> None:
+        self.vectors = np.zeros((0, EMBED_DIM), dtype=np.float32)
+        self.keys: List[Optional[str]] = []
+        self.groups: List[Optional[str]] = []  # kind|provider signature; only compared within a group
+        self.rows: Dict[str, int] = {}
+        self.free: List[int] = []
+
+    def add(self, key: str, group: str, text: str) -> None:
+        self.discard(key)
+        vector = _embed_batch([text])[0]
+        if self.free:
+            row = self.free.pop()
         else:
-            print("Gemini model not initialized")
-        
-        # Try OpenAI
-        if self.openai_client:
-            try:
-                response = self.openai_client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=[
-                        {"role": "system", "content": "Ты - ассистент по data engineering. Помогаешь создавать ETL пайплайны и анализировать данные."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=max_tokens,
-                    temperature=0.7
-                )
-                return response.choices[0].message.content
-            except Exception as e:
-                print(f"OpenAI error: {e}")
-        
-        # Try alternative APIs
-        # 1. Try YandexGPT (if API key available)
-        yandex_api_key = os.getenv("YANDEX_API_KEY")
-        if yandex_api_key:
-            try:
-                response = requests.post(
-                    "https://llm.api.cloud.yandex.net/foundationModels/v1/completion",
-                    headers={
-                        "Authorization": f"Api-Key {yandex_api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "modelUri": f"gpt://{os.getenv('YANDEX_FOLDER_ID', 'b1g...')}/yandexgpt",
-                        "completionOptions": {
-                            "stream": False,
-                            "temperature": 0.7,
-                            "maxTokens": max_tokens
-                        },
-                        "messages": [
-                            {"role": "system", "content": "Ты - ассистент по data engineering. Помогаешь создавать ETL пайплайны и анализировать данные."},
-                            {"role": "user", "content": prompt}
-                        ]
-                    },
-                    timeout=30
-                )
-                if response.status_code == 200:
-                    result = response.json()
-                    return result["result"]["alternatives"][0]["message"]["text"]
-            except Exception as e:
-                print(f"YandexGPT error: {e}")
-        
-        # 2. Try Groq (fast and free)
-        groq_api_key = os.getenv("GROQ_API_KEY")
-        if groq_api_key:
-            try:
-                response = requests.post(
-                    "https://api.groq.com/openai/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {groq_api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "llama3-8b-8192",
-                        "messages": [
-                            {"role": "system", "content": "Ты - ассистент по data engineering. Помогаешь создавать ETL пайплайны и анализировать данные."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        "max_tokens": max_tokens,
-                        "temperature": 0.7
-                    },
-                    timeout=30
-                )
-                if response.status_code == 200:
-                    result = response.json()
-                    return result["choices"][0]["message"]["content"]
-            except Exception as e:
-                print(f"Groq error: {e}")
-        
-        # 3. Try Together AI (affordable)
-        together_api_key = os.getenv("TOGETHER_API_KEY")
-        if together_api_key:
+            row = len(self.keys)
+            self.keys.append(None)
+            self.groups.append(None)
+            if row >= self.vectors.shape[0]:
+                grown = np.zeros((max(16, 2 * row), EMBED_DIM), dtype=np.float32)
+                grown[:row] = self.vectors[:row]
+                self.vectors = grown
+        self.vectors[row] = vector
+        self.keys[row], self.groups[row] = key, group
+        self.rows[key] = row
+
+    def discard(self, key: str) -> None:
+        row = self.rows.pop(key, None)
+        if row is not None:
+            self.keys[row] = self.groups[row] = None
+            self.vectors[row] = 0.0
+            self.free.append(row)
+
+    def nearest(self, group: str, text: str) -> Optional[Tuple[str, float]]:
+        if not self.rows:
+            return None
+        scores = self.vectors[: len(self.keys)] @ _embed_batch([text])[0]
+        scores[np.asarray(self.groups, dtype=object) != group] = -np.inf
+        row = int(np.argmax(scores))
+        if scores[row] == -np.inf:
+            return None
+        return self.keys[row], float(scores[row])
+
+
+SEMANTIC_INDEX = _SemanticIndex()
+# Answers for parse_intent / generate_pipeline_steps, keyed on the normalized request and the
+# provider chain that would serve it; LLM_CACHE_DIR shares them across workers and restarts
+CACHE = ResultCache(
+    max_entries=int(os.getenv("LLM_CACHE_ENTRIES", "1024")),
+    max_bytes=int(os.getenv("LLM_CACHE_BYTES", str(16 << 20))),
+    ttl=float(os.getenv("LLM_CACHE_TTL", str(24 * 3600))) or None,
+    directory=os.getenv("LLM_CACHE_DIR") or None,
+    max_disk_bytes=int(os.getenv("LLM_CACHE_DISK_BYTES", str(128 << 20))),
+    on_evict=SEMANTIC_INDEX.discard,
+)
+# Near-duplicate lookup: on an exact miss, reuse the answer of the most similar cached
+# request (hashing embedder from services/vector) if it is at least this similar
+SEMANTIC_CACHE = os.getenv("LLM_CACHE_SEMANTIC", "0").lower() in ("1", "true", "yes")
+SEMANTIC_THRESHOLD = float(os.getenv("LLM_CACHE_SIMILARITY", "0.95"))
+CACHE_COUNTERS = {"requests": 0, "hits": 0, "semantic_hits": 0, "llm_calls": 0}
+
+
+def cache_stats() -> Dict[str, Any]:
+    hits = CACHE_COUNTERS["hits"] + CACHE_COUNTERS["semantic_hits"]
+    requests = CACHE_COUNTERS["requests"]
+    return {
+        **CACHE_COUNTERS,
+        "hit_rate": round(hits / requests, 4) if requests else 0.0,
+        "storage": CACHE.stats(),
+        "semantic_entries": len(SEMANTIC_INDEX.rows),
+    }
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class ProviderHealth:
+    """Rolling latency/error statistics and circuit breaker state of one provider."""
+
+    def __init__(self) -> None:
+        self.latencies: Deque[float] = deque(maxlen=HEALTH_WINDOW)
+        self.calls = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self.open_until = 0.0  # 0 while closed; once it has passed the breaker is half-open
+        self.probing = False
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(q * (len(ordered) - 1))]
+
+    def state(self, now: float) -> str:
+        if not self.open_until:
+            return "closed"
+        return "open" if now < self.open_until else "half_open"
+
+    def allows(self, now: float) -> bool:
+        state = self.state(now)
+        return state == "closed" or (state == "half_open" and not self.probing)
+
+    def acquire(self, now: float) -> bool:
+        # Only one request at a time probes a half-open provider
+        if not self.allows(now):
+            return False
+        if self.state(now) == "half_open":
+            self.probing = True
+        return True
+
+    def _open(self, reason: str) -> None:
+        self.open_until = time.monotonic() + BREAKER_COOLDOWN
+        self.last_error = reason
+        print(f"LLM circuit opened for {BREAKER_COOLDOWN:.0f}s: {reason}")
+
+    def record_success(self, seconds: float) -> None:
+        self.calls += 1
+        self.consecutive_failures = 0
+        self.latencies.append(seconds)
+        p50 = self.quantile(0.5)
+        if len(self.latencies) >= SLO_MIN_SAMPLES and p50 is not None and p50 > LATENCY_SLO:
+            # Start the next window from the probe call, not from the slow history
+            self.latencies.clear()
+            self._open(f"p50 latency {p50:.2f}s exceeds SLO {LATENCY_SLO:.2f}s")
+        else:
+            self.open_until = 0.0
+
+    def record_failure(self, error: str) -> None:
+        self.calls += 1
+        self.errors += 1
+        self.consecutive_failures += 1
+        self.last_error = error
+        # A failed probe reopens immediately
+        if self.open_until or self.consecutive_failures >= BREAKER_FAILURES:
+            self._open(error)
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        p50, p95 = self.quantile(0.5), self.quantile(0.95)
+        return {
+            "state": self.state(now),
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": round(self.errors / self.calls, 4) if self.calls else 0.0,
+            "consecutive_failures": self.consecutive_failures,
+            "p50_seconds": round(p50, 3) if p50 is not None else None,
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+            "samples": len(self.latencies),
+            "open_for_seconds": round(max(self.open_until - now, 0.0), 1) if self.open_until else 0.0,
+            "last_error": self.last_error,
+        }
+
+
+def _stream_event(line: str) -> Optional[Dict[str, Any]]:
+    # SSE "data:" lines (OpenAI-compatible, Gemini) or bare JSON lines (YandexGPT)
+    line = line.strip()
+    if line.startswith("data:"):
+        line = line[5:].strip()
+    if not line.startswith("{"):
+        return None
+    return json.loads(line)
+
+
+def _fallback_response(prompt: str) -> str:
+    # Ultimate fallback - provide helpful response instead of error
+    if "etl" in prompt.lower() or "пайплайн" in prompt.lower():
+        return "Для создания ETL пайплайна используйте вкладку 'Pipeline Preview'. Система автоматически сгенерирует план на основе вашего описания."
+    elif "анализ" in prompt.lower() or "проанализируй" in prompt.lower():
+        return "Для анализа данных загрузите файлы во вкладке 'Upload & Profile'. Система покажет структуру, типы данных и рекомендации по хранению."
+    elif "рекомендации" in prompt.lower() or "хранение" in prompt.lower():
+        return "Используйте вкладку 'Recommendations' для получения советов по выбору системы хранения (PostgreSQL/ClickHouse/HDFS) и генерации DDL."
+    else:
+        return "Я могу помочь с созданием ETL пайплайнов, анализом данных и рекомендациями по хранению. Используйте соответствующие вкладки в интерфейсе."
+
+
+class LLMClient:
+    def __init__(self, providers: Optional[List[Provider]] = None):
+        self.providers = PROVIDERS if providers is None else providers
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self.health: Dict[str, ProviderHealth] = {p.name: ProviderHealth() for p in self.providers}
+        print(f"LLM providers configured: {[p.name for p in self.available()] or 'none'}")
+
+    def available(self) -> List[Provider]:
+        return [p for p in self.providers if p.api_key]
+
+    def _ordered(self) -> List[Provider]:
+        # Healthy providers by observed p50. Ones never called keep their preference order
+        # ahead of the rest so that they get measured; ones that have only failed go last
+        now = time.monotonic()
+
+        def rank(p: Provider) -> float:
+            health = self.health[p.name]
+            p50 = health.quantile(0.5)
+            if p50 is not None:
+                return p50
+            return 0.0 if health.calls == 0 else float("inf")
+
+        return sorted((p for p in self.available() if self.health[p.name].allows(now)), key=rank)
+
+    def provider_stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        order = {p.name: i for i, p in enumerate(self._ordered())}
+        return [
+            {
+                "name": p.name,
+                "model": p.model,
+                "configured": bool(p.api_key),
+                "rank": order.get(p.name),
+                **self.health[p.name].snapshot(now),
+            }
+            for p in self.providers
+        ]
+
+    def _client(self, provider: Provider) -> httpx.AsyncClient:
+        client = self._clients.get(provider.name)
+        if client is None or client.is_closed:
+            client = self._clients[provider.name] = httpx.AsyncClient(
+                timeout=httpx.Timeout(provider.timeout, connect=CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+            )
+        return client
+
+    async def aclose(self) -> None:
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+    async def _call(self, provider: Provider, prompt: str, max_tokens: int) -> Optional[str]:
+        health = self.health[provider.name]
+        if not health.acquire(time.monotonic()):
+            return None
+        started = time.perf_counter()
+        try:
+            response = await self._client(provider).post(
+                provider.url.format(model=provider.model),
+                headers=provider.headers(),
+                json=provider.payload(provider.model, prompt, max_tokens),
+            )
+            response.raise_for_status()
+            text = provider.parse(response.json())
+        except Exception as e:
+            print(f"{provider.name} error: {e!r}")
+            health.record_failure(repr(e))
+            return None
+        finally:
+            # Also released when a hedged call is cancelled
+            health.probing = False
+        health.record_success(time.perf_counter() - started)
+        return text
+
+    async def _stream(self, provider: Provider, prompt: str, max_tokens: int) -> AsyncIterator[str]:
+        # Yields text deltas as the provider produces them. The HTTP stream is only read when
+        # the consumer asks for the next token (backpressure), and closing this generator
+        # closes the upstream connection (cancellation)
+        body = provider.stream_payload(provider.model, prompt, max_tokens)
+        url = (provider.stream_url or provider.url).format(model=provider.model)
+        async with self._client(provider).stream("POST", url, headers=provider.headers(), json=body) as response:
+            response.raise_for_status()
+            sent = ""
+            async for line in response.aiter_lines():
+                if line.strip() == "data: [DONE]":
+                    break
+                event = _stream_event(line)
+                if event is None:
+                    continue
+                text = provider.delta(event)
+                if provider.cumulative:
+                    text, sent = text[len(sent):], text
+                if text:
+                    yield text
+
+    async def stream_response(self, prompt: str, max_tokens: int = 500) -> AsyncIterator[str]:
+        """Streams the answer token by token from the first healthy provider that starts answering."""
+        for provider in self._ordered():
+            if provider.stream_payload is None:
+                # No streaming API: the whole answer arrives as one chunk
+                text = await self._call(provider, prompt, max_tokens)
+                if text:
+                    yield text
+                    return
+                continue
+            health = self.health[provider.name]
+            if not health.acquire(time.monotonic()):
+                continue
+            started = time.perf_counter()
+            produced = False
             try:
-                response = requests.post(
-                    "https://api.together.xyz/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {together_api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "meta-llama/Llama-2-7b-chat-hf",
-                        "messages": [
-                            {"role": "system", "content": "Ты - ассистент по data engineering. Помогаешь создавать ETL пайплайны и анализировать данные."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        "max_tokens": max_tokens,
-                        "temperature": 0.7
-                    },
-                    timeout=30
-                )
-                if response.status_code == 200:
-                    result = response.json()
-                    return result["choices"][0]["message"]["content"]
+                async for token in self._stream(provider, prompt, max_tokens):
+                    produced = True
+                    yield token
             except Exception as e:
-                print(f"Together AI error: {e}")
-        
-        # Ultimate fallback - provide helpful response instead of error
+                print(f"{provider.name} stream error: {e!r}")
+                health.record_failure(repr(e))
+                if produced:
+                    # Switching providers mid-answer would repeat text; end the stream here
+                    return
+                continue
+            finally:
+                health.probing = False
+            if produced:
+                health.record_success(time.perf_counter() - started)
+                return
+            health.record_failure("empty stream")
+        yield _fallback_response(prompt)
+
+    async def _hedge(self, providers: List[Provider], prompt: str, max_tokens: int) -> Optional[str]:
+        pending = {asyncio.create_task(self._call(p, prompt, max_tokens)) for p in providers}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result():
+                        return task.result()
+            return None
+        finally:
+            # The slower request is cancelled; its pooled connection is discarded by httpx
+            for task in pending:
+                task.cancel()
+
+    async def complete(self, prompt: str, max_tokens: int = 500) -> Optional[str]:
+        """Answer from the first provider that succeeds, or None when all of them fail."""
+        providers = self._ordered()
+        if HEDGE and len(providers) >= 2:
+            text = await self._hedge(providers[:2], prompt, max_tokens)
+            if text:
+                return text
+            providers = providers[2:]
+        for provider in providers:
+            text = await self._call(provider, prompt, max_tokens)
+            if text:
+                return text
+        return None
+
+    async def generate_response(self, prompt: str, max_tokens: int = 500) -> str:
+        """Generate response using available LLM"""
+        text = await self.complete(prompt, max_tokens)
         # No local models - only external APIs for reliability
-        if "etl" in prompt.lower() or "пайплайн" in prompt.lower():
-            return "Для создания ETL пайплайна используйте вкладку 'Pipeline Preview'. Система автоматически сгенерирует план на основе вашего описания."
-        elif "анализ" in prompt.lower() or "проанализируй" in prompt.lower():
-            return "Для анализа данных загрузите файлы во вкладке 'Upload & Profile'. Система покажет структуру, типы данных и рекомендации по хранению."
-        elif "рекомендации" in prompt.lower() or "хранение" in prompt.lower():
-            return "Используйте вкладку 'Recommendations' для получения советов по выбору системы хранения (PostgreSQL/ClickHouse/HDFS) и генерации DDL."
-        else:
-            return "Я могу помочь с созданием ETL пайплайнов, анализом данных и рекомендациями по хранению. Используйте соответствующие вкладки в интерфейсе."
+        return text if text else _fallback_response(prompt)
+
+    def _near_duplicate(self, kind: str, signature: str, normalized: str) -> Optional[Dict[str, Any]]:
+        hit = SEMANTIC_INDEX.nearest(f"{kind}|{signature}", normalized)
+        if hit is None or hit[1] < SEMANTIC_THRESHOLD:
+            return None
+        # The index row only points at the cache entry, so TTL and eviction still apply
+        return CACHE.get(hit[0])
+
+    async def _cached_completion(self, kind: str, query: str, prompt: str, max_tokens: int) -> Optional[str]:
+        # Only real provider answers are cached; the canned fallback is cheap to recompute
+        signature = ",".join(f"{p.name}/{p.model}" for p in self.available())
+        normalized = _normalize(query)
+        key = f"{kind}|{signature}|{normalized}"
+        CACHE_COUNTERS["requests"] += 1
+        value = CACHE.get(key)
+        if value is not None:
+            CACHE_COUNTERS["hits"] += 1
+            return value["response"]
+        if SEMANTIC_CACHE:
+            value = self._near_duplicate(kind, signature, normalized)
+            if value is not None:
+                CACHE_COUNTERS["semantic_hits"] += 1
+                return value["response"]
+        CACHE_COUNTERS["llm_calls"] += 1
+        text = await self.complete(prompt, max_tokens)
+        if text is None:
+            return None
+        if SEMANTIC_CACHE:
+            # Indexed first: an entry the cache evicts right away (too large) takes its row with it
+            SEMANTIC_INDEX.add(key, f"{kind}|{signature}", normalized)
+        CACHE.set(key, {"response": text, "kind": kind})
+        return text
     
     async def parse_intent(self, text: str) -> Dict[str, Any]:
         """Parse user intent using LLM"""
+        # Confidently classified texts never reach the LLM
+        fast = intent_classifier.fast_parse(text)
+        if fast is not None:
+            return fast
+
         prompt = f"""
         Проанализируй следующий запрос пользователя и определи:
         1. Тип операции (etl, анализ, подключение к источнику)
@@ -229,11 +563,10 @@ class LLMClient:
         }}
         """
         
-        response = await self.generate_response(prompt)
+        response = await self._cached_completion("intent", text, prompt, 500) or ""
         
         # Try to extract JSON from response
         try:
-            import json
             # Look for JSON in the response
             start = response.find('{')
             end = response.rfind('}') + 1
@@ -296,13 +629,13 @@ class LLMClient:
             {{"op": "write_postgres", "table": "public.result"}}
         ]
         
-        Доступные операции: read_csv, read_json, read_xml, trim_strings, join, aggregate, filter, write_postgres, write_clickhouse
+        Доступные операции: read_csv, read_json, read_xml, read_parquet, trim_strings, join, aggregate, filter, write_postgres, write_clickhouse, write_parquet
         """
         
-        response = await self.generate_response(prompt, max_tokens=800)
+        query = json.dumps({"intent": intent_data, "profiles": profiles}, sort_keys=True, ensure_ascii=False, default=str)
+        response = await self._cached_completion("steps", query, prompt, 800) or ""
         
         try:
-            import json
             start = response.find('[')
             end = response.rfind(']') + 1
             if start != -1 and end != -1:
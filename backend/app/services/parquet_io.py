@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import os
+import shutil
+import time
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+
+# Parquet datasets for read_parquet/write_parquet: a directory of files, optionally
+# hive-partitioned (<path>/dt=2024-01-01/part-....parquet), or a single file. Readers
+# project columns and push filters into the scan, so partitions whose directory values
+# cannot match are never opened and row groups are skipped by their min/max statistics.
+
+ROW_GROUP_ROWS = int(os.getenv("PARQUET_ROW_GROUP_ROWS", str(1 << 20)))
+COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+COMPRESSION_LEVEL = int(os.getenv("PARQUET_COMPRESSION_LEVEL", "3"))
+MODES = ("overwrite", "overwrite_partitions", "append")
+
+
+def dataset(path: str) -> ds.Dataset:
+    return ds.dataset(path, format="parquet", partitioning="hive")
+
+
+def _numeric(type_: pa.DataType) -> bool:
+    return pa.types.is_integer(type_) or pa.types.is_floating(type_) or pa.types.is_decimal(type_)
+
+
+def scan_literal(value: Any, type_: pa.DataType) -> Any:
+    """value (a JSON scalar or list) cast to a column's type; raises an Arrow error when it cannot be.
+
+    Step values come from JSON, so a date or timestamp bound arrives as a string, which
+    Arrow will not compare with a temporal column.
+    """
+    if value is None:
+        return None
+    literal = pa.array(value) if isinstance(value, (list, tuple)) else pa.scalar(value)
+    if literal.type == type_ or (_numeric(literal.type) and _numeric(type_)):
+        # Arrow compares mixed numeric types itself (and 2.5 must stay 2.5 against an int column)
+        return value
+    return literal.cast(type_)
+
+
+def filter_expression(filters: List[Dict[str, Any]], schema: Optional[pa.Schema] = None) -> Optional[ds.Expression]:
+    """Scan predicate equivalent to a sequence of filter steps (pandas keeps NaN rows for != and not_in).
+
+    With the dataset's schema, values are cast to their column's type first.
+    """
+    expr: Optional[ds.Expression] = None
+    for f in filters:
+        field = pc.field(f["column"])
+        operator = f.get("operator", "==")
+        value = f.get("value")
+        if schema is not None and f["column"] in schema.names:
+            value = scan_literal(value, schema.field(f["column"]).type)
+        if operator == "==":
+            cond = field == value
+        elif operator == "!=":
+            cond = (field != value) | field.is_null()
+        elif operator == ">":
+            cond = field > value
+        elif operator == ">=":
+            cond = field >= value
+        elif operator == "<":
+            cond = field < value
+        elif operator == "<=":
+            cond = field <= value
+        elif operator == "in":
+            cond = field.isin(value)
+        elif operator == "not_in":
+            cond = ~field.isin(value) | field.is_null()
+        elif operator == "notnull":
+            cond = field.is_valid()
+        elif operator == "isnull":
+            cond = field.is_null()
+        else:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+        expr = cond if expr is None else expr & cond
+    return expr
+
+
+def read_table(path: str, columns: Optional[List[str]] = None, filters: Optional[List[Dict[str, Any]]] = None) -> pa.Table:
+    data = dataset(path)
+    return data.to_table(columns=columns, filter=filter_expression(filters or [], data.schema))
+
+
+def read_batches(
+    path: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[List[Dict[str, Any]]] = None,
+    batch_size: int = 1 << 17,
+) -> Iterator[pa.RecordBatch]:
+    data = dataset(path)
+    yield from data.to_batches(
+        columns=columns, filter=filter_expression(filters or [], data.schema), batch_size=batch_size
+    )
+
+
+def _chain(first: Any, rest: Iterator[Any]) -> Iterator[Any]:
+    yield first
+    yield from rest
+
+
+def _to_table(chunk: Any, schema: Optional[pa.Schema]) -> pa.Table:
+    if isinstance(chunk, pd.DataFrame):
+        return pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+    if isinstance(chunk, pa.RecordBatch):
+        chunk = pa.Table.from_batches([chunk])
+    return chunk.cast(schema) if schema is not None and chunk.schema != schema else chunk
+
+
+def _replace(src: str, dst: str) -> None:
+    # Readers never see a half-written dataset (only, briefly, no dataset between the renames)
+    trash = f"{dst}.old-{uuid.uuid4().hex}"
+    if os.path.exists(dst):
+        os.rename(dst, trash)
+    os.rename(src, dst)
+    if os.path.isdir(trash):
+        shutil.rmtree(trash)
+    elif os.path.exists(trash):
+        os.remove(trash)
+
+
+def write_dataset(
+    chunks: Iterable[Any],
+    path: str,
+    partition_by: Optional[List[str] | str] = None,
+    mode: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Writes DataFrame/Arrow chunks as a (hive-partitioned) zstd Parquet dataset; schema of the first chunk."""
+    mode = mode or "overwrite"
+    if mode not in MODES:
+        raise ValueError(f"Unsupported write_parquet mode: {mode}")
+    if isinstance(partition_by, str):
+        partition_by = [partition_by]
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if first is None:
+        return {"sink": "parquet", "path": path, "rows": 0}
+    first = _to_table(first, None)
+    # Later chunks are cast to the first chunk's schema; a dataset has one schema
+    schema = first.schema
+    counts = {"rows": 0, "files": 0, "bytes": 0}
+
+    def batches() -> Iterator[pa.RecordBatch]:
+        for chunk in _chain(first, chunks):
+            table = _to_table(chunk, schema)
+            counts["rows"] += table.num_rows
+            yield from table.to_batches()
+
+    def visit(written: Any) -> None:
+        counts["files"] += 1
+        counts["bytes"] += os.path.getsize(written.path)
+
+    path = path.rstrip("/")
+    target = f"{path}.tmp-{uuid.uuid4().hex}" if mode == "overwrite" else path
+    started = time.perf_counter()
+    try:
+        ds.write_dataset(
+            batches(),
+            target,
+            schema=schema,
+            format="parquet",
+            partitioning=partition_by or None,
+            partitioning_flavor="hive" if partition_by else None,
+            file_options=ds.ParquetFileFormat().make_write_options(
+                compression=COMPRESSION, compression_level=COMPRESSION_LEVEL, use_dictionary=True
+            ),
+            # Small chunks are coalesced, but each open partition buffers at most a quarter group
+            min_rows_per_group=max(ROW_GROUP_ROWS // 4, 1),
+            max_rows_per_group=ROW_GROUP_ROWS,
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="delete_matching" if mode == "overwrite_partitions" else "overwrite_or_ignore",
+            file_visitor=visit,
+        )
+        if target != path:
+            _replace(target, path)
+    except BaseException:
+        if target != path:
+            shutil.rmtree(target, ignore_errors=True)
+        raise
+    seconds = time.perf_counter() - started
+    return {
+        "sink": "parquet",
+        "path": path,
+        "mode": mode,
+        **counts,
+        "write_seconds": round(seconds, 4),
+        "rows_per_s": round(counts["rows"] / seconds) if seconds > 0 else None,
+    }
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+
+from ..db import session
+from .reco import generate_postgres_ddl, postgres_type
+
+
+# write_postgres sink: result chunks (pandas DataFrames or Arrow record batches) are
+# converted to tuples in bounded batches and sent with asyncpg's binary COPY
+# (copy_records_to_table) over a connection from the shared pool. Pipeline steps run
+# on worker threads, so every query is submitted to the loop that owns the pool; the
+# next batch is converted while the previous one is being copied.
+#
+# Modes, all in one transaction so readers see either the old or the new contents:
+#   replace  truncate, then COPY (the default; the old CSV sink overwrote its file)
+#   append   COPY only
+#   upsert   COPY into a temp staging table, then INSERT ... ON CONFLICT (key) DO UPDATE
+
+BATCH_ROWS = int(os.getenv("PG_COPY_BATCH_ROWS", "50000"))
+MODES = ("replace", "append", "upsert")
+
+
+def _split(table: str) -> Tuple[Optional[str], str]:
+    schema, _, name = table.rpartition(".")
+    return schema or None, name
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _qualified(schema: Optional[str], name: str) -> str:
+    return f"{_quote(schema)}.{_quote(name)}" if schema else _quote(name)
+
+
+def _key_index(schema: Optional[str], name: str, key: List[str]) -> str:
+    # Postgres truncates identifiers to 63 bytes, so two long keys could share a name and
+    # IF NOT EXISTS would skip the second index; a hash of the full name keeps them apart.
+    # CREATE INDEX takes no schema: the index lives in the schema of the (qualified) table.
+    full = f"{name}_{'_'.join(key)}_key"
+    if len(full.encode("utf-8")) <= 63:
+        return full
+    digest = hashlib.sha1(f"{schema}.{full}".encode("utf-8")).hexdigest()[:12]
+    return full.encode("utf-8")[:63 - 13].decode("utf-8", "ignore") + "_" + digest
+
+
+def _dtypes(chunk: Any) -> Dict[str, str]:
+    if isinstance(chunk, pd.DataFrame):
+        return {str(c): str(t) for c, t in chunk.dtypes.items()}
+    # Arrow calls it timestamp[unit]; generate_postgres_ddl knows the pandas name
+    return {f.name: "datetime64" if pa.types.is_timestamp(f.type) else str(f.type) for f in chunk.schema}
+
+
+def _column(values: List[Any], sql_type: str) -> List[Any]:
+    if sql_type == "text":
+        return [None if v is None else str(v) for v in values]
+    if sql_type == "bigint":
+        return [None if v is None else int(v) for v in values]
+    return values
+
+
+def _pandas_values(series: pd.Series) -> List[Any]:
+    # Python scalars with NaN/NaT/NA as None; COPY would store NaN, not NULL
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def _batches(chunks: Iterable[Any], types: List[str]) -> Iterator[List[Tuple[Any, ...]]]:
+    for chunk in chunks:
+        if isinstance(chunk, pd.DataFrame):
+            for start in range(0, len(chunk), BATCH_ROWS):
+                part = chunk.iloc[start:start + BATCH_ROWS]
+                columns = [_column(_pandas_values(part[c]), t) for c, t in zip(part.columns, types)]
+                yield list(zip(*columns))
+        else:
+            for start in range(0, chunk.num_rows, BATCH_ROWS):
+                part = chunk.slice(start, BATCH_ROWS)
+                columns = [_column(part.column(i).to_pylist(), t) for i, t in enumerate(types)]
+                yield list(zip(*columns))
+
+
+def _chain(first: Any, rest: Iterator[Any]) -> Iterator[Any]:
+    yield first
+    yield from rest
+
+
+def _call(coro: Any) -> Future:
+    try:
+        on_loop = asyncio.get_running_loop() is session.LOOP
+    except RuntimeError:
+        on_loop = False
+    if on_loop:
+        # .result() on the loop's own thread would block the loop that has to run coro
+        coro.close()
+        raise RuntimeError("write_postgres must run on a worker thread, not on the event loop that owns the pool")
+    return asyncio.run_coroutine_threadsafe(coro, session.LOOP)
+
+
+async def _acquire() -> Any:
+    # Pool.acquire() returns an awaitable context, which run_coroutine_threadsafe does not accept
+    return await session.POOL.acquire()
+
+
+def _write_csv(chunks: Iterable[Any], table: str) -> Dict[str, Any]:
+    # Local dev without a metadata DB: keep the previous file output
+    out_path = f"./data/{table.replace('.', '_')}.csv"
+    rows = 0
+    for i, chunk in enumerate(chunks):
+        if not isinstance(chunk, pd.DataFrame):
+            chunk = chunk.to_pandas()
+        chunk.to_csv(out_path, index=False, mode="w" if i == 0 else "a", header=i == 0)
+        rows += len(chunk)
+    return {"sink": "csv", "path": out_path, "rows": rows}
+
+
+def write_postgres(
+    chunks: Iterable[Any],
+    table: str,
+    mode: Optional[str] = None,
+    key: Optional[List[str] | str] = None,
+) -> Dict[str, Any]:
+    """COPYs chunks into table, creating it from the first chunk's schema.
+
+    Thread-only: every query blocks on a future run by session.LOOP, so this must be
+    called from a worker thread (run_in_executor / to_thread), never from a coroutine
+    on that loop; doing so raises RuntimeError instead of deadlocking.
+    """
+    if isinstance(key, str):
+        key = [key]
+    mode = mode or ("upsert" if key else "replace")
+    if mode not in MODES:
+        raise ValueError(f"Unsupported write_postgres mode: {mode}")
+    if mode == "upsert" and not key:
+        raise ValueError("write_postgres mode 'upsert' needs a key")
+    if session.POOL is None:
+        return _write_csv(chunks, table)
+
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if first is None:
+        return {"sink": "postgres", "table": table, "mode": mode, "rows": 0}
+    dtypes = _dtypes(first)
+    columns = list(dtypes)
+    types = [postgres_type(t) for t in dtypes.values()]
+    schema, name = _split(table)
+    target = _qualified(schema, name)
+    missing = [k for k in key or [] if k not in dtypes]
+    if missing:
+        raise ValueError(f"write_postgres key columns not in the result: {missing}")
+
+    started = time.perf_counter()
+    rows = batches = 0
+    conn = _call(_acquire()).result()
+    transaction = conn.transaction()
+    pending: Optional[Future] = None
+    try:
+        if schema:
+            _call(conn.execute(f"CREATE SCHEMA IF NOT EXISTS {_quote(schema)}")).result()
+        _call(conn.execute(generate_postgres_ddl(target, {c: {"dtype": t} for c, t in dtypes.items()}))).result()
+        _call(transaction.start()).result()
+        if mode == "upsert":
+            index = _quote(_key_index(schema, name, key))
+            key_list = ", ".join(_quote(k) for k in key)
+            # ON CONFLICT needs a unique index on exactly the key columns; created in the
+            # transaction, so a failed load does not leave it behind on a new table
+            _call(conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {target} ({key_list})")).result()
+        if mode == "replace":
+            _call(conn.execute(f"TRUNCATE {target}")).result()
+        copy_into: Dict[str, Any] = {"table_name": name, "schema_name": schema}
+        if mode == "upsert":
+            stage = f"_stage_{name}"
+            _call(conn.execute(
+                f"CREATE TEMP TABLE {_quote(stage)} (LIKE {target} INCLUDING DEFAULTS) ON COMMIT DROP"
+            )).result()
+            copy_into = {"table_name": stage, "schema_name": None}
+
+        for records in _batches(_chain(first, chunks), types):
+            if pending is not None:
+                pending.result()
+            pending = _call(conn.copy_records_to_table(records=records, columns=columns, **copy_into))
+            rows += len(records)
+            batches += 1
+        if pending is not None:
+            pending.result()
+            pending = None
+
+        if mode == "upsert":
+            column_list = ", ".join(_quote(c) for c in columns)
+            updates = ", ".join(f"{_quote(c)} = EXCLUDED.{_quote(c)}" for c in columns if c not in key)
+            # The last staged row wins when a key repeats in the result
+            _call(conn.execute(
+                f"INSERT INTO {target} ({column_list}) "
+                f"SELECT DISTINCT ON ({key_list}) {column_list} FROM {_quote(stage)} ORDER BY {key_list}, ctid DESC "
+                f"ON CONFLICT ({key_list}) DO " + (f"UPDATE SET {updates}" if updates else "NOTHING")
+            )).result()
+        _call(transaction.commit()).result()
+    except BaseException:
+        if pending is not None:
+            try:
+                pending.result()
+            except Exception:
+                pass
+        try:
+            _call(transaction.rollback()).result()
+        except Exception:
+            pass
+        raise
+    finally:
+        _call(session.POOL.release(conn)).result()
+
+    seconds = time.perf_counter() - started
+    return {
+        "sink": "postgres",
+        "table": table,
+        "mode": mode,
+        "rows": rows,
+        "batches": batches,
+        "copy_seconds": round(seconds, 4),
+        "rows_per_s": round(rows / seconds) if seconds > 0 else None,
+    }
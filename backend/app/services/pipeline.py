@@ -1,13 +1,20 @@
 from __future__ import annotations
 
 import asyncio
+import os
 from dataclasses import dataclass
 from typing import Any, Dict, List, Literal, Optional
 
 import pandas as pd
 from pydantic import BaseModel
-from ..db.session import POOL, insert_run_start, update_run_finish
+from ..db.session import insert_run_start, update_run_finish
 from .ch_client import write_dataframe as ch_write
+from .dag import run_dag
+from .incremental import average, merge_state
+from .parquet_io import read_table as read_parquet, write_dataset as write_parquet
+from .pg_sink import write_postgres
+from .planner import optimize
+from .step_cache import get_step_cache
 
 
 class PipelineRequest(BaseModel):
@@ -16,6 +23,12 @@ class PipelineRequest(BaseModel):
     steps: Optional[List[Dict[str, Any]]] = None
     schedule: Optional[str] = None  # e.g., "@daily"
     output: Optional[Dict[str, Any]] = None
+    optimize: bool = True  # rewrite steps with the planner before running them
+    explain: bool = False  # /pipeline/plan: also return the optimized plan and its cost
+    engine: Optional[Literal["pandas", "arrow", "streaming"]] = None  # defaults to PIPELINE_ENGINE
+    incremental: bool = False  # only process rows added since the last successful run (watermarks)
+    name: Optional[str] = None  # pipeline label in the run log and watermark table
+    cache: bool = True  # reuse step outputs cached by earlier runs (pandas/arrow engines)
 
 
 async def create_pipeline_from_intent(req: PipelineRequest) -> Dict[str, Any]:
@@ -48,61 +61,152 @@ def _trim_strings(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-async def run_pipeline(req: PipelineRequest) -> Dict[str, Any]:
+def _apply_filter(df: pd.DataFrame, step: Dict[str, Any]) -> pd.DataFrame:
+    column = df[step["column"]]
+    operator = step.get("operator", "==")
+    value = step.get("value")
+    if operator == "==":
+        mask = column == value
+    elif operator == "!=":
+        mask = column != value
+    elif operator == ">":
+        mask = column > value
+    elif operator == ">=":
+        mask = column >= value
+    elif operator == "<":
+        mask = column < value
+    elif operator == "<=":
+        mask = column <= value
+    elif operator == "in":
+        mask = column.isin(value)
+    elif operator == "not_in":
+        mask = ~column.isin(value)
+    elif operator == "notnull":
+        mask = column.notna()
+    elif operator == "isnull":
+        mask = column.isna()
+    else:
+        raise ValueError(f"Unsupported filter operator: {operator}")
+    return df[mask.fillna(False)]
+
+
+def _select_columns(df: pd.DataFrame, columns: Optional[List[str]]) -> pd.DataFrame:
+    # Projection requested by the planner; columns a source does not have are skipped
+    if columns is None:
+        return df
+    return df[[c for c in df.columns if str(c) in columns]]
+
+
+def _execute_step_pandas(step: Dict[str, Any], context: Dict[str, pd.DataFrame]) -> Dict[str, Any]:
     # Minimal in-memory engine for demo
-    context: Dict[str, pd.DataFrame] = {}
+    op = step.get("op")
+    if op == "read_csv":
+        path = step.get("path", "./data/input.csv")
+        context[step.get("name", "csv")] = pd.read_csv(path, usecols=step.get("columns"))
+    elif op == "read_json":
+        path = step.get("path", "./data/input.json")
+        df = pd.read_json(path, lines=False)
+        context[step.get("name", "json")] = _select_columns(df, step.get("columns"))
+    elif op == "read_parquet":
+        path = step.get("path", "./data/input.parquet")
+        table = read_parquet(path, step.get("columns"), step.get("filters"))
+        context[step.get("name", "parquet")] = table.to_pandas()
+    elif op == "trim_strings":
+        src = step.get("input") or "csv"
+        context[src] = _trim_strings(context[src])
+    elif op == "filter":
+        src = step.get("input") or ("result" if "result" in context else list(context)[-1])
+        context[src] = _apply_filter(context[src], step)
+    elif op == "join":
+        left = context[step.get("left", "csv")]
+        right = context[step.get("right", "json")]
+        on = step.get("on", "user_id")
+        context["joined"] = left.merge(right, on=on, how="left")
+    elif op == "aggregate":
+        df = context.get("joined")
+        by = step.get("by", "user_id")
+        metric = step.get("metric", "avg")
+        column = step.get("column", "amount")
+        alias = step.get("alias", f"{metric}_{column}")
+        if metric == "avg" and step.get("state") is not None:
+            # Incremental run: this delta's sum/count merged into the stored partial state
+            total = merge_state(df.groupby(by)[column].agg(["sum", "count"]), by, step["state"])
+            agg = average(total, by, alias)
+        elif metric == "avg":
+            agg = df.groupby(by)[column].mean().reset_index(name=alias)
+        else:
+            raise ValueError("Unsupported metric")
+        context["result"] = agg
+    elif op == "write_postgres":
+        table = step.get("table", "result")
+        df = context[step["input"]] if step.get("input") else context.get("result", list(context.values())[-1])
+        return write_postgres([df], table, step.get("mode"), step.get("key"))
+    elif op == "write_parquet":
+        path = step.get("path", "./data/result.parquet")
+        df = context[step["input"]] if step.get("input") else context.get("result", list(context.values())[-1])
+        return write_parquet([df], path, step.get("partition_by"), step.get("mode"))
+    elif op == "write_clickhouse":
+        table = step.get("table", "default.etl_result")
+        df = context[step["input"]] if step.get("input") else context.get("result", list(context.values())[-1])
+        return ch_write(df, table, order_by=step.get("order_by"), partition_by=step.get("partition_by"),
+                        async_insert=step.get("async_insert"))
+    else:
+        raise ValueError(f"Unsupported op: {op}")
+    return {}
+
+
+async def run_pipeline(req: PipelineRequest) -> Dict[str, Any]:
     steps = req.steps or (await create_pipeline_from_intent(req))["steps"]
+    engine = req.engine or os.getenv("PIPELINE_ENGINE", "pandas")
     run_id: Optional[int] = None
+    incremental = None
 
     try:
         # Start run log if DB available
         try:
-            run_id = await insert_run_start("in_memory_demo")
+            run_id = await insert_run_start(req.name or "in_memory_demo")
         except Exception:
             run_id = None
 
-        for step in steps:
-            op = step.get("op")
-            if op == "read_csv":
-                path = step.get("path", "./data/input.csv")
-                context[step.get("name", "csv")] = pd.read_csv(path)
-            elif op == "read_json":
-                path = step.get("path", "./data/input.json")
-                context[step.get("name", "json")] = pd.read_json(path, lines=False)
-            elif op == "trim_strings":
-                src = step.get("input") or "csv"
-                context[src] = _trim_strings(context[src])
-            elif op == "join":
-                left = context[step.get("left", "csv")]
-                right = context[step.get("right", "json")]
-                on = step.get("on", "user_id")
-                context["joined"] = left.merge(right, on=on, how="left")
-            elif op == "aggregate":
-                df = context.get("joined")
-                by = step.get("by", "user_id")
-                metric = step.get("metric", "avg")
-                column = step.get("column", "amount")
-                alias = step.get("alias", f"{metric}_{column}")
-                if metric == "avg":
-                    agg = df.groupby(by)[column].mean().reset_index(name=alias)
-                else:
-                    raise ValueError("Unsupported metric")
-                context["result"] = agg
-            elif op == "write_postgres":
-                table = step.get("table", "result")
-                out_path = f"./data/{table.replace('.', '_')}.csv"
-                context.get("result", list(context.values())[-1]).to_csv(out_path, index=False)
-            elif op == "write_clickhouse":
-                table = step.get("table", "default.etl_result")
-                df = context.get("result", list(context.values())[-1])
-                ch_write(df, table)
+        if req.incremental:
+            from .incremental import prepare
+            # Reads are rewritten to the delta since the stored watermarks; aggregates carry their state
+            incremental = await prepare(req.name, steps)
+            steps = incremental.steps
+            if incremental.mode == "unchanged":
+                if run_id is not None:
+                    await update_run_finish(run_id, "success")
+                return {"status": "ok", "preview": [], "steps": [], "incremental": incremental.summary()}
+        if req.optimize:
+            steps = optimize(steps)
+
+        if engine == "streaming":
+            from .streaming_engine import run_steps as run_steps_streaming
+            # Lazy chunked engine: steps only run when a writer or the preview pulls data
+            head, metrics = await asyncio.get_running_loop().run_in_executor(None, run_steps_streaming, steps)
+            head_preview = head.to_dict(orient="records")
+        else:
+            if engine == "arrow":
+                from .arrow_engine import execute_step
+            else:
+                execute_step = _execute_step_pandas
+            # Incremental runs read deltas, so their step outputs are not worth keeping
+            step_cache = get_step_cache() if req.cache and incremental is None else None
+            session = step_cache.session(engine) if step_cache is not None else None
+            context, final, metrics = await run_dag(steps, execute_step, cache=session)
+            out = context[final] if final else context.get("result", list(context.values())[-1])
+            if engine == "arrow":
+                head_preview = out.slice(0, 10).to_pylist()
             else:
-                raise ValueError(f"Unsupported op: {op}")
+                head_preview = out.head(10).to_dict(orient="records")
 
-        head_preview = context.get("result", list(context.values())[-1]).head(10).to_dict(orient="records")
+        result = {"status": "ok", "preview": head_preview, "steps": metrics}
+        if incremental is not None:
+            await incremental.commit(run_id)
+            result["incremental"] = incremental.summary()
         if run_id is not None:
             await update_run_finish(run_id, "success")
-        return {"status": "ok", "preview": head_preview}
+        return result
     except Exception as e:
         if run_id is not None:
             try:
@@ -110,6 +214,9 @@ async def run_pipeline(req: PipelineRequest) -> Dict[str, Any]:
             except Exception:
                 pass
         raise
+    finally:
+        if incremental is not None:
+            incremental.discard()
 
 
 
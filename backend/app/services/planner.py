@@ -0,0 +1,354 @@
+from __future__ import annotations
+
+import copy
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+
+import pandas as pd
+
+import pyarrow as pa
+
+from .parquet_io import dataset as parquet_dataset, scan_literal
+
+
+# Logical planning for run_pipeline: the step list is resolved into nodes with
+# explicit inputs/outputs, rewritten (dead-step elimination, filter pushdown
+# below joins, projection pushdown into readers) and emitted again as a step
+# list that both engines execute. Filters on a Parquet read are folded into the scan,
+# where they prune hive partitions and row groups.
+
+READ_OPS = {"read_csv", "read_json", "read_parquet"}
+WRITE_OPS = {"write_postgres", "write_clickhouse", "write_parquet"}
+DEFAULT_PATHS = {
+    "read_csv": "./data/input.csv",
+    "read_json": "./data/input.json",
+    "read_parquet": "./data/input.parquet",
+}
+IN_PLACE_OPS = {"trim_strings", "filter"}
+SAMPLE_BYTES = 64 * 1024
+FILTER_SELECTIVITY = 0.5
+
+
+@dataclass
+class PlanNode:
+    step: Dict[str, Any]
+    inputs: List[str] = field(default_factory=list)
+    output: Optional[str] = None
+
+    @property
+    def op(self) -> str:
+        return self.step.get("op", "")
+
+
+class UnsupportedPlan(Exception):
+    pass
+
+
+def resolve(steps: List[Dict[str, Any]]) -> tuple[List[PlanNode], str]:
+    # Replays the engines' naming rules so every node knows exactly what it reads and writes
+    produced: List[str] = []
+    nodes: List[PlanNode] = []
+
+    def current() -> str:
+        if "result" in produced:
+            return "result"
+        if not produced:
+            raise UnsupportedPlan("no dataset produced yet")
+        return produced[-1]
+
+    def define(name: str) -> str:
+        if name not in produced:
+            produced.append(name)
+        return name
+
+    def require(name: str) -> str:
+        if name not in produced:
+            raise UnsupportedPlan(f"dataset {name!r} is read before it is produced")
+        return name
+
+    for raw in steps:
+        step = dict(raw)
+        op = step.get("op")
+        if op == "read_csv":
+            step.setdefault("name", "csv")
+            node = PlanNode(step, [], define(step["name"]))
+        elif op == "read_json":
+            step.setdefault("name", "json")
+            node = PlanNode(step, [], define(step["name"]))
+        elif op == "read_parquet":
+            step.setdefault("name", "parquet")
+            node = PlanNode(step, [], define(step["name"]))
+        elif op == "trim_strings":
+            step["input"] = step.get("input") or "csv"
+            node = PlanNode(step, [require(step["input"])], step["input"])
+        elif op == "filter":
+            step["input"] = step.get("input") or current()
+            node = PlanNode(step, [require(step["input"])], step["input"])
+        elif op == "join":
+            step.setdefault("left", "csv")
+            step.setdefault("right", "json")
+            step.setdefault("on", "user_id")
+            node = PlanNode(step, [require(step["left"]), require(step["right"])], define("joined"))
+        elif op == "aggregate":
+            node = PlanNode(step, [require("joined")], define("result"))
+        elif op in WRITE_OPS:
+            step["input"] = step.get("input") or current()
+            node = PlanNode(step, [require(step["input"])], None)
+        else:
+            raise UnsupportedPlan(f"unknown op {op!r}")
+        nodes.append(node)
+    return nodes, current()
+
+
+def _join_keys(step: Dict[str, Any]) -> List[str]:
+    # merge/join accept a single column or a list of them
+    on = step["on"]
+    return [on] if isinstance(on, str) else list(on)
+
+
+def _group_keys(step: Dict[str, Any]) -> List[str]:
+    # Likewise for the aggregate's group-by
+    by = step.get("by", "user_id")
+    return [by] if isinstance(by, str) else list(by)
+
+
+def _eliminate_dead(nodes: List[PlanNode], final: str) -> List[PlanNode]:
+    needed: Set[str] = {final}
+    live: List[PlanNode] = []
+    for node in reversed(nodes):
+        if node.op in WRITE_OPS:
+            needed.update(node.inputs)
+        elif node.output in needed:
+            if node.op not in IN_PLACE_OPS:
+                # Anything that produced this name earlier is overwritten here
+                needed.discard(node.output)
+            needed.update(node.inputs)
+        else:
+            continue
+        live.append(node)
+    return list(reversed(live))
+
+
+def probe_columns(step: Dict[str, Any]) -> Optional[List[str]]:
+    # Cheap schema lookup: CSV header, first JSON line or Parquet footer; None when it would need a full parse
+    path = step.get("path", DEFAULT_PATHS.get(step.get("op"), DEFAULT_PATHS["read_json"]))
+    try:
+        if step.get("op") == "read_parquet":
+            return list(parquet_dataset(path).schema.names)
+        if step.get("op") == "read_csv":
+            return [str(c) for c in pd.read_csv(path, nrows=0).columns]
+        with open(path, "rb") as fh:
+            if fh.read(SAMPLE_BYTES).lstrip()[:1] == b"{":
+                return [str(c) for c in pd.read_json(path, lines=True, nrows=1).columns]
+    except Exception:
+        pass
+    return None
+
+
+def _push_filters(nodes: List[PlanNode]) -> List[PlanNode]:
+    nodes = list(nodes)
+    producers = {n.output: n for n in nodes if n.op in READ_OPS}
+    i = 0
+    while i < len(nodes):
+        node = nodes[i]
+        prev = nodes[i - 1] if i else None
+        # Only a filter directly on a join's output; a left join commutes with
+        # filters on left-side columns (and the key, on both sides)
+        if node.op == "filter" and prev is not None and prev.op == "join" and node.inputs == [prev.output]:
+            column = node.step.get("column")
+            left, right = prev.step["left"], prev.step["right"]
+            left_columns = probe_columns(producers[left].step) if left in producers else None
+            right_columns = probe_columns(producers[right].step) if right in producers else None
+            keys = _join_keys(prev.step)
+            # A column on both sides is suffixed by the join, so the filter could not refer to it
+            ambiguous = column not in keys and right_columns is not None and column in right_columns
+            later_readers = {name for n in nodes[i + 1:] for name in n.inputs}
+            if left not in later_readers and left_columns is not None and column in left_columns and not ambiguous:
+                targets = [left]
+                if column in keys and right not in later_readers:
+                    targets.append(right)
+                pushed = [PlanNode({**node.step, "input": t}, [t], t) for t in targets]
+                nodes[i - 1:i + 1] = pushed + [prev]
+                i = max(i - 1, 0)
+                continue
+        i += 1
+    return nodes
+
+
+def _parquet_schema(step: Dict[str, Any]) -> Optional[pa.Schema]:
+    try:
+        return parquet_dataset(step.get("path", DEFAULT_PATHS["read_parquet"])).schema
+    except Exception:
+        return None
+
+
+def _foldable(schema: Optional[pa.Schema], predicate: Dict[str, Any]) -> bool:
+    # The scan casts the value to the column's type; a value it cannot cast stays a filter step
+    if schema is None or predicate.get("column") not in schema.names:
+        return False
+    try:
+        scan_literal(predicate.get("value"), schema.field(predicate["column"]).type)
+    except (pa.ArrowException, ValueError, TypeError):
+        return False
+    return True
+
+
+def _fold_into_parquet(nodes: List[PlanNode]) -> List[PlanNode]:
+    # A filter on a Parquet read, with nothing reading the dataset in between, becomes a scan predicate
+    scans: Dict[str, PlanNode] = {}
+    schemas: Dict[int, Optional[pa.Schema]] = {}
+    out: List[PlanNode] = []
+    for node in nodes:
+        if node.op == "filter" and node.inputs[0] in scans:
+            scan = scans[node.inputs[0]]
+            if id(scan) not in schemas:
+                schemas[id(scan)] = _parquet_schema(scan.step)
+            predicate = {k: node.step[k] for k in ("column", "operator", "value") if k in node.step}
+            if _foldable(schemas[id(scan)], predicate):
+                scan.step.setdefault("filters", []).append(predicate)
+                continue
+        for name in node.inputs + [node.output]:
+            scans.pop(name, None)
+        if node.op == "read_parquet":
+            scans[node.output] = node
+        out.append(node)
+    return out
+
+
+def _merge_need(needs: Dict[str, Optional[Set[str]]], name: str, cols: Optional[Set[str]]) -> None:
+    if name in needs and needs[name] is None:
+        return
+    if cols is None:
+        needs[name] = None
+    else:
+        needs[name] = needs.get(name, set()) | cols
+
+
+def _push_projections(nodes: List[PlanNode], final: str) -> None:
+    needs: Dict[str, Optional[Set[str]]] = {final: None}
+    for node in reversed(nodes):
+        op, step = node.op, node.step
+        if op in WRITE_OPS:
+            _merge_need(needs, node.inputs[0], None)
+        elif op == "filter":
+            need = needs.get(node.output, set())
+            _merge_need(needs, node.output, None if need is None else {step.get("column")})
+        elif op == "aggregate":
+            needs.pop(node.output, None)
+            _merge_need(needs, "joined", set(_group_keys(step)) | {step.get("column", "amount")})
+        elif op == "join":
+            need = needs.pop(node.output, set())
+            if need is not None:
+                need = set(need) | set(_join_keys(step))
+                # Suffixed names only exist if both sides keep the base column
+                need |= {c[:-2] for c in need if c.endswith(("_x", "_y"))}
+            _merge_need(needs, step["left"], need)
+            _merge_need(needs, step["right"], need)
+        elif op in READ_OPS:
+            need = needs.pop(node.output, set())
+            if not need:
+                continue
+            available = probe_columns(step)
+            if op in ("read_csv", "read_parquet") and available is None:
+                # read_csv(usecols=...) and Parquet scans reject unknown names, so only push when the schema is known
+                continue
+            step["columns"] = sorted(c for c in need if available is None or c in available)
+
+
+def _estimate_parquet(step: Dict[str, Any]) -> Dict[str, Any]:
+    # Footers give exact row counts; bytes read scale with the projected columns
+    try:
+        dataset = parquet_dataset(step.get("path", DEFAULT_PATHS["read_parquet"]))
+        size = sum(os.path.getsize(f) for f in dataset.files)
+        rows = dataset.count_rows()
+    except Exception:
+        return {"bytes": None, "rows": None}
+    fraction = 1.0
+    if step.get("columns") is not None and dataset.schema.names:
+        fraction = len(step["columns"]) / len(dataset.schema.names)
+    return {"bytes": size, "rows": rows, "column_fraction": round(fraction, 3)}
+
+
+def _estimate(step: Dict[str, Any]) -> Dict[str, Any]:
+    if step["op"] == "read_parquet":
+        return _estimate_parquet(step)
+    path = step.get("path", DEFAULT_PATHS[step["op"]])
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as fh:
+            sample = fh.read(SAMPLE_BYTES)
+    except OSError:
+        return {"bytes": None, "rows": None}
+    # One record per line for CSV/JSON lines; one object per record in a JSON array
+    records = max(sample.count(b"\n"), sample.count(b"{") if step["op"] == "read_json" else 0, 1)
+    rows = int(size / (len(sample) / records)) if sample else 0
+    columns = probe_columns(step)
+    fraction = 1.0
+    if columns and step.get("columns") is not None:
+        fraction = len(step["columns"]) / len(columns)
+    return {"bytes": size, "rows": rows, "column_fraction": round(fraction, 3)}
+
+
+def estimate_cost(steps: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Rough cost units: bytes materialized by readers plus rows flowing through joins/aggregates
+    rows: Dict[str, int] = {}
+    per_step: List[Dict[str, Any]] = []
+    total = 0.0
+    try:
+        nodes, _ = resolve(steps)
+    except UnsupportedPlan:
+        return {"total": None, "steps": []}
+    for node in nodes:
+        est: Dict[str, Any] = {"op": node.op}
+        if node.op in READ_OPS:
+            est.update(_estimate(node.step))
+            rows[node.output] = est.get("rows") or 0
+            total += (est.get("bytes") or 0) * est.get("column_fraction", 1.0)
+        elif node.op == "join":
+            left, right = (rows.get(n, 0) for n in node.inputs)
+            rows[node.output] = left
+            est["rows"] = left
+            total += left + right
+        elif node.op == "aggregate":
+            est["rows"] = rows.get("joined", 0)
+            rows[node.output] = est["rows"]
+            total += est["rows"]
+        elif node.op == "filter":
+            total += rows.get(node.output, 0)
+            rows[node.output] = est["rows"] = int(rows.get(node.output, 0) * FILTER_SELECTIVITY)
+        elif node.inputs:
+            est["rows"] = rows.get(node.inputs[0], 0)
+            total += est["rows"]
+        per_step.append(est)
+    return {"total": int(total), "steps": per_step}
+
+
+def optimize(steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Returns an equivalent, cheaper step list; unknown plans come back unchanged."""
+    try:
+        nodes, final = resolve(copy.deepcopy(steps))
+    except UnsupportedPlan:
+        return steps
+    nodes = _eliminate_dead(nodes, final)
+    nodes = _push_filters(nodes)
+    nodes = _fold_into_parquet(nodes)
+    _push_projections(nodes, final)
+    return [node.step for node in nodes]
+
+
+def explain(steps: List[Dict[str, Any]]) -> Dict[str, Any]:
+    try:
+        nodes, final = resolve(copy.deepcopy(steps))
+        live = {id(n) for n in _eliminate_dead(nodes, final)}
+        removed = [n.step for n in nodes if id(n) not in live]
+    except UnsupportedPlan as e:
+        return {"steps": steps, "optimized": False, "reason": str(e), "estimated_cost": estimate_cost(steps)}
+    optimized = optimize(steps)
+    return {
+        "steps": optimized,
+        "optimized": True,
+        "removed_steps": removed,
+        "estimated_cost": estimate_cost(optimized),
+        "original_cost": estimate_cost(steps),
+    }
@@ -1,125 +1,384 @@
-import io
-from typing import Any, Dict, List
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
-import chardet
+import numpy as np
 import pandas as pd
 from fastapi import UploadFile
+
+try:
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+from .cache import ResultCache
+from .sketch import HyperLogLog
+from .sniff import sniff
 from .xml_reader import xml_to_dataframe
 
 
-async def _read_file_detect_encoding(upload: UploadFile) -> bytes:
-    content = await upload.read()
-    return content
+# Uploads are spooled to disk in blocks of this size and parsed in row chunks,
+# so peak memory depends on the chunk size rather than on the file size.
+READ_BLOCK_BYTES = int(os.getenv("PROFILE_READ_BLOCK_BYTES", str(1 << 20)))
+CHUNK_ROWS = int(os.getenv("PROFILE_CHUNK_ROWS", "100000"))
+SPOOL_DIR = os.getenv("PROFILE_SPOOL_DIR") or None
+SAMPLE_SIZE = 3
+# "approx" counts distinct values with a HyperLogLog sketch and only verifies
+# candidate keys exactly; "exact" keeps the distinct hashes in memory, switching a
+# column to the sketch once it has more than EXACT_DISTINCT_MAX of them.
+DISTINCT_MODE = os.getenv("PROFILE_DISTINCT_MODE", "approx").lower()
+DISTINCT_ERROR = float(os.getenv("PROFILE_DISTINCT_ERROR", "0.01"))
+EXACT_DISTINCT_MAX = int(os.getenv("PROFILE_EXACT_DISTINCT_MAX", "1000000"))
+# Parsing and profiling run off the event loop; "process" spreads files over cores
+EXECUTOR_KIND = os.getenv("PROFILE_EXECUTOR", "process").lower()
+MAX_WORKERS = int(os.getenv("PROFILE_WORKERS", "0")) or (os.cpu_count() or 1)
+# Profiles are cached by content hash so re-uploads of the same extract are free
+CACHE = ResultCache(
+    max_entries=int(os.getenv("PROFILE_CACHE_ENTRIES", "256")),
+    max_bytes=int(os.getenv("PROFILE_CACHE_BYTES", str(64 << 20))),
+    directory=os.getenv("PROFILE_CACHE_DIR") or None,
+    max_disk_bytes=int(os.getenv("PROFILE_CACHE_DISK_BYTES", str(512 << 20))),
+)
 
 
-def _detect_encoding_and_sep(content: bytes) -> Dict[str, Any]:
-    detection = chardet.detect(content)
-    encoding = detection.get("encoding") or "utf-8"
-    text_preview = content[:1000].decode(encoding, errors="ignore")
-    sep = ","
-    if "\t" in text_preview and text_preview.count("\t") > text_preview.count(","):
-        sep = "\t"
-    return {"encoding": encoding, "sep": sep}
+EXECUTOR: Optional[Executor] = None
 
 
-def _profile_dataframe(df: pd.DataFrame) -> Dict[str, Any]:
-    profile: Dict[str, Any] = {
-        "rows": int(df.shape[0]),
-        "columns": int(df.shape[1]),
-        "columns_info": {},
-        "potential_keys": [],
-        "null_counts": {},
-    }
+def get_executor() -> Executor:
+    global EXECUTOR
+    if EXECUTOR is None:
+        if EXECUTOR_KIND == "thread":
+            EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="profile")
+        else:
+            # spawn: forking a process that already runs the event loop and scheduler threads is unsafe
+            EXECUTOR = ProcessPoolExecutor(
+                max_workers=MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return EXECUTOR
+
+
+def shutdown_executor() -> None:
+    global EXECUTOR
+    if EXECUTOR is not None:
+        EXECUTOR.shutdown(wait=False, cancel_futures=True)
+        EXECUTOR = None
+
+
+async def _spool_upload(upload: UploadFile) -> Tuple[str, str]:
+    # Copy the upload to a temp file block by block instead of reading it whole,
+    # hashing the content on the way; hashing and writing run off the event loop
+    loop = asyncio.get_running_loop()
+    digest = hashlib.blake2b(digest_size=20)
+
+    def spool(out: Any, block: bytes) -> None:
+        digest.update(block)
+        out.write(block)
+
+    fd, path = tempfile.mkstemp(prefix="profile_", dir=SPOOL_DIR)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                block = await upload.read(READ_BLOCK_BYTES)
+                if not block:
+                    break
+                await loop.run_in_executor(None, spool, out, block)
+    except BaseException:
+        # A failed or cancelled upload leaves no partial file behind
+        os.remove(path)
+        raise
+    return path, digest.hexdigest()
+
+
+def _cache_key(content_hash: str) -> str:
+    # Settings that change the profile are part of the key
+    return f"{content_hash}:{DISTINCT_MODE}:{DISTINCT_ERROR}:{EXACT_DISTINCT_MAX}:{SAMPLE_SIZE}"
+
+
+def cache_stats() -> Dict[str, Any]:
+    return CACHE.stats()
+
 
-    for col in df.columns:
-        series = df[col]
-        nulls = int(series.isna().sum())
-        nunique = int(series.nunique(dropna=True))
-        profile["columns_info"][str(col)] = {
-            "dtype": str(series.dtype),
-            "unique": nunique,
-            "sample": series.dropna().head(3).tolist(),
+def _hash_values(series: pd.Series) -> np.ndarray:
+    return pd.util.hash_pandas_object(series, index=False).to_numpy()
+
+
+def _widen_dtype(current: Any, new: Any) -> Any:
+    # Mirror what pandas infers when it sees the whole column at once
+    if current is None or current == new:
+        return new
+    if isinstance(current, np.dtype) and isinstance(new, np.dtype):
+        if current.kind in "iuf" and new.kind in "iuf":
+            return np.promote_types(current, new)
+    return np.dtype(object)
+
+
+def _to_builtin(value: Any) -> Any:
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+class _ColumnStats:
+    def __init__(self) -> None:
+        self.dtype: Any = None
+        self.nulls = 0
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.sketch = HyperLogLog(DISTINCT_ERROR) if DISTINCT_MODE == "approx" else None
+        self.exact_unique: Optional[int] = None
+        self.sample: List[Any] = []
+        self.min: Any = None
+        self.max: Any = None
+
+    def update(self, series: pd.Series) -> None:
+        self.dtype = _widen_dtype(self.dtype, series.dtype)
+        non_null = series.dropna()
+        self.nulls += int(series.size - non_null.size)
+        if non_null.empty:
+            return
+
+        hashed = _hash_values(non_null)
+        if self.sketch is not None:
+            self.sketch.add_hashes(hashed)
+        else:
+            self.hashes = np.union1d(self.hashes, hashed)
+            if self.hashes.size > EXACT_DISTINCT_MAX:
+                # Too many distinct values to keep: continue approximately, bounded memory
+                self.sketch = HyperLogLog(DISTINCT_ERROR)
+                self.sketch.add_hashes(self.hashes)
+                self.hashes = np.empty(0, dtype=np.uint64)
+
+        if len(self.sample) < SAMPLE_SIZE:
+            self.sample.extend(non_null.head(SAMPLE_SIZE - len(self.sample)).tolist())
+
+        if isinstance(self.dtype, np.dtype) and self.dtype.kind in "iufM":
+            lo, hi = non_null.min(), non_null.max()
+            self.min = lo if self.min is None else min(self.min, lo)
+            self.max = hi if self.max is None else max(self.max, hi)
+        else:
+            self.min = self.max = None
+
+    def unique(self) -> int:
+        if self.exact_unique is not None:
+            return self.exact_unique
+        if self.sketch is not None:
+            return self.sketch.count()
+        return int(self.hashes.size)
+
+    def info(self) -> Dict[str, Any]:
+        info: Dict[str, Any] = {
+            "dtype": str(self.dtype),
+            "unique": self.unique(),
+            "sample": self.sample,
         }
-        profile["null_counts"][str(col)] = nulls
-        if nunique == df.shape[0] and nulls == 0:
-            profile["potential_keys"].append(str(col))
+        if self.min is not None:
+            info["min"] = _to_builtin(self.min)
+            info["max"] = _to_builtin(self.max)
+        return info
 
-    return profile
 
+class _ProfileAccumulator:
+    """Merges per-chunk column statistics into a single profile."""
 
-def _looks_like_json(content: bytes) -> bool:
-    s = content.lstrip()
-    return s.startswith(b"{") or s.startswith(b"[")
+    def __init__(self) -> None:
+        self.rows = 0
+        self.columns: Dict[str, _ColumnStats] = {}
+        # Reader's label per column name (integers for a headerless CSV)
+        self.labels: Dict[str, Any] = {}
 
+    def update(self, df: pd.DataFrame) -> None:
+        present = set(df.columns.astype(str))
+        for col in df.columns:
+            stats = self.columns.get(str(col))
+            if stats is None:
+                stats = self.columns[str(col)] = _ColumnStats()
+                self.labels[str(col)] = col
+                # Column appeared late (e.g. sparse JSON lines): earlier rows were null
+                stats.nulls = self.rows
+            stats.update(df[col])
+        for name, stats in self.columns.items():
+            if name not in present:
+                stats.nulls += int(df.shape[0])
+        self.rows += int(df.shape[0])
 
-async def profile_datasets(files: List[UploadFile]) -> List[Dict[str, Any]]:
-    results: List[Dict[str, Any]] = []
-    for f in files:
-        content = await _read_file_detect_encoding(f)
-        meta = _detect_encoding_and_sep(content)
-        encoding = meta["encoding"]
-        name = f.filename or "file"
-
-        # Prefer JSON for .json files or JSON-looking content; XML for .xml; otherwise CSV first
-        prefer_json = (name.lower().endswith('.json')) or _looks_like_json(content)
-        prefer_xml = name.lower().endswith('.xml')
-
-        df = None
-        if prefer_xml:
-            try:
-                df = xml_to_dataframe(content)
-            except Exception:
-                pass
-            if df is None:
-                try:
-                    df = pd.read_csv(io.BytesIO(content), sep=meta["sep"])  # type: ignore[arg-type]
-                except Exception:
-                    pass
-        elif prefer_json:
-            # Try as JSON (array or object)
-            try:
-                df = pd.read_json(io.BytesIO(content))  # type: ignore[arg-type]
-            except Exception:
-                # Some JSONL cases
-                try:
-                    df = pd.read_json(io.BytesIO(content), lines=True)  # type: ignore[arg-type]
-                except Exception:
-                    pass
-            # Fallback to CSV
-            if df is None:
-                try:
-                    df = pd.read_csv(io.BytesIO(content), sep=meta["sep"])  # type: ignore[arg-type]
-                except Exception:
-                    pass
+    def candidate_keys(self) -> List[str]:
+        if self.rows == 0:
+            return []
+        # Anything within three standard errors of the row count may be a key; exactly
+        # counted columns need no check
+        threshold = self.rows * (1 - 3 * DISTINCT_ERROR)
+        return [
+            name for name, stats in self.columns.items()
+            if stats.sketch is not None and stats.nulls == 0 and stats.unique() >= threshold
+        ]
+
+    def verify_keys(self, candidates: List[str], chunks: Iterable[pd.DataFrame]) -> None:
+        # Exact pass restricted to the sketch's candidates; stops at the first duplicate
+        seen = {name: np.empty(0, dtype=np.uint64) for name in candidates}
+        for chunk in chunks:
+            lookup = {str(col): col for col in chunk.columns}
+            for name in list(seen):
+                hashed = _hash_values(chunk[lookup[name]])
+                merged = np.union1d(seen[name], hashed)
+                if merged.size < seen[name].size + hashed.size:
+                    del seen[name]
+                else:
+                    seen[name] = merged
+            if not seen:
+                break
+        for name in candidates:
+            stats = self.columns[name]
+            stats.exact_unique = self.rows if name in seen else min(stats.unique(), self.rows - 1)
+
+    def result(self) -> Dict[str, Any]:
+        profile: Dict[str, Any] = {
+            "rows": self.rows,
+            "columns": len(self.columns),
+            "columns_info": {},
+            "potential_keys": [],
+            "null_counts": {},
+            "distinct": {"mode": DISTINCT_MODE},
+        }
+        if DISTINCT_MODE == "approx":
+            profile["distinct"]["relative_error"] = DISTINCT_ERROR
         else:
-            # Try CSV first
-            try:
-                df = pd.read_csv(io.BytesIO(content), sep=meta["sep"])  # type: ignore[arg-type]
-            except Exception:
-                # Fallback to JSON/JSONL
-                try:
-                    df = pd.read_json(io.BytesIO(content))  # type: ignore[arg-type]
-                except Exception:
-                    try:
-                        df = pd.read_json(io.BytesIO(content), lines=True)  # type: ignore[arg-type]
-                    except Exception:
-                        pass
-
-        if df is None:
-            results.append({
-                "name": name,
-                "detected": meta,
-                "error": "Unsupported or unreadable file format",
-            })
-            continue
-
-        profile = _profile_dataframe(df)
-        results.append({
+            sketched = [name for name, stats in self.columns.items() if stats.sketch is not None]
+            if sketched:
+                profile["distinct"].update({"relative_error": DISTINCT_ERROR, "approximate_columns": sketched})
+        for name, stats in self.columns.items():
+            info = stats.info()
+            profile["columns_info"][name] = info
+            profile["null_counts"][name] = stats.nulls
+            if info["unique"] == self.rows and stats.nulls == 0:
+                profile["potential_keys"].append(name)
+        return profile
+
+
+def _profile_chunks(open_chunks: Callable[[Optional[List[str]]], Iterable[pd.DataFrame]]) -> Dict[str, Any]:
+    # open_chunks(columns) starts a fresh pass over the data, optionally limited to columns
+    acc = _ProfileAccumulator()
+    for chunk in open_chunks(None):
+        acc.update(chunk)
+    candidates = acc.candidate_keys()
+    if candidates:
+        acc.verify_keys(candidates, open_chunks([acc.labels[name] for name in candidates]))
+    return acc.result()
+
+
+def _profile_dataframe(df: pd.DataFrame) -> Dict[str, Any]:
+    return _profile_chunks(lambda columns: [df])
+
+
+def _profile_csv(path: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    return _profile_chunks(lambda columns: pd.read_csv(
+        path,
+        sep=meta["sep"],
+        quotechar=meta["quotechar"],
+        header=0 if meta["header"] else None,
+        encoding=meta["encoding"],
+        encoding_errors="replace",
+        usecols=columns,
+        chunksize=CHUNK_ROWS,
+    ))
+
+
+def _iter_json_lines(path: str, meta: Dict[str, Any]) -> Iterable[pd.DataFrame]:
+    with pd.read_json(path, lines=True, encoding=meta["encoding"], chunksize=CHUNK_ROWS) as reader:
+        yield from reader
+
+
+def _profile_json_lines(path: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    return _profile_chunks(lambda columns: _iter_json_lines(path, meta))
+
+
+def _profile_json(path: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    # A JSON document has to be parsed whole
+    return _profile_dataframe(pd.read_json(path, encoding=meta["encoding"]))
+
+
+def _profile_xml(path: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    return _profile_dataframe(xml_to_dataframe(path))
+
+
+def _iter_parquet(path: str, columns: Optional[List[str]]) -> Iterable[pd.DataFrame]:
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=CHUNK_ROWS, columns=columns):
+        yield batch.to_pandas()
+
+
+def _profile_parquet(path: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError("pyarrow is required to read parquet files")
+    return _profile_chunks(lambda columns: _iter_parquet(path, columns))
+
+
+# One reader per sniffed format: each file is parsed exactly once
+READERS: Dict[str, Tuple[str, Callable[[str, Dict[str, Any]], Dict[str, Any]]]] = {
+    "csv": ("pandas.read_csv(chunksize)", _profile_csv),
+    "tsv": ("pandas.read_csv(chunksize)", _profile_csv),
+    "json": ("pandas.read_json", _profile_json),
+    "jsonl": ("pandas.read_json(lines, chunksize)", _profile_json_lines),
+    "xml": ("pandas.read_xml", _profile_xml),
+    "parquet": ("pyarrow.ParquetFile.iter_batches", _profile_parquet),
+}
+
+
+def _profile_file(path: str, name: str) -> Dict[str, Any]:
+    meta: Dict[str, Any] = {}
+    try:
+        # A file that cannot even be sniffed is an error entry too, not a failed batch
+        meta = sniff(path, name)
+        meta["reader"], reader = READERS[meta["format"]]
+        profile = reader(path, meta)
+    except Exception as e:
+        return {
             "name": name,
-            "detected": meta,
-            "profile": profile,
-        })
+            "detected": meta or None,
+            "error": "Unsupported or unreadable file format",
+            "reason": str(e),
+        }
+    return {
+        "name": name,
+        "detected": meta,
+        "profile": profile,
+    }
+
 
-    return results
+async def profile_datasets(files: List[UploadFile]) -> List[Dict[str, Any]]:
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    paths: List[str] = []
+    try:
+        pending: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+        jobs = []
+        for f in files:
+            path, content_hash = await _spool_upload(f)
+            paths.append(path)
+            key = _cache_key(content_hash)
+            cached = CACHE.get(key)
+            if cached is None and key not in pending:
+                # Identical files in one request are profiled once
+                pending[key] = loop.run_in_executor(executor, _profile_file, path, f.filename or "file")
+            jobs.append((f.filename or "file", content_hash, key, cached))
 
+        # All files of the request are profiled concurrently; results keep upload order
+        computed = dict(zip(pending, await asyncio.gather(*pending.values())))
+        for key, result in computed.items():
+            if "profile" in result:
+                CACHE.set(key, result)
 
+        results: List[Dict[str, Any]] = []
+        for name, content_hash, key, cached in jobs:
+            result = cached if cached is not None else dict(computed[key])
+            result.update({"name": name, "content_hash": content_hash, "cached": cached is not None})
+            results.append(result)
+        return results
+    finally:
+        for path in paths:
+            os.remove(path)
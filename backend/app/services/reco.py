@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 
 def recommend_storage(profile: Dict[str, Any]) -> Dict[str, Any]:
@@ -26,40 +26,54 @@ def recommend_storage(profile: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+def postgres_type(dtype: Any) -> str:
+    dtype = str(dtype).lower()
+    if "int" in dtype:
+        return "bigint"
+    if "float" in dtype or "double" in dtype:
+        return "double precision"
+    if "datetime" in dtype or "date" in dtype:
+        return "timestamp"
+    return "text"
+
+
 def generate_postgres_ddl(table: str, columns_info: Dict[str, Any]) -> str:
     col_lines: List[str] = []
     for name, info in columns_info.items():
-        dtype = str(info.get("dtype", "text")).lower()
-        if "int" in dtype:
-            sql_type = "bigint"
-        elif "float" in dtype or "double" in dtype:
-            sql_type = "double precision"
-        elif "datetime" in dtype or "date" in dtype:
-            sql_type = "timestamp"
-        else:
-            sql_type = "text"
+        sql_type = postgres_type(info.get("dtype", "text"))
         col_lines.append(f"\t\"{name}\" {sql_type}")
     ddl = f"CREATE TABLE IF NOT EXISTS {table} (\n" + ",\n".join(col_lines) + "\n);"
     return ddl
 
 
-def generate_clickhouse_ddl(table: str, columns_info: Dict[str, Any]) -> str:
+def clickhouse_type(dtype: Any) -> str:
+    dtype = str(dtype).lower()
+    if "int" in dtype:
+        return "Int64"
+    if "float" in dtype or "double" in dtype:
+        return "Float64"
+    if "datetime" in dtype or "date" in dtype:
+        return "DateTime"
+    return "String"
+
+
+def generate_clickhouse_ddl(
+    table: str,
+    columns_info: Dict[str, Any],
+    order_by: Optional[List[str]] = None,
+    partition_by: Optional[str] = None,
+) -> str:
     col_lines: List[str] = []
     for name, info in columns_info.items():
-        dtype = str(info.get("dtype", "String")).lower()
-        if "int" in dtype:
-            sql_type = "Int64"
-        elif "float" in dtype or "double" in dtype:
-            sql_type = "Float64"
-        elif "datetime" in dtype or "date" in dtype:
-            sql_type = "DateTime"
-        else:
-            sql_type = "String"
+        sql_type = clickhouse_type(info.get("dtype", "String"))
+        if info.get("nullable"):
+            sql_type = f"Nullable({sql_type})"
         col_lines.append(f"\t`{name}` {sql_type}")
+    order = "(" + ", ".join(f"`{c}`" for c in order_by) + ")" if order_by else "tuple()"
     ddl = (
         f"CREATE TABLE IF NOT EXISTS {table} (\n" + ",\n".join(col_lines) +
-        "\n) ENGINE = MergeTree ORDER BY tuple()" 
+        "\n) ENGINE = MergeTree"
     )
-    return ddl
-
-
+    if partition_by:
+        ddl += f" PARTITION BY {partition_by}"
+    return ddl + f" ORDER BY {order}"
@@ -23,10 +23,12 @@ def ensure_scheduler_started() -> None:
         sch.start()
 
 
-def schedule_daily_pipeline(intent_text: str, hour: int = 0, minute: int = 0) -> str:
+def schedule_daily_pipeline(intent_text: str, hour: int = 0, minute: int = 0, incremental: bool = True) -> str:
     ensure_scheduler_started()
     sch = get_scheduler()
-    job = sch.add_job(lambda: run_pipeline(PipelineRequest(intent_text=intent_text)), 'cron', hour=hour, minute=minute)
+    # Passing the coroutine function itself lets AsyncIOScheduler await it on the loop
+    req = PipelineRequest(intent_text=intent_text, incremental=incremental, name=f"daily:{intent_text}")
+    job = sch.add_job(run_pipeline, 'cron', args=[req], hour=hour, minute=minute)
     return job.id
 
 
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import math
+
+import numpy as np
+
+
+def precision_for_error(error: float) -> int:
+    # Standard error of HyperLogLog is ~1.04 / sqrt(m) with m = 2 ** p registers
+    m = (1.04 / max(error, 1e-6)) ** 2
+    return min(18, max(4, math.ceil(math.log2(m))))
+
+
+class HyperLogLog:
+    """Mergeable distinct-count sketch over precomputed 64-bit hashes."""
+
+    def __init__(self, error: float = 0.01, precision: int | None = None) -> None:
+        self.p = precision or precision_for_error(error)
+        self.m = 1 << self.p
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    def add_hashes(self, hashes: np.ndarray) -> None:
+        if hashes.size == 0:
+            return
+        h = hashes.astype(np.uint64, copy=False)
+        idx = h >> np.uint64(64 - self.p)
+        rest = h & np.uint64((1 << (64 - self.p)) - 1)
+        # Rank = position of the leftmost 1-bit in the remaining 64 - p bits
+        bit_length = np.frexp(rest.astype(np.float64))[1]
+        rank = (64 - self.p - bit_length + 1).astype(np.uint32)
+        # Keep the highest rank per register: sort (register, rank) pairs and take the last of each run
+        keys = np.unique((idx.astype(np.uint32) << np.uint32(8)) | rank)
+        regs = (keys >> np.uint32(8)).astype(np.intp)
+        last = np.append(regs[1:] != regs[:-1], True)
+        regs = regs[last]
+        ranks = (keys[last] & np.uint32(0xFF)).astype(np.uint8)
+        self.registers[regs] = np.maximum(self.registers[regs], ranks)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        if other.p != self.p:
+            raise ValueError("Cannot merge sketches with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / float(np.sum(np.ldexp(1.0, -self.registers.astype(np.int32))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is much more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import codecs
+import csv
+import json
+import os
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+from chardet.universaldetector import UniversalDetector
+
+
+# Bytes examined at the head, middle and tail of a file; detection cost is
+# bounded by these samples regardless of the file size.
+SNIFF_SAMPLE_BYTES = int(os.getenv("PROFILE_SNIFF_BYTES", str(64 * 1024)))
+SNIFF_LINES = 200
+DELIMITERS = [",", ";", "\t", "|"]
+_BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+
+def read_samples(path: str, size: int = SNIFF_SAMPLE_BYTES) -> Tuple[bytes, List[bytes]]:
+    # Returns the head and the head/middle/tail samples; small files are read once
+    total = os.path.getsize(path)
+    with open(path, "rb") as fh:
+        head = fh.read(size)
+        if total <= 3 * size:
+            return head, [head + fh.read()]
+        samples = [head]
+        for offset in (total // 2 - size // 2, total - size):
+            fh.seek(offset)
+            samples.append(fh.read(size))
+    return head, samples
+
+
+def _is_utf8(samples: List[bytes]) -> bool:
+    for i, sample in enumerate(samples):
+        if i > 0:
+            # Samples taken mid-file may start inside a multi-byte sequence
+            sample = sample.lstrip(bytes(range(0x80, 0xC0)))
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        try:
+            # final=False tolerates a sequence cut at the end of the sample
+            decoder.decode(sample, final=False)
+        except UnicodeDecodeError:
+            return False
+    return True
+
+
+def detect_encoding(samples: List[bytes]) -> Tuple[str, float]:
+    for bom, name in _BOMS:
+        if samples[0].startswith(bom):
+            return name, 1.0
+    # Valid UTF-8 (including plain ASCII) is by far the common case and needs no statistics
+    if _is_utf8(samples):
+        return "utf-8", 0.99
+
+    detector = UniversalDetector()
+    for sample in samples:
+        for start in range(0, len(sample), 4096):
+            detector.feed(sample[start:start + 4096])
+            if detector.done:
+                break
+        if detector.done:
+            break
+    detector.close()
+    encoding = detector.result.get("encoding") or "utf-8"
+    confidence = float(detector.result.get("confidence") or 0.0)
+    if encoding.lower() == "ascii":
+        encoding = "utf-8"
+    return encoding, round(confidence, 3)
+
+
+def _sample_lines(head: bytes, encoding: str) -> List[str]:
+    text = head.decode(encoding, errors="ignore")
+    lines = text.splitlines()
+    if len(head) >= SNIFF_SAMPLE_BYTES and len(lines) > 1:
+        # The last line of a truncated sample is usually incomplete
+        lines = lines[:-1]
+    return [line for line in lines if line.strip()][:SNIFF_LINES]
+
+
+def _is_number(value: str) -> bool:
+    try:
+        float(value.replace(",", "."))
+        return True
+    except ValueError:
+        return False
+
+
+def _has_header(rows: List[List[str]]) -> bool:
+    if len(rows) < 2:
+        return True
+    first, rest = rows[0], rows[1:]
+    votes = 0
+    for i, value in enumerate(first):
+        column = [row[i] for row in rest if i < len(row) and row[i]]
+        if not column or sum(_is_number(v) for v in column) < 0.9 * len(column):
+            continue
+        # A text cell on top of a numeric column is a column name
+        votes += -1 if _is_number(value) else 1
+    if votes == 0:
+        return len(set(first)) == len(first) and all(first)
+    return votes > 0
+
+
+def detect_dialect(lines: List[str]) -> Dict[str, Any]:
+    best: Dict[str, Any] = {"sep": ",", "sep_confidence": 0.0, "fields": 1}
+    for delimiter in DELIMITERS:
+        counts = [len(row) for row in csv.reader(lines, delimiter=delimiter)]
+        if not counts:
+            continue
+        fields, hits = Counter(counts).most_common(1)[0]
+        if fields < 2:
+            continue
+        confidence = hits / len(counts)
+        # Prefer the delimiter that splits lines most consistently, then into more fields
+        if (confidence, fields) > (best["sep_confidence"], best["fields"]):
+            best = {"sep": delimiter, "sep_confidence": confidence, "fields": fields}
+
+    sep = best["sep"]
+    quotechar = '"'
+    quoted = any(f'{sep}"' in line or line.startswith('"') for line in lines)
+    if not quoted and any(f"{sep}'" in line or line.startswith("'") for line in lines):
+        quotechar, quoted = "'", True
+    rows = list(csv.reader(lines, delimiter=sep, quotechar=quotechar))
+    return {
+        "sep": sep,
+        "sep_confidence": round(best["sep_confidence"], 3),
+        "quotechar": quotechar,
+        "quoting": quoted,
+        "header": _has_header(rows),
+    }
+
+
+def _is_json_lines(text: str) -> bool:
+    lines = [line for line in text.splitlines() if line.strip()]
+    try:
+        first = json.loads(lines[0])
+    except ValueError:
+        # The first line is not a complete value: a pretty-printed document
+        return False
+    if not isinstance(first, dict):
+        return False
+    if len(lines) > 1 and lines[1].lstrip().startswith("{"):
+        return True
+    # A lone object of lists/objects is a column-oriented document, anything else one record
+    return not first or not all(isinstance(v, (list, dict)) for v in first.values())
+
+
+def detect_format(head: bytes, name: str, encoding: str) -> str:
+    if head.startswith(b"PAR1"):
+        return "parquet"
+    text = head.decode(encoding, errors="ignore").lstrip("\ufeff \t\r\n")
+    if text.startswith("<"):
+        return "xml"
+    if text.startswith("["):
+        return "json"
+    if text.startswith("{"):
+        return "jsonl" if _is_json_lines(text) else "json"
+    if not text:
+        # Nothing to look at; trust the extension
+        ext = os.path.splitext(name.lower())[1].lstrip(".")
+        return ext if ext in ("json", "jsonl", "xml", "parquet", "tsv") else "csv"
+    return "csv"
+
+
+def sniff(path: str, name: str) -> Dict[str, Any]:
+    """Decides format, encoding and CSV dialect from bounded samples, before any full parse."""
+    head, samples = read_samples(path)
+    if head.startswith(b"PAR1"):
+        return {"format": "parquet"}
+    encoding, confidence = detect_encoding(samples)
+    meta: Dict[str, Any] = {
+        "format": detect_format(head, name, encoding),
+        "encoding": encoding,
+        "encoding_confidence": confidence,
+    }
+    if meta["format"] in ("csv", "tsv"):
+        meta.update(detect_dialect(_sample_lines(samples[0], encoding)))
+        meta["format"] = "tsv" if meta["sep"] == "\t" else "csv"
+    return meta
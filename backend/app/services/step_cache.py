@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+import pyarrow as pa
+
+from .planner import IN_PLACE_OPS, READ_OPS, WRITE_OPS, DEFAULT_PATHS, PlanNode
+
+
+# Step-level result cache for the DAG engines. Every step's output is stored as an
+# Arrow IPC file named by a fingerprint of the engine, the step's parameters, the
+# fingerprints of the steps that produced its inputs and, for reads, the stats of the
+# files read. Before a run, steps whose output is cached are loaded instead of executed
+# and everything upstream of them that nothing else needs is skipped, so editing the
+# last step of a pipeline reruns only that step. Writers always run. Files are
+# memory-mapped on load and evicted least recently used first once the directory
+# exceeds PIPELINE_STEP_CACHE_BYTES.
+
+CACHE_DIR = os.getenv("PIPELINE_STEP_CACHE_DIR", "./data/step_cache") or None
+MAX_BYTES = int(os.getenv("PIPELINE_STEP_CACHE_BYTES", str(2 << 30)))
+
+StepFn = Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]
+
+
+def _source_stats(step: Dict[str, Any]) -> Optional[List[Any]]:
+    path = os.path.abspath(step.get("path", DEFAULT_PATHS[step["op"]]))
+    try:
+        if os.path.isdir(path):
+            # Parquet dataset: every file under it
+            files = sorted(os.path.join(root, f) for root, _, names in os.walk(path) for f in names)
+        else:
+            files = [path]
+        return [(f, st.st_size, st.st_mtime_ns, st.st_ino) for f in files for st in [os.stat(f)]]
+    except OSError:
+        return None
+
+
+def fingerprints(nodes: List[PlanNode], engine: str) -> List[Optional[str]]:
+    """Per node: hash of its parameters, upstream fingerprints and read file stats; None when uncacheable."""
+    producer: Dict[str, Optional[str]] = {}
+    out: List[Optional[str]] = []
+    for node in nodes:
+        fp: Optional[str] = None
+        # Incremental aggregates write their state as a side effect
+        if node.op not in WRITE_OPS and "state" not in node.step:
+            upstream = [producer.get(name) for name in node.inputs]
+            stats = _source_stats(node.step) if node.op in READ_OPS else []
+            if None not in upstream and stats is not None:
+                payload = json.dumps([engine, node.step, upstream, stats], sort_keys=True, default=str)
+                fp = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        if node.output is not None:
+            producer[node.output] = fp
+        out.append(fp)
+    return out
+
+
+class StepCache:
+    """Directory of Arrow IPC step outputs with size-bounded LRU eviction (mtime is the recency)."""
+
+    def __init__(self, directory: str, max_bytes: int = MAX_BYTES) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "skipped_steps": 0}
+        os.makedirs(directory, exist_ok=True)
+        self._bytes = sum(size for _, _, size in self._files())
+
+    def _path(self, fp: str) -> str:
+        return os.path.join(self.directory, f"{fp}.arrow")
+
+    def _files(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".arrow"):
+                stat = entry.stat()
+                yield entry.path, stat.st_mtime, stat.st_size
+
+    def load(self, fp: str) -> Optional[pa.Table]:
+        path = self._path(fp)
+        try:
+            # Zero-copy: buffers point into the page cache; an evicted file stays readable while mapped
+            table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+            os.utime(path)
+        except (OSError, pa.ArrowInvalid):
+            return None
+        return table
+
+    def store(self, fp: str, table: pa.Table) -> bool:
+        if table.nbytes > self.max_bytes // 2:
+            return False
+        path = self._path(fp)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp, path)
+            size = os.path.getsize(path)
+        except OSError:
+            return False
+        with self._lock:
+            self._bytes += size
+            self.counters["stores"] += 1
+            if self._bytes > self.max_bytes:
+                self._trim()
+        return True
+
+    def _trim(self) -> None:
+        # Other workers share the directory, so re-measure before evicting
+        files = sorted(self._files(), key=lambda f: f[1])
+        self._bytes = sum(size for _, _, size in files)
+        target = int(self.max_bytes * 0.9)
+        for path, _, size in files:
+            if self._bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._bytes -= size
+            self.counters["evictions"] += 1
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def clear(self) -> None:
+        with self._lock:
+            for path, _, _ in list(self._files()):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+            "disk_bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def session(self, engine: str) -> "CacheSession":
+        return CacheSession(self, engine)
+
+
+class CacheSession:
+    """One run's view of the cache: which steps load, which execute (and store), which are skipped."""
+
+    def __init__(self, cache: StepCache, engine: str) -> None:
+        self.cache = cache
+        self.engine = engine
+        # id(step) -> (fingerprint, output name, cached output)
+        self.steps: Dict[int, Tuple[Optional[str], Optional[str], Optional[pa.Table]]] = {}
+
+    def plan(self, nodes: List[PlanNode], final: str) -> List[PlanNode]:
+        fps = fingerprints(nodes, self.engine)
+        hits: Dict[int, pa.Table] = {}
+        # Like dead-step elimination, except that a cached step does not need its inputs
+        needed: Set[str] = {final}
+        keep: List[PlanNode] = []
+        for i in reversed(range(len(nodes))):
+            node = nodes[i]
+            if node.op in WRITE_OPS:
+                needed.update(node.inputs)
+            elif node.output in needed:
+                # Mapped now, so an eviction during the run cannot take it away
+                table = self.cache.load(fps[i]) if fps[i] is not None else None
+                if table is not None:
+                    hits[i] = table
+                    needed.discard(node.output)
+                    node = PlanNode(node.step, [], node.output)
+                else:
+                    if node.op not in IN_PLACE_OPS:
+                        needed.discard(node.output)
+                    needed.update(node.inputs)
+            else:
+                continue
+            self.steps[id(node.step)] = (fps[i], node.output, hits.get(i))
+            keep.append(node)
+        self.cache.count("skipped_steps", len(nodes) - len(keep))
+        return list(reversed(keep))
+
+    def _to_engine(self, table: pa.Table) -> Any:
+        return table if self.engine == "arrow" else table.to_pandas()
+
+    def _from_engine(self, data: Any) -> pa.Table:
+        if isinstance(data, pd.DataFrame):
+            return pa.Table.from_pandas(data, preserve_index=False)
+        return data
+
+    def run(self, step: Dict[str, Any], context: Dict[str, Any], execute: StepFn) -> Dict[str, Any]:
+        fp, output, cached = self.steps.get(id(step), (None, None, None))
+        if cached is not None:
+            self.cache.count("hits")
+            context[output] = self._to_engine(cached)
+            return {"cache": "hit", "rows": cached.num_rows}
+        extra = execute(step, context) or {}
+        if fp is not None and output in context:
+            self.cache.count("misses")
+            try:
+                table = self._from_engine(context[output])
+            except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+                # e.g. object columns mixing str and int: not representable, just not cached
+                return {**extra, "cache": "uncacheable"}
+            extra = {**extra, "cache": "stored" if self.cache.store(fp, table) else "too_large"}
+        return extra
+
+
+_STEP_CACHE: Optional[StepCache] = None
+
+
+def get_step_cache() -> Optional[StepCache]:
+    global _STEP_CACHE
+    if _STEP_CACHE is None and CACHE_DIR:
+        _STEP_CACHE = StepCache(CACHE_DIR)
+    return _STEP_CACHE
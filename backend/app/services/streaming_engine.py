@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+import math
+import os
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+import pandas as pd
+
+from .ch_client import write_chunks as ch_write_chunks
+from .incremental import average, merge_state
+from .parquet_io import read_batches as read_parquet_batches, write_dataset as write_parquet
+from .pg_sink import write_postgres
+
+
+# Out-of-core engine: datasets are re-iterable streams of DataFrame chunks. Only
+# the join build side and the aggregate state are ever held in memory, and the
+# build side is hash-partitioned to disk (grace join) when it exceeds the budget.
+
+CHUNK_ROWS = int(os.getenv("PIPELINE_CHUNK_ROWS", "200000"))
+MEMORY_BUDGET = int(os.getenv("PIPELINE_MEMORY_BUDGET", str(512 << 20)))
+SPILL_PARTITIONS = int(os.getenv("PIPELINE_SPILL_PARTITIONS", "32"))
+SPILL_DIR = os.getenv("PIPELINE_SPILL_DIR") or None
+
+Stream = Callable[[], Iterator[pd.DataFrame]]
+
+
+def _read_csv(path: str, columns: List[str] | None) -> Stream:
+    def stream() -> Iterator[pd.DataFrame]:
+        with pd.read_csv(path, usecols=columns, chunksize=CHUNK_ROWS) as reader:
+            yield from reader
+    return stream
+
+
+def _read_json(path: str, columns: List[str] | None) -> Stream:
+    def select(df: pd.DataFrame) -> pd.DataFrame:
+        return df if columns is None else df[[c for c in df.columns if str(c) in columns]]
+
+    def stream() -> Iterator[pd.DataFrame]:
+        with open(path, "rb") as fh:
+            lines = fh.read(1024).lstrip()[:1] != b"["
+        if lines:
+            with pd.read_json(path, lines=True, chunksize=CHUNK_ROWS) as reader:
+                for chunk in reader:
+                    yield select(chunk)
+        else:
+            # A JSON array cannot be parsed incrementally by pandas
+            df = select(pd.read_json(path, lines=False))
+            for start in range(0, len(df), CHUNK_ROWS):
+                yield df.iloc[start:start + CHUNK_ROWS]
+    return stream
+
+
+def _read_parquet(path: str, columns: List[str] | None, filters: List[Dict[str, Any]] | None) -> Stream:
+    def stream() -> Iterator[pd.DataFrame]:
+        for batch in read_parquet_batches(path, columns, filters, batch_size=CHUNK_ROWS):
+            yield batch.to_pandas()
+    return stream
+
+
+def _map(src: Stream, fn: Callable[[pd.DataFrame], pd.DataFrame]) -> Stream:
+    return lambda: (fn(chunk) for chunk in src())
+
+
+def _keys(columns: str | List[str]) -> List[str]:
+    # Join and group-by keys are a column name or a list of them
+    return [columns] if isinstance(columns, str) else list(columns)
+
+
+def _partition_ids(keys: pd.DataFrame, partitions: int) -> pd.Series:
+    # Both sides must agree on the partition of equal keys even if one side
+    # inferred int64 and the other float64 (or object)
+    keys = pd.DataFrame({
+        name: values.astype("float64") if pd.api.types.is_numeric_dtype(values) else values.astype(str)
+        for name, values in keys.items()
+    })
+    # One hash per row, combining every key column
+    return pd.Series(pd.util.hash_pandas_object(keys, index=False).to_numpy() % partitions, index=keys.index)
+
+
+class _Spill:
+    """Hash-partitions a stream of chunks into pickle files under a temp directory."""
+
+    def __init__(self, root: str, side: str, on: str | List[str], partitions: int) -> None:
+        self.root, self.side, self.on, self.partitions = root, side, _keys(on), partitions
+        self.files: Dict[int, List[str]] = {p: [] for p in range(partitions)}
+        self.bytes = 0
+
+    def add(self, chunk: pd.DataFrame) -> None:
+        for p, part in chunk.groupby(_partition_ids(chunk[self.on], self.partitions), sort=False):
+            p = int(p)
+            path = os.path.join(self.root, f"{self.side}_{p}_{len(self.files[p])}.pkl")
+            part.to_pickle(path)
+            self.files[p].append(path)
+            self.bytes += os.path.getsize(path)
+
+    def read(self, p: int) -> Iterator[pd.DataFrame]:
+        for path in self.files[p]:
+            yield pd.read_pickle(path)
+
+
+def _join(left: Stream, right: Stream, on: str | List[str], spill_dir: str, stats: Dict[str, Any]) -> Stream:
+    # The build side (or both spilled sides) is kept for the rest of the run, so a
+    # second consumer of the join (another writer) does not rebuild or re-spill it
+    built: Dict[str, Any] = {}
+
+    def merge(chunk: pd.DataFrame, build: pd.DataFrame) -> pd.DataFrame:
+        return chunk.merge(build, on=on, how="left")
+
+    def probe_spilled() -> Iterator[pd.DataFrame]:
+        right_spill, left_spill = built["right"], built["left"]
+        for p in range(right_spill.partitions):
+            parts = list(right_spill.read(p))
+            # An empty right partition still yields the left rows, with the right columns missing
+            table = pd.concat(parts, ignore_index=True) if parts else built["empty_right"]
+            for chunk in left_spill.read(p):
+                yield merge(chunk, table)
+
+    def stream() -> Iterator[pd.DataFrame]:
+        if "table" in built:
+            for chunk in left():
+                yield merge(chunk, built["table"])
+            return
+        if "left" in built:
+            yield from probe_spilled()
+            return
+
+        build: List[pd.DataFrame] = []
+        size = 0
+        right_chunks = right()
+        for chunk in right_chunks:
+            build.append(chunk)
+            size += int(chunk.memory_usage(deep=True).sum())
+            if size > MEMORY_BUDGET:
+                break
+        else:
+            # Build side fits: classic hash join, streaming the probe side
+            built["table"] = pd.concat(build, ignore_index=True) if build else pd.DataFrame(columns=_keys(on))
+            for chunk in left():
+                yield merge(chunk, built["table"])
+            return
+
+        # Grace hash join: partition both sides to disk and join partition by partition
+        empty_right = build[0].iloc[:0]
+        partitions = max(SPILL_PARTITIONS, 2 * math.ceil(size / MEMORY_BUDGET))
+        root = tempfile.mkdtemp(prefix="join_", dir=spill_dir)
+        right_spill = _Spill(root, "right", on, partitions)
+        left_spill = _Spill(root, "left", on, partitions)
+        for chunk in build:
+            right_spill.add(chunk)
+        build.clear()
+        for chunk in right_chunks:
+            right_spill.add(chunk)
+        for chunk in left():
+            left_spill.add(chunk)
+        stats["spill_partitions"] = partitions
+        stats["spill_bytes"] = stats.get("spill_bytes", 0) + right_spill.bytes + left_spill.bytes
+        built.update(right=right_spill, left=left_spill, empty_right=empty_right)
+        yield from probe_spilled()
+    return stream
+
+
+def _aggregate_avg(
+    src: Stream, by: str | List[str], column: str, alias: str, state: Dict[str, Any] | None = None
+) -> pd.DataFrame:
+    # Mergeable partial state: per-key sum and count, compacted as it grows. With several
+    # group keys the partials have a MultiIndex and every level is part of the key.
+    keys = _keys(by)
+    levels = list(range(len(keys)))
+    partials: List[pd.DataFrame] = []
+    pending = 0
+    limit = CHUNK_ROWS
+    for chunk in src():
+        part = chunk.groupby(by)[column].agg(["sum", "count"])
+        partials.append(part)
+        pending += len(part)
+        if pending > limit:
+            partials = [pd.concat(partials).groupby(level=levels).sum()]
+            pending = len(partials[0])
+            # With many distinct keys, compact less often rather than on every chunk
+            limit = max(CHUNK_ROWS, 2 * pending)
+    if partials:
+        total = pd.concat(partials).groupby(level=levels).sum()
+    else:
+        total = pd.DataFrame({**{key: [] for key in keys}, "sum": [], "count": []}).set_index(by)
+    if state is not None:
+        # Incremental run: the stored partial state of earlier runs is one more partial
+        total = merge_state(total, by, state)
+    return average(total, by, alias)
+
+
+def _tee_head(src: Stream, n: int, heads: Dict[Stream, pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    # Passes src's chunks through to a writer and keeps its first n rows for the preview
+    taken: List[pd.DataFrame] = []
+    rows = 0
+    for chunk in src():
+        if rows < n:
+            taken.append(chunk.head(n - rows).copy())
+            rows += len(taken[-1])
+            if rows >= n:
+                heads[src] = pd.concat(taken, ignore_index=True)
+        yield chunk
+    if src not in heads:
+        heads[src] = pd.concat(taken, ignore_index=True) if taken else pd.DataFrame()
+
+
+def _head(src: Stream, n: int) -> pd.DataFrame:
+    taken: List[pd.DataFrame] = []
+    rows = 0
+    for chunk in src():
+        taken.append(chunk.head(n - rows))
+        rows += len(taken[-1])
+        if rows >= n:
+            break
+    return pd.concat(taken, ignore_index=True) if taken else pd.DataFrame()
+
+
+def run_steps(steps: List[Dict[str, Any]]) -> Tuple[pd.DataFrame, List[Dict[str, Any]]]:
+    from .pipeline import _apply_filter, _trim_strings
+
+    context: Dict[str, Stream] = {}
+    metrics: List[Dict[str, Any]] = []
+    # First rows of streams a writer already pulled, so the preview does not run them again
+    heads: Dict[Stream, pd.DataFrame] = {}
+
+    def current() -> Stream:
+        return context.get("result", list(context.values())[-1])
+
+    def target(step: Dict[str, Any]) -> Iterator[pd.DataFrame]:
+        src = context[step["input"]] if step.get("input") else current()
+        return _tee_head(src, 10, heads)
+
+    with tempfile.TemporaryDirectory(prefix="pipeline_", dir=SPILL_DIR) as spill_dir:
+        for step in steps:
+            op = step.get("op")
+            started = time.perf_counter()
+            stats: Dict[str, Any] = {"op": op}
+            if op == "read_csv":
+                path = step.get("path", "./data/input.csv")
+                context[step.get("name", "csv")] = _read_csv(path, step.get("columns"))
+            elif op == "read_json":
+                path = step.get("path", "./data/input.json")
+                context[step.get("name", "json")] = _read_json(path, step.get("columns"))
+            elif op == "read_parquet":
+                path = step.get("path", "./data/input.parquet")
+                context[step.get("name", "parquet")] = _read_parquet(path, step.get("columns"), step.get("filters"))
+            elif op == "trim_strings":
+                src = step.get("input") or "csv"
+                context[src] = _map(context[src], _trim_strings)
+            elif op == "filter":
+                src = step.get("input") or ("result" if "result" in context else list(context)[-1])
+                context[src] = _map(context[src], lambda df, step=step: _apply_filter(df, step))
+            elif op == "join":
+                left = context[step.get("left", "csv")]
+                right = context[step.get("right", "json")]
+                on = step.get("on", "user_id")
+                context["joined"] = _join(left, right, on, spill_dir, stats)
+            elif op == "aggregate":
+                by = step.get("by", "user_id")
+                metric = step.get("metric", "avg")
+                column = step.get("column", "amount")
+                alias = step.get("alias", f"{metric}_{column}")
+                if metric != "avg":
+                    raise ValueError("Unsupported metric")
+                result = _aggregate_avg(context["joined"], by, column, alias, step.get("state"))
+                context["result"] = lambda result=result: iter([result])
+                stats["rows"] = len(result)
+            elif op == "write_postgres":
+                table = step.get("table", "result")
+                stats.update(write_postgres(target(step), table, step.get("mode"), step.get("key")))
+            elif op == "write_parquet":
+                path = step.get("path", "./data/result.parquet")
+                stats.update(write_parquet(target(step), path, step.get("partition_by"), step.get("mode")))
+            elif op == "write_clickhouse":
+                table = step.get("table", "default.etl_result")
+                stats.update(ch_write_chunks(
+                    target(step), table, order_by=step.get("order_by"), partition_by=step.get("partition_by"),
+                    async_insert=step.get("async_insert"),
+                ))
+            else:
+                raise ValueError(f"Unsupported op: {op}")
+            # Reads and row-wise ops are lazy; their cost shows up in the step that consumes them
+            stats["seconds"] = round(time.perf_counter() - started, 4)
+            metrics.append(stats)
+
+        final = current()
+        head = heads[final] if final in heads else _head(final, 10)
+        return head, metrics
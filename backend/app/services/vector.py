@@ -1,51 +1,537 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
 import math
+import os
 import re
-from dataclasses import dataclass
-from typing import Any, Dict, List, Tuple
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+import numpy as np
+
+from .vector_disk import VectorFile
+
+
+# Defaults for new namespaces; an existing namespace keeps the settings stored with it
+DIM = int(os.getenv("VECTOR_DIM", "256"))
+NGRAMS = [int(n) for n in os.getenv("VECTOR_NGRAMS", "3").split(",") if n.strip()]
+NGRAM_WEIGHT = 0.5
+# Namespaces above this size get an IVF index (k-means cells, probed nearest-first)
+ANN_THRESHOLD = int(os.getenv("VECTOR_ANN_THRESHOLD", "20000"))
+ANN_NPROBE = int(os.getenv("VECTOR_ANN_NPROBE", "8"))
+# Queries scored per matrix product in batch search (bounds the score matrix to block x n)
+SEARCH_BLOCK = int(os.getenv("VECTOR_SEARCH_BLOCK", "256"))
+# Namespaces persist under this directory (memory-mapped base + append log); empty keeps them in memory
+STORE_DIR = os.getenv("VECTOR_STORE_DIR", "./data/vectors") or None
+# Serving replicas can open the store read-only; upserts and compaction are then rejected
+READ_ONLY = os.getenv("VECTOR_READ_ONLY", "0").lower() in ("1", "true", "yes")
+COMPACT_MIN_ROWS = int(os.getenv("VECTOR_COMPACT_MIN_ROWS", "10000"))
 
 
 def _tokenize(text: str) -> List[str]:
-    return re.findall(r"[\wа-яА-Я]+", text.lower())
+    # Underscores split too, so user_id and id_пользователя share the "id" token
+    return re.findall(r"[^\W_]+", text.lower())
 
 
-def _embed(text: str, dim: int = 256) -> List[float]:
-    # Very light hashing embedding for MVP
-    vec = [0.0] * dim
-    for token in _tokenize(text):
-        h = hash(token) % dim
-        vec[h] += 1.0
-    # L2 normalize
-    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
-    return [v / norm for v in vec]
+def _embedder(dim: int = DIM, ngrams: Optional[List[int]] = None) -> Dict[str, Any]:
+    return {"name": "hash", "version": 1, "dim": dim, "ngrams": list(NGRAMS if ngrams is None else ngrams)}
 
 
-def _cosine(a: List[float], b: List[float]) -> float:
-    return sum(x * y for x, y in zip(a, b))
+def _feature(feature: str) -> int:
+    # Stable across processes and restarts, unlike the builtin hash() (PYTHONHASHSEED)
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
 
 
-_STORE: Dict[str, List[Tuple[str, List[float], Dict[str, Any]]]] = {}
+@lru_cache(maxsize=1 << 16)
+def _token_features(token: str, dim: int, ngrams: Tuple[int, ...]) -> Tuple[Tuple[int, ...], Tuple[float, ...]]:
+    # (slot, signed weight) for the word itself and its character n-grams; vocabularies
+    # (column names, intents) repeat a lot, so tokens are hashed once per process
+    features = [("w:" + token, 1.0)]
+    # Boundary markers let n-grams match inflected forms (пользователь / пользователя)
+    padded = f"<{token}>"
+    for n in ngrams:
+        features.extend(("g:" + padded[i:i + n], NGRAM_WEIGHT) for i in range(len(padded) - n + 1))
+    slots, weights = [], []
+    for feature, weight in features:
+        h = _feature(feature)
+        # Low bits pick the slot, the top bit the sign, so collisions cancel out on average
+        slots.append(h % dim)
+        weights.append(weight if h >> 63 else -weight)
+    return tuple(slots), tuple(weights)
 
 
-def upsert(namespace: str, doc_id: str, text: str, metadata: Dict[str, Any]) -> None:
-    emb = _embed(text)
-    col = _STORE.setdefault(namespace, [])
-    for i, (id_, _, _) in enumerate(col):
-        if id_ == doc_id:
-            col[i] = (doc_id, emb, metadata)
+def _embed_batch(texts: List[str], dim: int = DIM, ngrams: Optional[List[int]] = None) -> np.ndarray:
+    """Signed feature hashing of words and character n-grams; one L2-normalized row per text."""
+    key = tuple(NGRAMS if ngrams is None else ngrams)
+    rows: List[int] = []
+    slots: List[int] = []
+    weights: List[float] = []
+    for i, text in enumerate(texts):
+        for token in _tokenize(text):
+            token_slots, token_weights = _token_features(token, dim, key)
+            rows.extend([i] * len(token_slots))
+            slots.extend(token_slots)
+            weights.extend(token_weights)
+    flat = np.asarray(rows, dtype=np.int64) * dim + np.asarray(slots, dtype=np.int64)
+    out = np.bincount(flat, weights=np.asarray(weights, dtype=np.float64), minlength=len(texts) * dim)
+    out = out.reshape(len(texts), dim).astype(np.float32)
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return out / norms
+
+
+def _embed(text: str, dim: int = DIM) -> List[float]:
+    return _embed_batch([text], dim)[0].tolist()
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    # O(n) selection, then sort only the k winners
+    if k < scores.size:
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(scores.size)
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+def _top_k_rows(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Row-wise _top_k over a (queries, rows) score matrix: (indices, scores), best first
+    n = scores.shape[1]
+    if k < n:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(n), scores.shape)
+    top = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-top, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+
+def _posting_value(value: Any) -> Optional[str]:
+    # JSON text keeps 1, "1" and true apart while staying hashable
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return json.dumps(value)
+    return None
+
+
+class IncompatibleNamespace(ValueError):
+    """A persisted namespace whose vectors were built by another embedder (or one that was not recorded)."""
+
+
+class _IVFIndex:
+    """Inverted-file index: rows are assigned to the nearest of ``nlist`` k-means centroids."""
+
+    def __init__(self, sample: np.ndarray, n: int, iterations: int = 10, seed: int = 0) -> None:
+        self.nlist = max(1, int(math.sqrt(n)))
+        rng = np.random.default_rng(seed)
+        centroids = sample[rng.choice(sample.shape[0], size=min(self.nlist, sample.shape[0]), replace=False)].copy()
+        self.nlist = centroids.shape[0]
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(self.nlist):
+                members = sample[assign == c]
+                if members.size:
+                    centroids[c] = members.mean(axis=0)
+            # Spherical k-means: vectors are unit length, keep centroids on the sphere
+            centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-12
+        self.centroids = centroids.astype(np.float32)
+        self.trained_on = n
+        # Rows of each cell (inverted lists), grown by doubling; sizes[c] entries are used
+        self.lists = [np.empty(0, dtype=np.int64) for _ in range(self.nlist)]
+        self.sizes = np.zeros(self.nlist, dtype=np.int64)
+
+    def assign_rows(self, vectors: np.ndarray, start: int) -> None:
+        cells = np.argmax(vectors @ self.centroids.T, axis=1)
+        order = np.argsort(cells, kind="stable")
+        rows = start + order
+        bounds = np.searchsorted(cells[order], np.arange(self.nlist + 1))
+        for c in np.flatnonzero(np.diff(bounds)):
+            new = rows[bounds[c]:bounds[c + 1]]
+            size = self.sizes[c]
+            if size + new.size > self.lists[c].size:
+                grown = np.empty(max(size + new.size, 2 * self.lists[c].size), dtype=np.int64)
+                grown[:size] = self.lists[c][:size]
+                self.lists[c] = grown
+            self.lists[c][size:size + new.size] = new
+            self.sizes[c] = size + new.size
+
+    def candidates(self, q: np.ndarray, nprobe: int) -> np.ndarray:
+        cells = _top_k(self.centroids @ q, min(nprobe, self.nlist))
+        return np.concatenate([self.lists[c][: self.sizes[c]] for c in cells])
+
+
+class _Namespace:
+    """Unit vectors in a read-only base matrix (memory-mapped when persisted) followed by an
+    in-memory tail of newer rows. An upsert appends a row and retires the previous one."""
+
+    def __init__(self, embedder: Optional[Dict[str, Any]] = None, disk: Optional[VectorFile] = None) -> None:
+        self.embedder = embedder or _embedder()
+        self.dim = dim = self.embedder["dim"]
+        self.disk = disk
+        self.base = np.zeros((0, dim), dtype=np.float32)
+        self.tail = np.zeros((16, dim), dtype=np.float32)
+        self.tail_size = 0
+        self.ids: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.rows: Dict[str, int] = {}
+        self.dead = np.zeros(16, dtype=bool)
+        self.dead_count = 0
+        self.index: Optional[_IVFIndex] = None
+        # (metadata key, JSON value) -> rows, including retired ones
+        self.postings: Optional[Dict[Tuple[str, str], List[int]]] = None
+
+    @classmethod
+    def open(cls, disk: VectorFile, locked: bool = False) -> "_Namespace":
+        # flock is per open file, so a caller holding the exclusive lock must not ask again
+        if locked:
+            base, ids, metadata, log = disk.load()
+        else:
+            with disk.lock():
+                base, ids, metadata, log = disk.load()
+        if (disk.embedder or {}).get("name") != "hash" or disk.embedder.get("version") != 1:
+            raise IncompatibleNamespace(
+                f"vector namespace at {disk.path} was built by an incompatible embedder; re-upsert its documents"
+            )
+        ns = cls(disk.embedder, disk)
+        ns.base = base
+        ns.ids = list(ids)
+        ns.metadata = list(metadata)
+        ns.rows = {doc_id: row for row, doc_id in enumerate(ids)}
+        ns.dead = np.zeros(max(16, len(ids)), dtype=bool)
+        ns.append(*log)
+        return ns
+
+    @property
+    def size(self) -> int:
+        return self.base.shape[0] + self.tail_size
+
+    @property
+    def live(self) -> int:
+        return self.size - self.dead_count
+
+    def append(self, doc_ids: List[str], vectors: np.ndarray, metadata: List[Dict[str, Any]]) -> None:
+        if not doc_ids:
             return
-    col.append((doc_id, emb, metadata))
+        start, count = self.size, len(doc_ids)
+        if self.tail_size + count > self.tail.shape[0]:
+            grown = np.zeros((max(self.tail_size + count, 2 * self.tail.shape[0]), self.dim), dtype=np.float32)
+            grown[: self.tail_size] = self.tail[: self.tail_size]
+            self.tail = grown
+        self.tail[self.tail_size:self.tail_size + count] = vectors
+        self.tail_size += count
+        if start + count > self.dead.size:
+            self.dead = np.concatenate([self.dead, np.zeros(max(count, self.dead.size), dtype=bool)])
+        self.ids.extend(doc_ids)
+        self.metadata.extend(metadata)
+        # Later duplicates (in the store or within the batch) win
+        for i, doc_id in enumerate(doc_ids):
+            old = self.rows.get(doc_id)
+            if old is not None:
+                self.dead[old] = True
+                self.dead_count += 1
+            self.rows[doc_id] = start + i
+        if self.index is not None:
+            self.index.assign_rows(vectors, start)
+        if self.postings is not None:
+            self._index_metadata(start, metadata)
+
+    def blocks(self, rows: Optional[np.ndarray] = None, block: int = 65536) -> Iterator[np.ndarray]:
+        # Vectors of the given rows (default: all) in row order, without materializing the whole base
+        rows = np.arange(self.size) if rows is None else rows
+        nbase = self.base.shape[0]
+        for i in range(0, rows.size, block):
+            chunk = rows[i:i + block]
+            in_base = chunk < nbase
+            out = np.empty((chunk.size, self.dim), dtype=np.float32)
+            out[in_base] = self.base[chunk[in_base]]
+            out[~in_base] = self.tail[chunk[~in_base] - nbase]
+            yield out
+
+    def _gather(self, rows: np.ndarray) -> np.ndarray:
+        return np.concatenate(list(self.blocks(rows))) if rows.size else np.zeros((0, self.dim), dtype=np.float32)
 
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        scores = np.concatenate(
+            [queries @ self.base.T, queries @ self.tail[: self.tail_size].T], axis=1
+        )
+        scores[:, self.dead[: self.size]] = -np.inf
+        return scores
 
-def search(namespace: str, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
-    q = _embed(query)
-    col = _STORE.get(namespace, [])
-    scored = [
-        {"id": id_, "score": _cosine(q, emb), "metadata": meta}
-        for (id_, emb, meta) in col
+    def _maybe_index(self) -> None:
+        n = self.size
+        if self.live < ANN_THRESHOLD:
+            self.index = None
+        elif self.index is None or n > 2 * self.index.trained_on:
+            # Retrain once the namespace has doubled since the centroids were fitted
+            rng = np.random.default_rng(0)
+            nlist = max(1, int(math.sqrt(n)))
+            sample = np.flatnonzero(~self.dead[:n])
+            sample = np.sort(rng.choice(sample, size=min(sample.size, nlist * 64), replace=False))
+            self.index = _IVFIndex(self._gather(sample), n)
+            for start, vectors in zip(range(0, n, 65536), self.blocks()):
+                self.index.assign_rows(vectors, start)
+
+    def search(
+        self, q: np.ndarray, top_k: int, exact: bool = False, where: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[int, float]]:
+        return self.search_many(q[None, :], top_k, exact, where)[0]
+
+    def _index_metadata(self, start: int, metadata: List[Dict[str, Any]]) -> None:
+        for offset, meta in enumerate(metadata):
+            for key, value in meta.items():
+                # List values (tags) are indexed per element; nested objects are not filterable
+                for item in value if isinstance(value, list) else [value]:
+                    token = _posting_value(item)
+                    if token is not None:
+                        self.postings.setdefault((key, token), []).append(start + offset)
+
+    def matching(self, where: Dict[str, Any]) -> np.ndarray:
+        """Live rows whose metadata satisfies ``where``: AND across keys, a list value means any of."""
+        if self.postings is None:
+            # Built on the first filtered search so opening a namespace stays cheap
+            self.postings = {}
+            self._index_metadata(0, self.metadata)
+        result: Optional[np.ndarray] = None
+        for key, wanted in where.items():
+            lists = [self.postings.get((key, _posting_value(v)), []) for v in (wanted if isinstance(wanted, list) else [wanted])]
+            rows = np.unique(np.fromiter((r for rows in lists for r in rows), dtype=np.int64))
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+            if result.size == 0:
+                break
+        if result is None:
+            return np.flatnonzero(~self.dead[: self.size])
+        return result[~self.dead[result]]
+
+    def search_many(
+        self,
+        queries: np.ndarray,
+        top_k: int,
+        exact: bool = False,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        subset = self.matching(where) if where else None
+        k = min(top_k, self.live if subset is None else subset.size)
+        if k <= 0:
+            return [[] for _ in range(queries.shape[0])]
+        # A selective filter is scored exactly; training the index for it would be wasted work
+        if subset is None or subset.size >= ANN_THRESHOLD:
+            self._maybe_index()
+        if self.index is not None and not exact and (subset is None or subset.size >= ANN_THRESHOLD):
+            out = []
+            for q in queries:
+                nprobe = ANN_NPROBE
+                while True:
+                    candidates = self.index.candidates(q, nprobe)
+                    if subset is None:
+                        candidates = candidates[~self.dead[candidates]]
+                    else:
+                        candidates = np.intersect1d(candidates, subset, assume_unique=True)
+                    # Small or mostly retired/filtered cells: probe more of them (all cells = brute force)
+                    if candidates.size >= k or nprobe >= self.index.nlist:
+                        break
+                    nprobe *= 2
+                scores = self._gather(candidates) @ q
+                best = _top_k(scores, k)
+                out.append([(int(candidates[i]), float(scores[i])) for i in best])
+            return out
+        # Filtered searches only score the matching rows
+        vectors = self._gather(subset) if subset is not None else None
+        out = []
+        for start in range(0, queries.shape[0], SEARCH_BLOCK):
+            block = queries[start:start + SEARCH_BLOCK]
+            # One (q, n) matrix product per block of queries. Retired rows score -inf and
+            # k never exceeds the live rows, so they are never selected
+            scores = self._scores(block) if vectors is None else block @ vectors.T
+            rows, best = _top_k_rows(scores, k)
+            if subset is not None:
+                rows = subset[rows]
+            out.extend(list(zip(r, s)) for r, s in zip(rows.tolist(), best.tolist()))
+        return out
+
+    def needs_compaction(self) -> bool:
+        if self.disk is not None:
+            # Fold the log into a new base once it is as large as the base (amortized O(1) per row)
+            return self.tail_size >= max(COMPACT_MIN_ROWS, self.base.shape[0])
+        return self.dead_count >= max(COMPACT_MIN_ROWS, self.size // 2)
+
+    def compacted(self) -> "_Namespace":
+        """Returns a namespace holding only live rows; persisted namespaces write a new generation
+        (the caller holds the exclusive lock)."""
+        live = np.flatnonzero(~self.dead[: self.size])
+        ids = [self.ids[r] for r in live]
+        metadata = [self.metadata[r] for r in live]
+        if self.disk is None:
+            ns = _Namespace(self.embedder)
+            ns.append(ids, self._gather(live), metadata)
+            return ns
+        self.disk.write_base(self.disk.generation + 1, ids, metadata, self.blocks(live))
+        return _Namespace.open(self.disk, locked=True)
+
+
+_STORE: Dict[str, _Namespace] = {}
+# Store operations from the async handlers: upserts fsync the log, compaction rewrites the
+# matrix and the first search of a large namespace trains its IVF index. One thread keeps
+# them serialized, as they were on the event loop, without blocking it.
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+T = TypeVar("T")
+
+
+async def run(fn: Callable[..., T], *args: Any) -> T:
+    """Awaits fn(*args) on the vector store's worker thread."""
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vector")
+    return await asyncio.get_running_loop().run_in_executor(_EXECUTOR, fn, *args)
+
+
+def _namespace(name: str, create: bool = False) -> Optional[_Namespace]:
+    ns = _STORE.get(name)
+    if STORE_DIR is None:
+        if ns is None and create:
+            ns = _STORE[name] = _Namespace()
+        return ns
+    if ns is not None and not ns.disk.stale():
+        # Pick up rows other workers appended since the last request
+        with ns.disk.lock():
+            ns.append(*ns.disk.read_log())
+        return ns
+    disk = VectorFile(STORE_DIR, name, _embedder())
+    if not disk.exists():
+        if not create:
+            _STORE.pop(name, None)
+            return None
+        if READ_ONLY:
+            raise PermissionError("vector store is opened read-only")
+        with disk.lock(exclusive=True):
+            disk.create()
+    try:
+        ns = _Namespace.open(disk)
+    except IncompatibleNamespace:
+        if not create:
+            raise
+        if READ_ONLY:
+            raise PermissionError("vector store is opened read-only")
+        ns = _reset(disk)
+    _STORE[name] = ns
+    return ns
+
+
+def _reset(disk: VectorFile) -> _Namespace:
+    # Its vectors cannot be compared with the current embedder's, so the namespace
+    # starts over empty; the upsert that got here is its first document
+    with disk.lock(exclusive=True):
+        try:
+            # Another worker may have reset it already
+            return _Namespace.open(disk, locked=True)
+        except IncompatibleNamespace:
+            disk.embedder = _embedder()
+            disk.dim = disk.embedder["dim"]
+            disk.write_base(disk.generation + 1, [], [], iter(()))
+            return _Namespace.open(disk, locked=True)
+
+
+def upsert(namespace: str, doc_id: str, text: str, metadata: Dict[str, Any]) -> None:
+    upsert_batch(namespace, [{"id": doc_id, "text": text, "metadata": metadata}])
+
+
+def upsert_batch(namespace: str, documents: List[Dict[str, Any]]) -> int:
+    if not documents:
+        return 0
+    if READ_ONLY:
+        raise PermissionError("vector store is opened read-only")
+    ns = _namespace(namespace, create=True)
+    vectors = _embed_batch([d.get("text", "") for d in documents], ns.dim, ns.embedder["ngrams"])
+    ids = [str(d.get("id") or d.get("doc_id") or "doc") for d in documents]
+    metadata = [d.get("metadata") or {} for d in documents]
+    if ns.disk is None:
+        ns.append(ids, vectors, metadata)
+    else:
+        with ns.disk.lock(exclusive=True):
+            if ns.disk.stale():
+                ns = _STORE[namespace] = _Namespace.open(ns.disk, locked=True)
+            # Apply other workers' appends first so this batch's rows win
+            ns.append(*ns.disk.read_log())
+            ns.disk.append(ids, vectors, metadata)
+            ns.append(ids, vectors, metadata)
+            if ns.needs_compaction():
+                ns = _STORE[namespace] = ns.compacted()
+        return len(documents)
+    if ns.needs_compaction():
+        _STORE[namespace] = ns.compacted()
+    return len(documents)
+
+
+def compact(namespace: str) -> Dict[str, Any]:
+    if READ_ONLY:
+        raise PermissionError("vector store is opened read-only")
+    ns = _namespace(namespace)
+    if ns is None:
+        return {"namespace": namespace, "rows": 0}
+    before = ns.size
+    if ns.disk is None:
+        ns = _STORE[namespace] = ns.compacted()
+    else:
+        with ns.disk.lock(exclusive=True):
+            ns = _STORE[namespace] = ns.compacted()
+    return {"namespace": namespace, "rows": ns.size, "removed": before - ns.size}
+
+
+def search(
+    namespace: str, query: str, top_k: int = 5, where: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    return search_batch(namespace, [query], top_k, where)[0]
+
+
+def search_batch(
+    namespace: str, queries: List[str], top_k: int = 5, where: Optional[Dict[str, Any]] = None
+) -> List[List[Dict[str, Any]]]:
+    ns = _namespace(namespace)
+    if ns is None or not queries:
+        return [[] for _ in queries]
+    hits = ns.search_many(_embed_batch(queries, ns.dim, ns.embedder["ngrams"]), top_k, where=where)
+    return [
+        [{"id": ns.ids[row], "score": score, "metadata": ns.metadata[row]} for row, score in rows]
+        for rows in hits
     ]
-    scored.sort(key=lambda x: x["score"], reverse=True)
-    return scored[: top_k]
 
 
+def benchmark(n: int = 100_000, queries: int = 200, top_k: int = 10, dim: int = DIM, seed: int = 0) -> Dict[str, Any]:
+    """Brute force vs IVF on clustered synthetic vectors: recall@k and per-query latency."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 500), dim)).astype(np.float32)
+    data = centers[rng.integers(0, centers.shape[0], n)] + 0.3 * rng.standard_normal((n, dim)).astype(np.float32)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    ns = _Namespace(_embedder(dim))
+    ns.append([str(i) for i in range(n)], data, [{} for _ in range(n)])
+    qs = data[rng.integers(0, n, queries)] + 0.1 * rng.standard_normal((queries, dim)).astype(np.float32)
+    qs /= np.linalg.norm(qs, axis=1, keepdims=True)
+
+    started = time.perf_counter()
+    build_seconds = 0.0
+    if n >= ANN_THRESHOLD:
+        ns._maybe_index()
+        build_seconds = time.perf_counter() - started
+
+    timings: Dict[str, float] = {}
+    found: Dict[str, List[set]] = {}
+    for mode, exact in (("brute", True), ("ivf", False)):
+        started = time.perf_counter()
+        found[mode] = [{row for row, _ in ns.search(q, top_k, exact=exact)} for q in qs]
+        timings[mode] = (time.perf_counter() - started) / queries * 1000
+    recall = float(np.mean([len(a & b) / top_k for a, b in zip(found["brute"], found["ivf"])]))
+    return {
+        "n": n,
+        "dim": dim,
+        "top_k": top_k,
+        "ivf_enabled": ns.index is not None,
+        "ivf_build_seconds": round(build_seconds, 3),
+        "brute_ms_per_query": round(timings["brute"], 3),
+        "ivf_ms_per_query": round(timings["ivf"], 3),
+        f"recall@{top_k}": round(recall, 4),
+    }
+
+
+if __name__ == "__main__":
+    print(benchmark())
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, single worker only
+    fcntl = None
+
+
+# On-disk layout of one vector namespace (one directory per namespace):
+#
+#   meta.json         {"generation", "dim", "rows", "embedder"}; replaced atomically, it
+#                     is the commit point of every compaction
+#   base-<gen>.f32    rows x dim float32, written once and opened with np.memmap(mode="r"),
+#                     so every worker on the host shares the same page cache
+#   base-<gen>.json   {"ids": [...], "metadata": [...]} for the base rows
+#   log-<gen>.f32     vectors upserted since the base was written, appended raw
+#   log-<gen>.jsonl   one {"id", "metadata", "row"} line per appended vector; the line is
+#                     written after its vector, so every complete line points at real data
+#   .lock             flock: exclusive for appends and compaction, shared while loading
+
+# (ids, vectors, metadata), in the argument order of VectorFile.append
+Record = Tuple[List[str], np.ndarray, List[Dict[str, Any]]]
+
+
+class VectorFile:
+    """Reads and writes one namespace directory; tracks how much of the log this process has applied."""
+
+    def __init__(self, root: str, name: str, embedder: Dict[str, Any]) -> None:
+        self.path = os.path.join(root, quote(name, safe=""))
+        # quote() escapes "/", but "", "." and ".." would still resolve to the root or above it
+        if os.path.dirname(os.path.abspath(self.path)) != os.path.abspath(root):
+            raise ValueError(f"invalid vector namespace name: {name!r}")
+        # Settings of a new namespace; replaced by the stored ones on load
+        self.embedder = embedder
+        self.dim = int(embedder["dim"])
+        self.generation = -1
+        self.meta_stamp: Optional[Tuple[int, int]] = None
+        self.log_offset = 0  # bytes of log-<gen>.jsonl already applied
+
+    def _file(self, kind: str, generation: Optional[int] = None) -> str:
+        gen = self.generation if generation is None else generation
+        ext = {"base": "f32", "ids": "json", "log": "f32", "log_ids": "jsonl"}[kind]
+        prefix = "base" if kind in ("base", "ids") else "log"
+        return os.path.join(self.path, f"{prefix}-{gen}.{ext}")
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.path, "meta.json")
+
+    def _stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self._meta_path())
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def exists(self) -> bool:
+        return self._stamp() is not None
+
+    def stale(self) -> bool:
+        # A compaction by any worker replaces meta.json; appends never touch it
+        return self._stamp() != self.meta_stamp
+
+    @contextlib.contextmanager
+    def lock(self, exclusive: bool = False) -> Iterator[None]:
+        if exclusive:
+            os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, ".lock")
+        if not os.path.exists(path):
+            if not exclusive:
+                yield
+                return
+            open(path, "ab").close()
+        with open(path, "rb") as fh:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _write_atomic(self, path: str, data: bytes) -> None:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+
+    def create(self) -> None:
+        """Writes an empty generation 0 unless the namespace already exists (caller holds the exclusive lock)."""
+        if self.exists():
+            return
+        self.write_base(0, [], [], iter(()))
+
+    def load(self) -> Tuple[np.ndarray, List[str], List[Dict[str, Any]], Record]:
+        """Maps the current base read-only and reads the whole log (caller holds a lock)."""
+        self.meta_stamp = self._stamp()
+        with open(self._meta_path(), "r", encoding="utf-8") as fh:
+            meta = json.load(fh)
+        self.generation = int(meta["generation"])
+        self.dim = int(meta["dim"])
+        self.embedder = meta.get("embedder")
+        self.log_offset = 0
+        rows = int(meta["rows"])
+        if rows:
+            base = np.memmap(self._file("base"), dtype=np.float32, mode="r", shape=(rows, self.dim))
+        else:
+            base = np.zeros((0, self.dim), dtype=np.float32)
+        with open(self._file("ids"), "r", encoding="utf-8") as fh:
+            sidecar = json.load(fh)
+        return base, sidecar["ids"], sidecar["metadata"], self.read_log()
+
+    def read_log(self) -> Record:
+        """Returns the log records appended since the last call (by any worker)."""
+        try:
+            with open(self._file("log_ids"), "rb") as fh:
+                fh.seek(self.log_offset)
+                data = fh.read()
+        except FileNotFoundError:
+            data = b""
+        # A writer may be mid-line; only complete lines are committed
+        end = data.rfind(b"\n") + 1
+        records = [json.loads(line) for line in data[:end].splitlines() if line]
+        self.log_offset += end
+        if not records:
+            return [], np.zeros((0, self.dim), dtype=np.float32), []
+        slots = np.array([r["row"] for r in records], dtype=np.int64)
+        first, last = int(slots.min()), int(slots.max())
+        block = np.fromfile(
+            self._file("log"),
+            dtype=np.float32,
+            count=(last - first + 1) * self.dim,
+            offset=first * self.dim * 4,
+        ).reshape(-1, self.dim)
+        return [r["id"] for r in records], block[slots - first], [r["metadata"] for r in records]
+
+    def append(self, ids: List[str], vectors: np.ndarray, metadata: List[Dict[str, Any]]) -> None:
+        """Appends vectors then their id lines (caller holds the exclusive lock and has read the log)."""
+        path = self._file("log")
+        with open(path, "ab") as fh:
+            # Slots come from the file size, so vectors orphaned by a crash are simply skipped
+            start = fh.tell() // (self.dim * 4)
+            fh.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            fh.flush()
+            os.fsync(fh.fileno())
+        lines = b"".join(
+            json.dumps({"id": doc_id, "metadata": meta, "row": start + i}, ensure_ascii=False).encode("utf-8") + b"\n"
+            for i, (doc_id, meta) in enumerate(zip(ids, metadata))
+        )
+        with open(self._file("log_ids"), "ab") as fh:
+            fh.write(lines)
+        self.log_offset += len(lines)
+
+    def write_base(
+        self,
+        generation: int,
+        ids: List[str],
+        metadata: List[Dict[str, Any]],
+        blocks: Iterator[np.ndarray],
+    ) -> None:
+        """Writes a new generation from live rows and commits it by replacing meta.json (exclusive lock)."""
+        os.makedirs(self.path, exist_ok=True)
+        base_path = self._file("base", generation)
+        rows = 0
+        with open(f"{base_path}.tmp", "wb") as fh:
+            for block in blocks:
+                fh.write(np.ascontiguousarray(block, dtype=np.float32).tobytes())
+                rows += block.shape[0]
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(f"{base_path}.tmp", base_path)
+        sidecar = json.dumps({"ids": ids, "metadata": metadata}, ensure_ascii=False).encode("utf-8")
+        self._write_atomic(self._file("ids", generation), sidecar)
+        for kind in ("log", "log_ids"):
+            open(self._file(kind, generation), "wb").close()
+        meta = {"generation": generation, "dim": self.dim, "rows": rows, "embedder": self.embedder}
+        self._write_atomic(self._meta_path(), json.dumps(meta).encode("utf-8"))
+        # Workers still holding the old memmap keep reading the unlinked inode until they reload
+        current = (f"base-{generation}.", f"log-{generation}.")
+        for entry in os.scandir(self.path):
+            if entry.name.startswith(("base-", "log-")) and not entry.name.startswith(current):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+        self.generation = generation
@@ -1,15 +1,17 @@
 import io
-from typing import Any, Dict
+from typing import Any, Dict, Union
 
 import pandas as pd
 
 
-def xml_to_dataframe(content: bytes) -> pd.DataFrame:
+def xml_to_dataframe(content: Union[bytes, str]) -> pd.DataFrame:
+    # Accepts raw bytes or a path to a file on disk
+    source = io.BytesIO(content) if isinstance(content, bytes) else content
     try:
         # pandas will infer the table; users can refine later
-        return pd.read_xml(io.BytesIO(content))  # type: ignore[arg-type]
+        return pd.read_xml(source)  # type: ignore[arg-type]
     except Exception as e:
         # Fallback: try read_xml with parser/stylesheet disabled
-        return pd.read_xml(io.BytesIO(content), xpath=".//*")  # type: ignore[arg-type]
-
-
+        if isinstance(source, io.BytesIO):
+            source.seek(0)
+        return pd.read_xml(source, xpath=".//*")  # type: ignore[arg-type]
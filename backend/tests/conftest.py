@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services import step_cache, vector
+
+
+DEMO_STEPS = [
+    {"op": "read_csv", "name": "csv"},
+    {"op": "trim_strings", "input": "csv"},
+    {"op": "read_json", "name": "json"},
+    {"op": "join", "left": "csv", "right": "json", "on": "user_id"},
+    {"op": "aggregate", "by": "user_id", "metric": "avg", "column": "amount", "alias": "avg_check"},
+]
+
+
+@pytest.fixture(autouse=True)
+def _workdir(tmp_path, monkeypatch):
+    # Pipelines default to ./data/...; every test gets its own directory and step cache
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(step_cache, "_STEP_CACHE", None)
+    monkeypatch.setattr(vector, "_STORE", {})
+
+
+@pytest.fixture
+def demo_data(tmp_path):
+    """Writes ./data/input.csv and ./data/input.json for the default demo steps."""
+    rng = np.random.default_rng(7)
+    n = 5000
+    (tmp_path / "data").mkdir(exist_ok=True)
+    pd.DataFrame({
+        "user_id": rng.integers(0, 200, n),
+        "amount": rng.integers(0, 10_000, n) / 100,
+        "city": rng.choice([" Moscow", "Kazan ", " Perm "], n),
+    }).to_csv(tmp_path / "data" / "input.csv", index=False)
+    pd.DataFrame({
+        "user_id": np.arange(200),
+        "segment": rng.choice(["new", "loyal"], 200),
+    }).to_json(tmp_path / "data" / "input.json", orient="records")
+    return [dict(step) for step in DEMO_STEPS]
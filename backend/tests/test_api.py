@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+
+@pytest.fixture
+def client():
+    # Without the context manager startup (database, scheduler) does not run
+    return TestClient(app)
+
+
+DOCS = [
+    {"id": "users", "text": "user_id customer email", "metadata": {"kind": "table"}},
+    {"id": "orders", "text": "order_id amount user_id", "metadata": {"kind": "table"}},
+    {"id": "guide", "text": "how to load csv files", "metadata": {"kind": "doc"}},
+]
+
+
+def test_batch_upsert_and_search(client):
+    response = client.post("/vector/upsert_batch", json={"namespace": "t", "documents": DOCS})
+    assert response.json() == {"status": "ok", "count": 3}
+    # A later upsert of the same id replaces the document
+    client.post("/vector/upsert", json={"namespace": "t", "id": "guide", "text": "loading parquet datasets",
+                                        "metadata": {"kind": "doc"}})
+
+    queries = ["customer email", "parquet", "amount of orders"]
+    batch = client.post("/vector/search_batch", json={"namespace": "t", "queries": queries, "top_k": 2}).json()
+    assert [hits[0]["id"] for hits in batch["results"]] == ["users", "guide", "orders"]
+    for query, hits in zip(queries, batch["results"]):
+        single = client.post("/vector/search", json={"namespace": "t", "query": query, "top_k": 2}).json()
+        assert single["results"] == hits
+    assert sum(len(h) for h in batch["results"]) == 6
+
+
+def test_search_of_a_missing_namespace_is_empty(client):
+    response = client.post("/vector/search_batch", json={"namespace": "nope", "queries": ["a", "b"]})
+    assert response.json() == {"results": [[], []]}
+
+
+def test_search_filters_by_metadata(client):
+    client.post("/vector/upsert_batch", json={"namespace": "t", "documents": DOCS})
+    body = {"namespace": "t", "query": "user_id", "top_k": 5, "filter": {"kind": "table"}}
+    assert {h["id"] for h in client.post("/vector/search", json=body).json()["results"]} == {"users", "orders"}
+    body["filter"] = {"kind": ["doc", "other"]}
+    assert [h["id"] for h in client.post("/vector/search", json=body).json()["results"]] == ["guide"]
+    body["filter"] = {"kind": "table", "missing": 1}
+    assert client.post("/vector/search", json=body).json()["results"] == []
+
+
+@pytest.mark.parametrize("bad", [["kind", "table"], "kind=table", 3])
+def test_non_object_filter_is_rejected(client, bad):
+    assert client.post("/vector/search", json={"query": "x", "filter": bad}).status_code == 422
+    assert client.post("/vector/search_batch", json={"queries": ["x"], "filter": bad}).status_code == 422
+
+
+def test_vector_calls_run_off_the_event_loop(client, monkeypatch):
+    from app.services import vector
+
+    threads = {}
+    for name in ("upsert", "upsert_batch", "search", "search_batch", "compact"):
+        def record(*args, _name=name, _fn=getattr(vector, name)):
+            threads[_name] = threading.current_thread().name
+            return _fn(*args)
+        monkeypatch.setattr(vector, name, record)
+
+    client.post("/vector/upsert_batch", json={"namespace": "t", "documents": DOCS})
+    client.post("/vector/upsert", json={"namespace": "t", "id": "x", "text": "y"})
+    client.post("/vector/search", json={"namespace": "t", "query": "user"})
+    client.post("/vector/search_batch", json={"namespace": "t", "queries": ["user"]})
+    client.post("/vector/compact", json={"namespace": "t"})
+    assert len(threads) == 5
+    assert all(name.startswith("vector") for name in threads.values())
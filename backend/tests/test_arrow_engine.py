@@ -0,0 +1,53 @@
+import pandas as pd
+import pyarrow as pa
+
+from app.services.arrow_engine import execute_step
+
+
+def test_steps_keep_arrow_strings():
+    context = {"csv": pa.table({"user_id": [1, 2, 3], "city": [" a", "b ", None]})}
+    metrics = execute_step({"op": "trim_strings", "input": "csv"}, context)
+    assert context["csv"]["city"].to_pylist() == ["a", "b", None]
+    assert context["csv"].schema.field("city").type == pa.string()
+    assert metrics["rows"] == 3
+
+    execute_step({"op": "filter", "input": "csv", "column": "city", "operator": "in", "value": ["a", "b"]}, context)
+    assert context["csv"]["user_id"].to_pylist() == [1, 2]
+
+
+def test_join_and_average_sorted_by_key():
+    context = {
+        "csv": pa.table({"user_id": [2, 1, 2, 1, 3], "amount": [1.0, 2.0, 3.0, 4.0, 5.0]}),
+        "json": pa.table({"user_id": [1, 2], "segment": ["x", "y"]}),
+    }
+    execute_step({"op": "join"}, context)
+    execute_step({"op": "aggregate", "alias": "avg_check"}, context)
+    assert context["result"].to_pydict() == {"user_id": [1, 2, 3], "avg_check": [3.0, 2.0, 5.0]}
+
+
+def _pandas_context():
+    csv = pd.DataFrame({
+        "user_id": [3, 1, 2, 1, 3, None, 2],
+        "city": ["b", "a", "a", "a", "b", "a", None],
+        "amount": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0],
+    })
+    json = pd.DataFrame({"user_id": [2.0, 1.0, 1.0, 3.0], "segment": ["y", "x", "z", "w"]})
+    return csv, json
+
+
+def test_join_keeps_the_pandas_row_order():
+    csv, json = _pandas_context()
+    context = {"csv": pa.Table.from_pandas(csv), "json": pa.Table.from_pandas(json)}
+    execute_step({"op": "join", "on": "user_id"}, context)
+    expected = csv.merge(json, on="user_id", how="left")
+    # Unmatched rows: None from Arrow, NaN from pandas
+    fill = {"segment": "-"}
+    pd.testing.assert_frame_equal(context["joined"].to_pandas().fillna(fill), expected.fillna(fill))
+
+
+def test_aggregate_by_several_columns_matches_pandas():
+    csv, json = _pandas_context()
+    context = {"joined": pa.Table.from_pandas(csv)}
+    execute_step({"op": "aggregate", "by": ["city", "user_id"], "alias": "avg_check"}, context)
+    expected = csv.groupby(["city", "user_id"])["amount"].mean().reset_index(name="avg_check")
+    pd.testing.assert_frame_equal(context["result"].to_pandas(), expected)
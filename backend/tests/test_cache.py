@@ -0,0 +1,63 @@
+from app.services.cache import ResultCache
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = ResultCache(max_entries=2, max_bytes=1 << 20)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    # "b" was the least recently used
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+    cache = ResultCache(max_entries=10, max_bytes=20)
+    cache.set("a", "x" * 10)
+    cache.set("b", "y" * 10)
+    assert cache.get("a") is None and cache.get("b") == "y" * 10
+    assert cache.stats()["evictions"] == 1
+
+
+def test_get_returns_a_copy():
+    cache = ResultCache()
+    cache.set("k", {"rows": [1, 2]})
+    cache.get("k")["rows"].append(3)
+    assert cache.get("k") == {"rows": [1, 2]}
+
+
+def test_ttl_expires_entries(monkeypatch):
+    import app.services.cache as cache_module
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    cache = ResultCache(ttl=10)
+    cache.set("k", 1)
+    now[0] += 5
+    assert cache.get("k") == 1
+    now[0] += 10
+    assert cache.get("k") is None
+
+
+def test_directory_tier_survives_a_new_instance(tmp_path):
+    ResultCache(directory=str(tmp_path)).set("k", {"v": 1})
+    cache = ResultCache(directory=str(tmp_path))
+    assert cache.get("k") == {"v": 1}
+    assert cache.stats()["disk_hits"] == 1
+    cache.clear()
+    assert ResultCache(directory=str(tmp_path)).get("k") is None
+
+
+def test_on_evict_reports_every_key_leaving_memory(monkeypatch):
+    import app.services.cache as cache_module
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    evicted = []
+    cache = ResultCache(max_entries=2, ttl=10, on_evict=evicted.append)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("b", 3)  # replacing is not an eviction
+    cache.set("c", 4)
+    assert evicted == ["a"]
+    now[0] += 20
+    assert cache.get("b") is None
+    cache.clear()
+    assert evicted == ["a", "b", "c"]
@@ -0,0 +1,78 @@
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from app.services import ch_client
+from app.services.reco import generate_clickhouse_ddl
+
+
+class _FakeClient:
+    def __init__(self):
+        self.commands = []
+        self.inserts = []
+        self.closed = False
+
+    def command(self, sql):
+        self.commands.append(sql)
+
+    def insert_df(self, table, df, settings=None):
+        self.inserts.append((table, len(df), settings))
+
+    def insert_arrow(self, table, data, settings=None):
+        self.inserts.append((table, data.num_rows, settings))
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    created = []
+
+    def get_client():
+        created.append(_FakeClient())
+        return created[-1]
+
+    monkeypatch.setattr(ch_client, "get_client", get_client)
+    monkeypatch.setattr(ch_client, "_IDLE", [])
+    return created
+
+
+def test_ddl_orders_by_key_and_partitions():
+    ddl = generate_clickhouse_ddl(
+        "db.t",
+        {"user_id": {"dtype": "int64", "nullable": False}, "dt": {"dtype": "datetime64[ns]", "nullable": True}},
+        ["user_id"],
+        "toYYYYMM(dt)",
+    )
+    assert "`user_id` Int64" in ddl and "`dt` Nullable(DateTime)" in ddl
+    assert ddl.endswith("ENGINE = MergeTree PARTITION BY toYYYYMM(dt) ORDER BY (`user_id`)")
+    assert generate_clickhouse_ddl("t", {"v": {"dtype": "object"}}).endswith("ORDER BY tuple()")
+
+
+def test_inserts_in_blocks_and_reuses_the_pooled_client(clients, monkeypatch):
+    monkeypatch.setattr(ch_client, "INSERT_BLOCK_ROWS", 2)
+    df = pd.DataFrame({"user_id": [1, 2, 3], "amount": [1.0, 2.0, 3.0]})
+    out = ch_client.write_chunks([df, pa.table({"user_id": [4], "amount": [4.0]})], "db.result")
+    assert (out["rows"], out["blocks"]) == (4, 3)
+    client = clients[0]
+    assert client.commands[0] == "CREATE DATABASE IF NOT EXISTS db"
+    # The default sorting key is the id-like column, which therefore is not Nullable
+    assert "`user_id` Int64" in client.commands[1] and "`amount` Nullable(Float64)" in client.commands[1]
+    assert [rows for _, rows, _ in client.inserts] == [2, 1, 1]
+
+    ch_client.write_dataframe(df, "db.result", async_insert=True)
+    assert len(clients) == 1
+    assert client.inserts[-1][2] == {"async_insert": 1, "wait_for_async_insert": 1}
+
+
+def test_failed_insert_closes_the_client(clients):
+    class Broken(_FakeClient):
+        def insert_df(self, table, df, settings=None):
+            raise ConnectionError("reset")
+
+    clients.append(Broken())
+    ch_client._IDLE.append(clients[0])
+    with pytest.raises(ConnectionError):
+        ch_client.write_dataframe(pd.DataFrame({"a": [1]}), "t")
+    assert clients[0].closed and ch_client._IDLE == []
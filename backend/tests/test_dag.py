@@ -0,0 +1,51 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.services.dag import build_dependencies, run_dag
+from app.services.planner import resolve
+
+from conftest import DEMO_STEPS
+
+
+def test_dependencies_of_the_demo_plan():
+    nodes, final = resolve([dict(s) for s in DEMO_STEPS] + [{"op": "write_parquet"}])
+    assert final == "result"
+    # read_csv, trim(csv), read_json, join, aggregate, write(result)
+    assert build_dependencies(nodes) == [set(), {0}, set(), {1, 2}, {3}, {4}]
+
+
+def test_in_place_ops_wait_for_earlier_readers():
+    nodes, _ = resolve([
+        {"op": "read_csv"},
+        {"op": "write_parquet", "input": "csv"},
+        {"op": "filter", "input": "csv", "column": "x"},
+    ])
+    # The filter rewrites "csv" only after the writer has read it
+    assert build_dependencies(nodes) == [set(), {0}, {0, 1}]
+
+
+def test_independent_steps_run_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+
+    def execute(step, context):
+        if step["op"].startswith("read"):
+            # Both reads must be in flight at once to get past the barrier
+            barrier.wait()
+        context[step.get("name") or step["op"]] = step["op"]
+        return {"seen": sorted(context)}
+
+    steps = [{"op": "read_csv"}, {"op": "read_json"}]
+    context, final, metrics = asyncio.run(run_dag(steps, execute, max_workers=2))
+    assert context == {"csv": "read_csv", "json": "read_json"}
+    assert final == "json"
+    assert [m["op"] for m in metrics] == ["read_csv", "read_json"]
+
+
+def test_failure_propagates():
+    def execute(step, context):
+        raise RuntimeError(step["op"])
+
+    with pytest.raises(RuntimeError, match="read_csv"):
+        asyncio.run(run_dag([{"op": "read_csv"}], execute))
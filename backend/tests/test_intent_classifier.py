@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from app.services.intent_classifier import IntentClassifier, parse_slots
+
+
+@pytest.mark.parametrize("text, intent", [
+    ("объедини csv и json по user_id и загрузи в clickhouse", "etl"),
+    ("проанализируй файл csv", "analysis"),
+    ("подключись к базе postgres", "connection"),
+    ("etl по user_id", "etl"),
+    ("посчитай средний чек и сохрани в postgres", "etl"),
+    ("Каждый час перенеси xml и json из postgres в ClickHouse, средний чек по user_id", "etl"),
+])
+def test_confident_texts_are_answered_locally(text, intent):
+    result = IntentClassifier().fast_parse(text)
+    assert result is not None and result["intent"] == intent and result["classifier"] == "rules"
+
+
+@pytest.mark.parametrize("text", [
+    "привет, как дела?",
+    "what is the weather",
+    "сколько строк в таблице orders",
+    # Off-topic, but with a keyword of some label
+    "расскажи анекдот про etl",
+    "what is a join in sql",
+    "how do I load a dishwasher",
+    "подключи принтер",
+])
+def test_unrelated_text_is_escalated(text):
+    classifier = IntentClassifier()
+    assert classifier.fast_parse(text) is None
+    assert classifier.stats()["escalated"] == 1
+
+
+def test_slots():
+    slots = parse_slots("Каждый час перенеси xml и json из postgres в ClickHouse, средний чек по user_id")
+    assert slots == {
+        "sources": ["json", "xml"],
+        "target": "clickhouse",
+        "operations": ["join", "aggregate"],
+        "schedule": "@hourly",
+    }
+    assert parse_slots("что-нибудь")["sources"] == ["csv", "json"]
+    # A key mention alone keeps the default operations
+    assert parse_slots("etl по user_id")["operations"] == ["join", "aggregate"]
+    assert parse_slots("посчитай средний чек по user_id из csv")["operations"] == ["aggregate"]
+
+
+def test_parse_intent_skips_the_llm_on_the_fast_path(monkeypatch):
+    from app.services import llm_client as llm
+
+    async def no_llm(*args, **kwargs):
+        raise AssertionError("the LLM must not be called")
+
+    monkeypatch.setattr(llm.llm_client, "_cached_completion", no_llm)
+    result = asyncio.run(llm.llm_client.parse_intent("построй пайплайн из csv в clickhouse ежедневно"))
+    assert (result["intent"], result["target"], result["schedule"]) == ("etl", "clickhouse", "@daily")
@@ -0,0 +1,286 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from app.services import llm_client as llm
+from app.services.llm_client import LLMClient, Provider
+
+
+def _answer(text):
+    return httpx.Response(200, json={"choices": [{"message": {"content": text}}]})
+
+
+def _provider(name, monkeypatch):
+    monkeypatch.setenv(f"TEST_{name.upper()}_KEY", "secret")
+    return Provider(
+        name, "model", f"https://{name}.test/v1/chat", f"TEST_{name.upper()}_KEY", "Authorization: Bearer {key}",
+        5, llm._chat_payload, llm._chat_text, stream_payload=llm._chat_stream_payload, delta=llm._chat_delta,
+    )
+
+
+@pytest.fixture
+def make_client(monkeypatch):
+    """make_client({name: handler, ...}) -> LLMClient whose providers answer through the handlers."""
+    clients = []
+
+    def make(handlers):
+        client = LLMClient([_provider(name, monkeypatch) for name in handlers])
+        for name, handler in handlers.items():
+            client._clients[name] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        asyncio.run(client.aclose())
+
+
+def test_falls_back_to_the_next_provider(make_client):
+    seen = []
+
+    def broken(request):
+        seen.append(("a", request.headers["authorization"], json.loads(request.content)["max_tokens"]))
+        return httpx.Response(500)
+
+    def working(request):
+        seen.append(("b",))
+        return _answer("hello")
+
+    client = make_client({"a": broken, "b": working})
+    assert asyncio.run(client.complete("hi", max_tokens=7)) == "hello"
+    assert seen == [("a", "Bearer secret", 7), ("b",)]
+    assert client.health["a"].errors == 1 and client.health["b"].calls == 1
+
+
+def test_connections_are_pooled_per_provider(make_client):
+    client = make_client({"a": lambda request: _answer("x")})
+    first = client._client(client.providers[0])
+
+    async def many():
+        return await asyncio.gather(*(client.complete("hi") for _ in range(5)))
+
+    assert asyncio.run(many()) == ["x"] * 5
+    assert client._client(client.providers[0]) is first
+
+
+def test_all_providers_failing_gives_the_fallback_text(make_client):
+    client = make_client({"a": lambda request: httpx.Response(503)})
+    assert asyncio.run(client.complete("etl")) is None
+    assert "ETL" in asyncio.run(client.generate_response("etl"))
+
+
+def test_hedged_call_keeps_the_first_answer(make_client, monkeypatch):
+    monkeypatch.setattr(llm, "HEDGE", True)
+    cancelled = []
+
+    async def slow(request):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        return _answer("slow")
+
+    async def fast(request):
+        await asyncio.sleep(0.05)
+        return _answer("fast")
+
+    client = make_client({"slow": slow, "fast": fast})
+    started = time.perf_counter()
+    assert asyncio.run(client.complete("hi")) == "fast"
+    assert time.perf_counter() - started < 2
+    assert cancelled == [True]
+
+
+@pytest.fixture
+def answer_cache(monkeypatch):
+    index = llm._SemanticIndex()
+    cache = llm.ResultCache(max_entries=2, max_bytes=1 << 20, on_evict=index.discard)
+    monkeypatch.setattr(llm, "SEMANTIC_INDEX", index)
+    monkeypatch.setattr(llm, "CACHE", cache)
+    monkeypatch.setattr(llm, "SEMANTIC_CACHE", True)
+    monkeypatch.setattr(llm, "CACHE_COUNTERS", dict.fromkeys(llm.CACHE_COUNTERS, 0))
+    return index
+
+
+def test_semantic_cache_is_private_and_follows_evictions(make_client, answer_cache, tmp_path, monkeypatch):
+    from app.services import vector
+    monkeypatch.setattr(vector, "STORE_DIR", str(tmp_path / "vectors"))
+    calls = []
+
+    def handler(request):
+        calls.append(json.loads(request.content)["messages"][1]["content"])
+        return _answer(f"answer {len(calls)}")
+
+    client = make_client({"a": handler})
+
+    def ask(query):
+        return asyncio.run(client._cached_completion("intent", query, query, 100))
+
+    assert ask("Load the users CSV into Postgres") == "answer 1"
+    assert ask("load  the users csv into postgres") == "answer 1"        # exact after normalization
+    assert ask("load the users csv into the postgres") == "answer 1"  # near duplicate
+    assert llm.cache_stats()["semantic_hits"] == 1 and len(calls) == 1
+
+    ask("count orders per day")
+    ask("average check by city")
+    # The first answer was evicted from the cache, and its index row with it
+    assert llm.cache_stats()["semantic_entries"] == 2
+    assert ask("load the users csv into the postgres") == "answer 4"
+    # Nothing is written to the user-facing vector store
+    assert not (tmp_path / "vectors").exists() and vector._STORE == {}
+
+
+def test_semantic_index_compares_within_a_group_and_reuses_rows():
+    index = llm._SemanticIndex()
+    index.add("k1", "intent|a", "daily sales report")
+    assert index.nearest("steps|a", "daily sales report") is None
+    key, score = index.nearest("intent|a", "daily sales report")
+    assert key == "k1" and score == pytest.approx(1.0, abs=1e-5)
+    index.discard("k1")
+    index.add("k2", "intent|a", "weekly report")
+    assert index.rows == {"k2": 0} and len(index.keys) == 1
+
+
+def test_breaker_opens_after_consecutive_failures_and_probes_once(make_client, monkeypatch):
+    monkeypatch.setattr(llm, "BREAKER_FAILURES", 2)
+    now = [100.0]
+    monkeypatch.setattr(llm.time, "monotonic", lambda: now[0])
+    failing = {"on": True}
+    calls = []
+
+    def flaky(request):
+        calls.append(request.url.host)
+        return httpx.Response(500) if failing["on"] else _answer("a")
+
+    client = make_client({"a": flaky})
+    health = client.health["a"]
+    for _ in range(2):
+        assert asyncio.run(client.complete("hi")) is None
+    assert health.state(now[0]) == "open"
+    assert asyncio.run(client.complete("hi")) is None
+    assert len(calls) == 2  # skipped while open
+
+    now[0] += llm.BREAKER_COOLDOWN + 1
+    assert health.state(now[0]) == "half_open"
+    assert health.acquire(now[0]) and not health.allows(now[0])  # one probe at a time
+    health.probing = False
+    failing["on"] = False
+    assert asyncio.run(client.complete("hi")) == "a"
+    assert health.state(now[0]) == "closed" and len(calls) == 3
+
+
+def test_providers_are_ordered_by_p50_latency(make_client, monkeypatch):
+    monkeypatch.setattr(llm, "LATENCY_SLO", 100)
+    client = make_client({name: lambda request: _answer("x") for name in ("a", "b", "c")})
+    for seconds in (3.0, 3.0, 3.0):
+        client.health["a"].record_success(seconds)
+    client.health["b"].record_success(0.5)
+    # "c" was never called, so it is tried first to get measured
+    assert [p.name for p in client._ordered()] == ["c", "b", "a"]
+    stats = {s["name"]: s for s in client.provider_stats()}
+    assert stats["a"]["p50_seconds"] == 3.0 and stats["b"]["rank"] == 1
+
+
+def test_slow_p50_opens_the_breaker(monkeypatch):
+    monkeypatch.setattr(llm, "LATENCY_SLO", 1.0)
+    monkeypatch.setattr(llm, "SLO_MIN_SAMPLES", 3)
+    health = llm.ProviderHealth()
+    for seconds in (2.0, 2.0):
+        health.record_success(seconds)
+    assert health.state(time.monotonic()) == "closed"
+    health.record_success(2.0)
+    assert health.state(time.monotonic()) == "open"
+    assert "SLO" in health.last_error and not health.latencies
+
+
+def _sse(*events):
+    body = "".join(f"data: {json.dumps(e)}\n\n" for e in events) + "data: [DONE]\n\n"
+    return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+
+def _collect(agen):
+    async def run():
+        return [token async for token in agen]
+    return asyncio.run(run())
+
+
+def test_stream_yields_deltas_and_falls_back_before_the_first_token(make_client):
+    def broken(request):
+        return httpx.Response(502)
+
+    def streaming(request):
+        assert json.loads(request.content)["stream"] is True
+        return _sse(*({"choices": [{"delta": {"content": t}}]} for t in ["Hel", "lo", "!"]))
+
+    client = make_client({"a": broken, "b": streaming})
+    assert _collect(client.stream_response("hi")) == ["Hel", "lo", "!"]
+    assert client.health["a"].errors == 1 and client.health["b"].calls == 1
+
+
+def test_cumulative_stream_is_turned_into_deltas(make_client, monkeypatch):
+    def yandex(request):
+        lines = [{"result": {"alternatives": [{"message": {"text": t}}]}} for t in ["Прив", "Привет", "Привет!"]]
+        return httpx.Response(200, text="\n".join(json.dumps(line) for line in lines))
+
+    client = make_client({"y": yandex})
+    provider = client.providers[0]
+    provider.stream_payload, provider.delta, provider.cumulative = llm._yandex_stream_payload, llm._yandex_text, True
+    assert _collect(client.stream_response("hi")) == ["Прив", "ет", "!"]
+
+
+def test_gemini_stream_skips_events_without_text(make_client):
+    def gemini(request):
+        return _sse(
+            {"candidates": [{"content": {"parts": [{"text": "Hel"}]}}]},
+            {"candidates": [{"content": {"parts": [{"text": "lo"}]}, "finishReason": "STOP"}]},
+            {"candidates": [{"finishReason": "STOP"}]},
+            {"usageMetadata": {"totalTokenCount": 5}},
+        )
+
+    client = make_client({"g": gemini})
+    provider = client.providers[0]
+    gemini_provider = next(p for p in llm.PROVIDERS if p.name == "gemini")
+    provider.stream_payload, provider.delta = gemini_provider.stream_payload, gemini_provider.delta
+    assert _collect(client.stream_response("hi")) == ["Hel", "lo"]
+    assert client.health["g"].errors == 0
+
+
+def test_no_provider_streams_the_fallback(make_client):
+    client = make_client({"a": lambda request: httpx.Response(500)})
+    tokens = _collect(client.stream_response("анализ данных"))
+    assert len(tokens) == 1 and "Upload & Profile" in tokens[0]
+
+
+@pytest.fixture
+def fake_stream(monkeypatch):
+    async def stream_response(message, max_tokens=500):
+        for token in [message, "+", str(max_tokens)]:
+            yield token
+
+    monkeypatch.setattr(llm.llm_client, "stream_response", stream_response)
+
+
+def test_sse_endpoint(fake_stream):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    response = TestClient(app).post("/chat/assistant/stream", json={"message": "hi", "max_tokens": 3})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [line for line in response.text.split("\n\n") if line]
+    assert events == ['data: {"token": "hi"}', 'data: {"token": "+"}', 'data: {"token": "3"}', "event: done\ndata: {}"]
+
+
+def test_websocket_streams_tokens(fake_stream):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    with TestClient(app).websocket_connect("/ws") as ws:
+        ws.send_text(json.dumps({"message": "hi", "max_tokens": 2}))
+        frames = [ws.receive_json() for _ in range(4)]
+        ws.send_text("plain text")
+        assert ws.receive_json() == {"type": "token", "data": "plain text"}
+    assert frames == [
+        {"type": "token", "data": "hi"}, {"type": "token", "data": "+"}, {"type": "token", "data": "2"}, {"type": "done"},
+    ]
@@ -0,0 +1,72 @@
+import asyncio
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from app.services.parquet_io import read_table, write_dataset
+from app.services.pipeline import PipelineRequest, run_pipeline
+from app.services.planner import optimize
+
+
+def _events(days, start=0):
+    return pd.DataFrame({
+        "id": range(start, start + len(days)),
+        "dt": days,
+        "ts": pd.to_datetime([f"{d} 12:00" for d in days]),
+        "amount": [float(i) for i in range(len(days))],
+    })
+
+
+def test_partitioned_write_and_pruned_read(tmp_path):
+    path = str(tmp_path / "events")
+    out = write_dataset([_events(["2024-01-01", "2024-01-02"]), _events(["2024-01-02"], start=2)], path, "dt")
+    assert (out["rows"], out["files"]) == (3, 2)
+    assert sorted(os.listdir(path)) == ["dt=2024-01-01", "dt=2024-01-02"]
+    table = read_table(path, ["id"], [{"column": "dt", "operator": "==", "value": "2024-01-02"}])
+    assert table.column_names == ["id"] and sorted(table["id"].to_pylist()) == [1, 2]
+
+
+def test_write_modes(tmp_path):
+    path = str(tmp_path / "events")
+    write_dataset([_events(["2024-01-01", "2024-01-02"])], path, "dt")
+    write_dataset([_events(["2024-01-02"], start=10)], path, "dt", mode="overwrite_partitions")
+    assert sorted(read_table(path)["id"].to_pylist()) == [0, 10]
+    write_dataset([_events(["2024-01-03"], start=20)], path, "dt", mode="append")
+    assert sorted(read_table(path)["id"].to_pylist()) == [0, 10, 20]
+    write_dataset([_events(["2024-01-04"], start=30)], path, "dt")
+    assert read_table(path)["id"].to_pylist() == [30]
+    with pytest.raises(ValueError):
+        write_dataset([_events(["2024-01-04"])], path, mode="upsert")
+
+
+def test_json_literals_are_cast_to_the_column_type(tmp_path):
+    path = str(tmp_path / "events")
+    write_dataset([_events(["2024-01-01", "2024-01-02", "2024-01-03"])], path)
+    # A timestamp bound arrives from JSON as a string
+    table = read_table(path, ["id"], [{"column": "ts", "operator": ">", "value": "2024-01-02"}])
+    assert sorted(table["id"].to_pylist()) == [1, 2]
+    table = read_table(path, ["id"], [{"column": "id", "operator": "in", "value": ["0", "2"]}])
+    assert sorted(table["id"].to_pylist()) == [0, 2]
+    assert read_table(path, ["id"], [{"column": "amount", "operator": ">", "value": 1.5}])["id"].to_pylist() == [2]
+
+
+def test_planner_folds_castable_filters_and_keeps_the_rest(tmp_path):
+    (tmp_path / "data").mkdir()
+    write_dataset([_events(["2024-01-01", "2024-01-02", "2024-01-03"])], str(tmp_path / "data" / "input.parquet"))
+    steps = [
+        {"op": "read_parquet", "name": "events"},
+        {"op": "filter", "input": "events", "column": "ts", "operator": ">=", "value": "2024-01-02"},
+        {"op": "filter", "input": "events", "column": "id", "operator": "!=", "value": "not a number"},
+        {"op": "write_parquet", "input": "events", "path": "./data/out.parquet"},
+    ]
+    optimized = optimize(steps)
+    assert optimized[0]["filters"] == [{"column": "ts", "operator": ">=", "value": "2024-01-02"}]
+    assert [s["op"] for s in optimized] == ["read_parquet", "filter", "write_parquet"]
+
+    for engine in ("pandas", "arrow", "streaming"):
+        asyncio.run(run_pipeline(PipelineRequest(steps=[steps[0], steps[1], steps[3]], engine=engine)))
+        out = read_table("./data/out.parquet")
+        assert sorted(out["id"].to_pylist()) == [1, 2], engine
+        assert out.schema.field("ts").type == pa.timestamp("ns")
@@ -0,0 +1,128 @@
+import asyncio
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from app.db import session
+from app.services import pg_sink
+from app.services.pg_sink import write_postgres
+
+
+class _FakeTransaction:
+    def __init__(self, log):
+        self.log = log
+
+    async def start(self):
+        self.log.append("BEGIN")
+
+    async def commit(self):
+        self.log.append("COMMIT")
+
+    async def rollback(self):
+        self.log.append("ROLLBACK")
+
+
+class _FakeConnection:
+    def __init__(self):
+        self.log = []
+        self.copied = []
+
+    def transaction(self):
+        return _FakeTransaction(self.log)
+
+    async def execute(self, sql):
+        self.log.append(sql)
+
+    async def copy_records_to_table(self, records, columns, table_name, schema_name):
+        self.copied.append((table_name, columns, records))
+
+
+class _FakePool:
+    def __init__(self):
+        self.conn = _FakeConnection()
+        self.released = False
+
+    async def acquire(self):
+        return self.conn
+
+    async def release(self, conn):
+        self.released = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    # The pool's loop runs on its own thread, as it does under uvicorn
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    fake = _FakePool()
+    monkeypatch.setattr(session, "POOL", fake)
+    monkeypatch.setattr(session, "LOOP", loop)
+    yield fake
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def test_without_pool_writes_csv(tmp_path):
+    (tmp_path / "data").mkdir()
+    chunks = [pd.DataFrame({"a": [1, 2]}), pa.record_batch({"a": [3]})]
+    out = write_postgres(chunks, "public.result")
+    assert out == {"sink": "csv", "path": "./data/public_result.csv", "rows": 3}
+    assert pd.read_csv(tmp_path / "data" / "public_result.csv")["a"].tolist() == [1, 2, 3]
+
+
+def test_mode_validation():
+    with pytest.raises(ValueError):
+        write_postgres([], "t", mode="merge")
+    with pytest.raises(ValueError):
+        write_postgres([], "t", mode="upsert")
+
+
+def test_replace_copies_in_batches(pool, monkeypatch):
+    monkeypatch.setattr(pg_sink, "BATCH_ROWS", 2)
+    chunk = pd.DataFrame({"id": [1, 2, 3], "amount": [1.5, np.nan, 3.0], "city": ["a", None, "c"]})
+    out = write_postgres([chunk], "analytics.result")
+    assert (out["mode"], out["rows"], out["batches"]) == ("replace", 3, 2)
+    log = pool.conn.log
+    assert log[0] == 'CREATE SCHEMA IF NOT EXISTS "analytics"'
+    assert log.index("BEGIN") < log.index('TRUNCATE "analytics"."result"') < log.index("COMMIT")
+    records = [row for _, _, batch in pool.conn.copied for row in batch]
+    # NaN and None go to COPY as NULL
+    assert records == [(1, 1.5, "a"), (2, None, None), (3, 3.0, "c")]
+    assert pool.released
+
+
+def test_upsert_stages_and_merges_on_key(pool):
+    out = write_postgres([pa.record_batch({"id": [1, 1], "v": ["x", "y"]})], "result", key="id")
+    assert out["mode"] == "upsert"
+    assert pool.conn.copied[0][0] == "_stage_result"
+    merge = next(sql for sql in pool.conn.log if sql.startswith("INSERT INTO"))
+    assert 'ON CONFLICT ("id") DO UPDATE SET "v" = EXCLUDED."v"' in merge
+    index = next(sql for sql in pool.conn.log if sql.startswith("CREATE UNIQUE INDEX"))
+    assert index == 'CREATE UNIQUE INDEX IF NOT EXISTS "result_id_key" ON "result" ("id")'
+    assert pool.conn.log.index("BEGIN") < pool.conn.log.index(index)
+    with pytest.raises(ValueError):
+        write_postgres([pa.record_batch({"v": ["x"]})], "result", key="id")
+
+
+def test_long_key_index_names_fit_and_stay_distinct():
+    table = "customer_lifetime_value_by_region"
+    first = pg_sink._key_index("analytics", table, ["customer_id", "region_code_primary"])
+    second = pg_sink._key_index("analytics", table, ["customer_id", "region_code_secondary"])
+    other_schema = pg_sink._key_index("staging", table, ["customer_id", "region_code_primary"])
+    assert max(len(n.encode()) for n in (first, second, other_schema)) <= 63
+    assert len({first, second, other_schema}) == 3
+    assert first == pg_sink._key_index("analytics", table, ["customer_id", "region_code_primary"])
+
+
+def test_calling_from_the_pool_loop_raises_instead_of_deadlocking(pool):
+    async def on_loop():
+        return write_postgres([pd.DataFrame({"a": [1]})], "result")
+
+    future = asyncio.run_coroutine_threadsafe(on_loop(), session.LOOP)
+    with pytest.raises(RuntimeError, match="worker thread"):
+        future.result(timeout=5)
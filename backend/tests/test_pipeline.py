@@ -0,0 +1,27 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+from app.services.pipeline import PipelineRequest, run_pipeline
+
+
+def _run(steps, **kwargs):
+    kwargs.setdefault("cache", False)
+    return asyncio.run(run_pipeline(PipelineRequest(steps=steps, **kwargs)))
+
+
+def _expected():
+    csv = pd.read_csv("data/input.csv")
+    return csv.groupby("user_id")["amount"].mean().reset_index(name="avg_check")
+
+
+@pytest.mark.parametrize("engine", ["pandas", "arrow"])
+def test_engines_match_pandas_reference(demo_data, engine):
+    steps = demo_data + [{"op": "filter", "column": "avg_check", "operator": ">", "value": 50}]
+    result = _run(steps, engine=engine)
+    expected = _expected()
+    expected = expected[expected["avg_check"] > 50].head(10)
+    preview = pd.DataFrame(result["preview"])
+    assert list(preview["user_id"]) == list(expected["user_id"])
+    assert preview["avg_check"].tolist() == pytest.approx(expected["avg_check"].tolist())
@@ -0,0 +1,82 @@
+import pandas as pd
+import pytest
+
+from app.services.planner import explain, optimize
+
+
+@pytest.fixture
+def sources(tmp_path):
+    (tmp_path / "data").mkdir(exist_ok=True)
+    pd.DataFrame({"user_id": [1, 2, 3], "amount": [1.0, 2.0, 3.0], "city": ["a", "b", "c"], "extra": [0, 0, 0]}) \
+        .to_csv(tmp_path / "data" / "input.csv", index=False)
+    pd.DataFrame({"user_id": [1, 2], "segment": ["x", "y"]}).to_json(
+        tmp_path / "data" / "input.json", orient="records", lines=True)
+
+
+def _ops(steps):
+    return [(s["op"], s.get("input")) for s in steps]
+
+
+def test_dead_steps_are_removed(sources):
+    steps = [
+        {"op": "read_csv"},
+        {"op": "read_json", "name": "unused", "path": "./data/input.json"},
+        {"op": "read_json"},
+        {"op": "join"},
+        {"op": "aggregate", "by": "user_id", "column": "amount", "alias": "avg_check"},
+    ]
+    plan = explain(steps)
+    assert [s.get("name") for s in plan["removed_steps"]] == ["unused"]
+    assert [s["op"] for s in plan["steps"]] == ["read_csv", "read_json", "join", "aggregate"]
+
+
+def test_filter_pushed_below_join_and_projection_into_readers(sources):
+    steps = [
+        {"op": "read_csv"},
+        {"op": "read_json"},
+        {"op": "join"},
+        {"op": "filter", "column": "city", "operator": "==", "value": "a"},
+        {"op": "aggregate", "by": "user_id", "column": "amount", "alias": "avg_check"},
+    ]
+    optimized = optimize(steps)
+    assert _ops(optimized) == [
+        ("read_csv", None), ("read_json", None), ("filter", "csv"), ("join", None), ("aggregate", None),
+    ]
+    assert optimized[0]["columns"] == ["amount", "city", "user_id"]
+    assert optimized[1]["columns"] == ["user_id"]
+    # The input list is not modified
+    assert "columns" not in steps[0]
+
+
+@pytest.mark.parametrize("on", ["user_id", ["user_id"]])
+def test_join_keys_may_be_a_list(sources, on):
+    steps = [
+        {"op": "read_csv"},
+        {"op": "read_json"},
+        {"op": "join", "on": on},
+        {"op": "filter", "column": "user_id", "operator": ">", "value": 1},
+        {"op": "aggregate", "by": "user_id", "column": "amount", "alias": "avg_check"},
+    ]
+    optimized = optimize(steps)
+    # A filter on the key goes to both sides
+    assert _ops(optimized)[:4] == [("read_csv", None), ("read_json", None), ("filter", "csv"), ("filter", "json")]
+    assert optimized[0]["columns"] == ["amount", "user_id"]
+    assert optimized[-2]["on"] == on
+
+
+def test_group_keys_may_be_a_list(sources):
+    steps = [
+        {"op": "read_csv"},
+        {"op": "read_json"},
+        {"op": "join", "on": "user_id"},
+        {"op": "aggregate", "by": ["user_id", "city"], "column": "amount", "alias": "avg_check"},
+    ]
+    optimized = optimize(steps)
+    assert optimized[0]["columns"] == ["amount", "city", "user_id"]
+    assert optimized[1]["columns"] == ["user_id"]
+    assert explain(steps)["optimized"]
+
+
+def test_unknown_plans_come_back_unchanged():
+    steps = [{"op": "filter", "column": "x"}, {"op": "mystery"}]
+    assert optimize(steps) is steps
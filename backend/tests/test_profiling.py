@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services import profiling
+
+
+def test_exact_distinct_switches_to_sketch_past_cap(monkeypatch):
+    monkeypatch.setattr(profiling, "DISTINCT_MODE", "exact")
+    monkeypatch.setattr(profiling, "EXACT_DISTINCT_MAX", 1000)
+    monkeypatch.setattr(profiling, "CHUNK_ROWS", 500)
+    df = pd.DataFrame({"id": np.arange(5000), "group": np.arange(5000) % 10})
+
+    acc = profiling._ProfileAccumulator()
+    for start in range(0, len(df), 500):
+        acc.update(df.iloc[start:start + 500])
+    ids = acc.columns["id"]
+    assert ids.sketch is not None and ids.hashes.size == 0
+    assert abs(ids.unique() - 5000) < 5000 * 0.05
+    assert acc.columns["group"].sketch is None
+
+    profile = profiling._profile_dataframe(df)
+    # The sketched column is still verified exactly as a key
+    assert profile["columns_info"]["id"]["unique"] == 5000
+    assert profile["potential_keys"] == ["id"]
+    assert profile["distinct"]["approximate_columns"] == ["id"]
+    assert profile["columns_info"]["group"]["unique"] == 10
+
+
+def test_chunked_csv_profile_matches_single_chunk(tmp_path, monkeypatch):
+    path = tmp_path / "users.csv"
+    pd.DataFrame({
+        "user_id": range(1000),
+        "city": ["a", "b", None, "c"] * 250,
+        "amount": np.arange(1000) % 7 * 1.5,
+    }).to_csv(path, index=False)
+
+    whole = profiling._profile_file(str(path), "users.csv")["profile"]
+    monkeypatch.setattr(profiling, "CHUNK_ROWS", 64)
+    chunked = profiling._profile_file(str(path), "users.csv")["profile"]
+    assert chunked == whole
+    assert chunked["rows"] == 1000
+    assert chunked["null_counts"]["city"] == 250
+    assert chunked["potential_keys"] == ["user_id"]
+
+
+def test_near_unique_column_is_not_a_key():
+    # One duplicate among 20k values is within the sketch's error, so only the exact pass rejects it
+    values = np.arange(20_000)
+    values[-1] = 0
+    profile = profiling._profile_dataframe(pd.DataFrame({"id": np.arange(20_000), "almost": values}))
+    assert profile["potential_keys"] == ["id"]
+    assert profile["columns_info"]["id"]["unique"] == 20_000
+    assert profile["columns_info"]["almost"]["unique"] < 20_000
+
+
+def _upload(name, data):
+    import io
+    from fastapi import UploadFile
+    return UploadFile(io.BytesIO(data), filename=name)
+
+
+def test_profile_datasets_in_worker_pool_keeps_upload_order(monkeypatch):
+    import asyncio
+    monkeypatch.setattr(profiling, "EXECUTOR_KIND", "thread")
+    monkeypatch.setattr(profiling, "EXECUTOR", None)
+    monkeypatch.setattr(profiling, "CACHE", profiling.ResultCache(max_entries=8, max_bytes=1 << 20))
+    files = [
+        _upload("a.csv", b"id,name\n1,x\n2,y\n3,z\n"),
+        _upload("b.jsonl", b'{"id": 1}\n{"id": 2}\n'),
+        _upload("c.csv", b"k;v\n1;2\n"),
+    ]
+    try:
+        results = asyncio.run(profiling.profile_datasets(files))
+    finally:
+        profiling.shutdown_executor()
+    assert [r["name"] for r in results] == ["a.csv", "b.jsonl", "c.csv"]
+    assert [r["profile"]["rows"] for r in results] == [3, 2, 1]
+    assert results[2]["detected"]["sep"] == ";"
+
+
+def test_headerless_csv_key_verification(tmp_path):
+    path = tmp_path / "plain.csv"
+    path.write_text("1,2\n3,4\n5,4\n7,8\n")
+    result = profiling._profile_file(str(path), "plain.csv")
+    assert "error" not in result, result.get("reason")
+    assert result["detected"]["header"] is False
+    profile = result["profile"]
+    assert profile["rows"] == 4
+    assert profile["potential_keys"] == ["0"]
+    assert profile["columns_info"]["1"]["unique"] == 3
+
+
+def test_each_format_goes_to_its_reader(tmp_path):
+    df = pd.DataFrame({"id": [1, 2, 3], "name": ["a", "b", "c"]})
+    df.to_parquet(tmp_path / "x.parquet")
+    df.to_json(tmp_path / "x.json", orient="records")
+    df.to_json(tmp_path / "x.jsonl", orient="records", lines=True)
+    df.to_xml(tmp_path / "x.xml", index=False, parser="etree")
+    df.to_csv(tmp_path / "x.tsv", sep="\t", index=False)
+    for name, fmt in [("x.parquet", "parquet"), ("x.json", "json"), ("x.jsonl", "jsonl"),
+                      ("x.xml", "xml"), ("x.tsv", "tsv")]:
+        result = profiling._profile_file(str(tmp_path / name), name)
+        assert result["detected"]["format"] == fmt
+        assert result["detected"]["reader"] == profiling.READERS[fmt][0]
+        assert result["profile"]["rows"] == 3, name
+        assert result["profile"]["potential_keys"][:1] == ["id"], name
+
+
+def test_unreadable_file_reports_reason(tmp_path):
+    path = tmp_path / "broken.json"
+    path.write_text('[{"id": 1}, {"id": ')
+    result = profiling._profile_file(str(path), "broken.json")
+    assert result["error"] == "Unsupported or unreadable file format"
+    assert result["detected"]["format"] == "json"
+    assert result["reason"]
+
+
+def test_reupload_is_served_from_cache(monkeypatch):
+    import asyncio
+    monkeypatch.setattr(profiling, "EXECUTOR_KIND", "thread")
+    monkeypatch.setattr(profiling, "EXECUTOR", None)
+    monkeypatch.setattr(profiling, "CACHE", profiling.ResultCache(max_entries=8, max_bytes=1 << 20))
+    data = b"id,name\n1,x\n2,y\n"
+    try:
+        first = asyncio.run(profiling.profile_datasets([_upload("a.csv", data), _upload("copy.csv", data)]))
+        second = asyncio.run(profiling.profile_datasets([_upload("renamed.csv", data)]))
+    finally:
+        profiling.shutdown_executor()
+    assert [r["cached"] for r in first] == [False, False]
+    assert first[0]["content_hash"] == first[1]["content_hash"]
+    assert second[0]["cached"] is True and second[0]["name"] == "renamed.csv"
+    assert second[0]["profile"] == first[0]["profile"]
+    assert profiling.cache_stats()["entries"] == 1
+
+
+def test_failed_upload_leaves_no_spool_file(tmp_path, monkeypatch):
+    import asyncio
+    monkeypatch.setattr(profiling, "SPOOL_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "READ_BLOCK_BYTES", 4)
+    upload = _upload("a.csv", b"id,name\n1,x\n")
+    read = upload.read
+
+    async def broken_read(size):
+        if upload.file.tell() >= 8:
+            raise ConnectionResetError("client went away")
+        return await read(size)
+
+    monkeypatch.setattr(upload, "read", broken_read)
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(profiling._spool_upload(upload))
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_sniff_error_is_a_per_file_error(tmp_path, monkeypatch):
+    def broken_sniff(path, name):
+        raise UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte")
+
+    monkeypatch.setattr(profiling, "sniff", broken_sniff)
+    path = tmp_path / "a.csv"
+    path.write_text("id\n1\n")
+    result = profiling._profile_file(str(path), "a.csv")
+    assert result["error"] == "Unsupported or unreadable file format"
+    assert result["detected"] is None and "invalid start byte" in result["reason"]
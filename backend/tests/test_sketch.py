@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.sketch import HyperLogLog, precision_for_error
+
+
+def _hashes(values):
+    return pd.util.hash_pandas_object(pd.Series(values), index=False).to_numpy()
+
+
+@pytest.mark.parametrize("n", [10, 1000, 200_000])
+def test_count_within_error(n):
+    sketch = HyperLogLog(0.01)
+    sketch.add_hashes(_hashes(np.arange(n)))
+    # Duplicates do not change the estimate
+    sketch.add_hashes(_hashes(np.arange(n // 2)))
+    assert abs(sketch.count() - n) <= max(1, 4 * sketch.relative_error * n)
+
+
+def test_merge_equals_union():
+    left, right, both = HyperLogLog(0.02), HyperLogLog(0.02), HyperLogLog(0.02)
+    left.add_hashes(_hashes(np.arange(0, 6000)))
+    right.add_hashes(_hashes(np.arange(4000, 10000)))
+    both.add_hashes(_hashes(np.arange(0, 10000)))
+    left.merge(right)
+    assert left.count() == both.count()
+    with pytest.raises(ValueError):
+        left.merge(HyperLogLog(precision=4))
+
+
+def test_precision_for_error_is_bounded():
+    assert precision_for_error(0.01) == 14
+    assert precision_for_error(1.0) == 4
+    assert precision_for_error(0.0) == 18
@@ -0,0 +1,49 @@
+from app.services import sniff as sniffing
+
+
+def _write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_semicolon_dialect_with_quotes_and_header(tmp_path):
+    path = _write(tmp_path, "x.csv", b'id;name;amount\n1;"Smith; John";10.5\n2;"Doe";3\n')
+    meta = sniffing.sniff(path, "x.csv")
+    assert meta["format"] == "csv"
+    assert (meta["sep"], meta["quotechar"], meta["header"]) == (";", '"', True)
+    assert meta["encoding"] == "utf-8"
+
+
+def test_tab_separated_without_header(tmp_path):
+    path = _write(tmp_path, "x.txt", b"1\t2.5\n2\t3.5\n3\t4.5\n")
+    meta = sniffing.sniff(path, "x.txt")
+    assert meta["format"] == "tsv"
+    assert meta["header"] is False
+
+
+def test_non_utf8_encoding_and_bom(tmp_path):
+    text = "город;сумма\n" + "Москва;1\nКазань;2\nПермь;3\n" * 50
+    meta = sniffing.sniff(_write(tmp_path, "cp.csv", text.encode("cp1251")), "cp.csv")
+    assert meta["encoding"].lower() == "windows-1251"
+    meta = sniffing.sniff(_write(tmp_path, "bom.csv", b"\xef\xbb\xbfa,b\n1,2\n"), "bom.csv")
+    assert (meta["encoding"], meta["encoding_confidence"]) == ("utf-8-sig", 1.0)
+
+
+def test_utf8_check_samples_head_middle_and_tail(tmp_path, monkeypatch):
+    monkeypatch.setattr(sniffing, "SNIFF_SAMPLE_BYTES", 1024)
+    data = b"a,b\n" + "ё,1\n".encode("utf-8") * 5000
+    head, samples = sniffing.read_samples(_write(tmp_path, "big.csv", data), 1024)
+    assert len(samples) == 3 and all(len(s) == 1024 for s in samples)
+    # The middle sample may start inside a two-byte character
+    assert sniffing.detect_encoding(samples)[0] == "utf-8"
+
+
+def test_detect_format():
+    assert sniffing.detect_format(b"PAR1....", "x", "utf-8") == "parquet"
+    assert sniffing.detect_format(b"<rows><row/></rows>", "x", "utf-8") == "xml"
+    assert sniffing.detect_format(b'[{"a": 1}]', "x", "utf-8") == "json"
+    assert sniffing.detect_format(b'{"a": 1}\n{"a": 2}\n', "x", "utf-8") == "jsonl"
+    assert sniffing.detect_format(b'{\n  "a": 1\n}', "x", "utf-8") == "json"
+    assert sniffing.detect_format(b'{"a": [1, 2], "b": [3, 4]}', "x", "utf-8") == "json"
+    assert sniffing.detect_format(b"", "x.parquet", "utf-8") == "parquet"
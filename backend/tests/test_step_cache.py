@@ -0,0 +1,81 @@
+import asyncio
+import copy
+import os
+import time
+
+import pyarrow as pa
+
+from app.services import step_cache
+from app.services.pipeline import PipelineRequest, run_pipeline
+from app.services.planner import resolve
+from app.services.step_cache import StepCache, fingerprints
+
+
+def _fingerprints(steps, engine="pandas"):
+    nodes, _ = resolve(copy.deepcopy(steps))
+    return fingerprints(nodes, engine)
+
+
+def _run(steps, engine="pandas"):
+    result = asyncio.run(run_pipeline(PipelineRequest(steps=steps, engine=engine, optimize=False)))
+    return {m["op"]: m.get("cache") for m in result["steps"]}
+
+
+def test_fingerprints_follow_params_upstream_and_files(demo_data):
+    base = _fingerprints(demo_data)
+    assert None not in base and base == _fingerprints(demo_data)
+    assert _fingerprints(demo_data, "arrow")[0] != base[0]
+
+    edited = copy.deepcopy(demo_data)
+    edited[-1]["alias"] = "avg_amount"
+    # Only the edited step changes
+    assert _fingerprints(edited)[:-1] == base[:-1] and _fingerprints(edited)[-1] != base[-1]
+
+    time.sleep(0.01)
+    with open("data/input.csv", "a") as fh:
+        fh.write("1,1.0,Perm\n")
+    changed = _fingerprints(demo_data)
+    # The CSV read and everything downstream of it; the JSON read is untouched
+    assert changed[2] == base[2]
+    assert all(changed[i] != base[i] for i in (0, 1, 3, 4))
+
+
+def test_writers_and_stateful_steps_are_not_cached(demo_data):
+    steps = demo_data + [{"op": "write_parquet", "path": "./data/out.parquet"}]
+    steps[4] = {**steps[4], "state": {"load": None, "save": "./data/state.parquet"}}
+    assert _fingerprints(steps)[4:] == [None, None]
+
+
+def test_rerun_and_edited_last_step_reuse_cached_outputs(demo_data):
+    first = _run(demo_data)
+    assert set(first.values()) == {"stored"}
+    assert _run(demo_data) == {"aggregate": "hit"}
+
+    edited = copy.deepcopy(demo_data)
+    edited[-1]["alias"] = "avg_amount"
+    assert _run(edited) == {"join": "hit", "aggregate": "stored"}
+    assert step_cache.get_step_cache().stats()["skipped_steps"] == 4 + 3
+
+
+def test_lru_trim_keeps_recently_used(tmp_path):
+    table = pa.table({"v": list(range(1000))})
+    cache = StepCache(str(tmp_path / "cache"), max_bytes=100_000)
+    size = None
+    for i, fp in enumerate(["a", "b", "c"]):
+        assert cache.store(fp, table)
+        path = cache._path(fp)
+        size = size or os.path.getsize(path)
+        os.utime(path, (i, i))
+    cache.load("a")
+    cache.max_bytes = int(3.5 * size)
+    cache.store("d", table)
+    assert cache.load("b") is None
+    assert all(cache.load(fp) is not None for fp in ("a", "c", "d"))
+    assert cache.stats()["evictions"] == 1
+
+
+def test_large_outputs_are_not_stored(tmp_path):
+    cache = StepCache(str(tmp_path / "cache"), max_bytes=1000)
+    assert not cache.store("big", pa.table({"v": list(range(1000))}))
+    assert cache.load("big") is None
+
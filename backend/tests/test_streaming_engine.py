@@ -0,0 +1,86 @@
+import pandas as pd
+import pytest
+
+from app.services import streaming_engine
+
+
+@pytest.fixture
+def counted_reads(monkeypatch):
+    # Number of passes over each source file
+    passes = {}
+    read_csv, read_json = streaming_engine._read_csv, streaming_engine._read_json
+
+    def counting(reader):
+        def make(path, *args):
+            stream = reader(path, *args)
+
+            def counted():
+                passes[path] = passes.get(path, 0) + 1
+                return stream()
+            return counted
+        return make
+
+    monkeypatch.setattr(streaming_engine, "_read_csv", counting(read_csv))
+    monkeypatch.setattr(streaming_engine, "_read_json", counting(read_json))
+    return passes
+
+
+def _expected():
+    csv = pd.read_csv("data/input.csv")
+    csv["city"] = csv["city"].str.strip()
+    return csv.merge(pd.read_json("data/input.json"), on="user_id", how="left")
+
+
+def test_chunked_aggregate_matches_pandas(demo_data, monkeypatch):
+    monkeypatch.setattr(streaming_engine, "CHUNK_ROWS", 300)
+    head, metrics = streaming_engine.run_steps(demo_data)
+    expected = _expected().groupby("user_id")["amount"].mean().reset_index(name="avg_check").head(10)
+    assert head["user_id"].tolist() == expected["user_id"].tolist()
+    assert head["avg_check"].tolist() == pytest.approx(expected["avg_check"].tolist())
+    assert [m["op"] for m in metrics] == [s["op"] for s in demo_data]
+
+
+@pytest.mark.parametrize("budget", [1 << 30, 2000])
+def test_composite_keys_match_pandas(demo_data, monkeypatch, budget):
+    monkeypatch.setattr(streaming_engine, "CHUNK_ROWS", 300)
+    monkeypatch.setattr(streaming_engine, "MEMORY_BUDGET", budget)
+    monkeypatch.setattr(streaming_engine, "SPILL_PARTITIONS", 4)
+    steps = demo_data[:3] + [
+        {"op": "join", "left": "csv", "right": "json", "on": ["user_id"]},
+        {"op": "aggregate", "by": ["segment", "city"], "column": "amount", "alias": "avg_check"},
+    ]
+    head, metrics = streaming_engine.run_steps(steps)
+    expected = _expected().groupby(["segment", "city"])["amount"].mean().reset_index(name="avg_check")
+    assert ("spill_partitions" in metrics[3]) == (budget == 2000)
+    pd.testing.assert_frame_equal(head, expected, check_dtype=False)
+
+
+@pytest.mark.parametrize("budget", [1 << 30, 2000])
+def test_writer_pass_feeds_the_preview(demo_data, counted_reads, monkeypatch, budget):
+    monkeypatch.setattr(streaming_engine, "CHUNK_ROWS", 500)
+    # A 2000-byte budget forces the grace join to spill both sides
+    monkeypatch.setattr(streaming_engine, "MEMORY_BUDGET", budget)
+    monkeypatch.setattr(streaming_engine, "SPILL_PARTITIONS", 4)
+    steps = demo_data[:4] + [
+        {"op": "write_parquet", "input": "joined", "path": "./data/a.parquet"},
+        {"op": "write_parquet", "input": "joined", "path": "./data/b.parquet"},
+    ]
+    head, metrics = streaming_engine.run_steps(steps)
+
+    # One writer pass reads every source once; the second writer reuses the join's build or spill
+    assert counted_reads == {"./data/input.csv": 2 if budget > 2000 else 1, "./data/input.json": 1}
+    expected = _expected()
+    written = pd.read_parquet("data/b.parquet")
+    assert len(written) == len(expected) == len(pd.read_parquet("data/a.parquet"))
+    assert sorted(written["amount"]) == sorted(expected["amount"])
+    assert len(head) == 10
+    assert set(map(tuple, head.to_numpy())) <= set(map(tuple, written[head.columns].to_numpy()))
+    if budget == 2000:
+        assert metrics[3]["spill_partitions"] >= 2
+
+
+def test_preview_of_a_written_stream_does_not_rerun_it(demo_data, counted_reads):
+    steps = demo_data + [{"op": "write_parquet", "path": "./data/result.parquet"}]
+    head, _ = streaming_engine.run_steps(steps)
+    assert counted_reads == {"./data/input.csv": 1, "./data/input.json": 1}
+    assert head.equals(pd.read_parquet("data/result.parquet").head(10))
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from app.services import vector
+
+
+def _clustered(n, dim=32, clusters=None, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters or max(1, n // 50), dim)).astype(np.float32)
+    data = centers[rng.integers(0, centers.shape[0], n)] + 0.2 * rng.standard_normal((n, dim)).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def _namespace(data, metadata=None):
+    ns = vector._Namespace(vector._embedder(data.shape[1]))
+    ns.append([str(i) for i in range(len(data))], data, metadata or [{} for _ in range(len(data))])
+    return ns
+
+
+def test_brute_force_top_k_skips_retired_rows():
+    data = _clustered(200)
+    ns = _namespace(data)
+    best = ns.search(data[5], 3, exact=True)
+    assert best[0][0] == 5 and best[0][1] == pytest.approx(1.0, abs=1e-5)
+    # Re-upserting id "5" retires row 5
+    ns.append(["5"], -data[5:6], [{}])
+    rows = [row for row, _ in ns.search(data[5], 3, exact=True)]
+    assert 5 not in rows and 200 not in rows and len(rows) == 3
+
+
+def test_ivf_lists_cover_every_row_once(monkeypatch):
+    monkeypatch.setattr(vector, "ANN_THRESHOLD", 100)
+    ns = _namespace(_clustered(2000))
+    ns._maybe_index()
+    ns.append(["extra"], _clustered(1, seed=1), [{}])
+    rows = np.concatenate([lst[:size] for lst, size in zip(ns.index.lists, ns.index.sizes)])
+    assert sorted(rows.tolist()) == list(range(2001))
+
+
+def test_ivf_matches_brute_force_and_fills_top_k(monkeypatch):
+    monkeypatch.setattr(vector, "ANN_THRESHOLD", 100)
+    # One probed cell holds far fewer than top_k rows, so the search has to widen nprobe
+    monkeypatch.setattr(vector, "ANN_NPROBE", 1)
+    data = _clustered(3000, clusters=300)
+    ns = _namespace(data)
+    ns._maybe_index()
+    top_k = int(ns.index.sizes.max()) + 1
+    for q in data[:20]:
+        approx = ns.search(q, top_k)
+        exact = ns.search(q, top_k, exact=True)
+        assert len(approx) == top_k
+        assert approx[0][0] == exact[0][0]
+
+
+def test_ivf_with_filter_returns_all_matches(monkeypatch):
+    monkeypatch.setattr(vector, "ANN_THRESHOLD", 100)
+    data = _clustered(3000)
+    metadata = [{"kind": "rare" if i % 300 == 0 else "common"} for i in range(3000)]
+    ns = _namespace(data, metadata)
+    ns._maybe_index()
+    rows = {row for row, _ in ns.search(data[1], 10, where={"kind": "rare"})}
+    assert rows == set(range(0, 3000, 300))
+    # A large filtered subset goes through the index
+    monkeypatch.setattr(vector, "ANN_THRESHOLD", 500)
+    hits = ns.search(data[1], 5, where={"kind": "common"})
+    assert len(hits) == 5 and all(row % 300 for row, _ in hits)
+
+
+def test_embeddings_are_stable_across_processes():
+    import os
+    import subprocess
+    import sys
+    code = "from app.services.vector import _embed; print(repr(_embed('id_пользователя user_id')[:8]))"
+    outputs = {
+        subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                       cwd=os.path.dirname(os.path.dirname(__file__)), env={**os.environ, "PYTHONHASHSEED": seed}).stdout
+        for seed in ("1", "2")
+    }
+    assert len(outputs) == 1
+
+
+def test_shared_tokens_and_ngrams_score_higher():
+    q, related, unrelated = vector._embed_batch(["user_id", "id_пользователя", "order amount"])
+    assert float(q @ related) > float(q @ unrelated)
+    assert np.allclose(np.linalg.norm(vector._embed_batch(["a b", ""]), axis=1), [1.0, 0.0])
+
+
+def test_filter_values_keep_json_types_apart():
+    data = _clustered(4)
+    ns = _namespace(data, [{"v": 1}, {"v": "1"}, {"v": True}, {"v": [1, "x"]}])
+    assert ns.matching({"v": 1}).tolist() == [0, 3]
+    assert ns.matching({"v": "1"}).tolist() == [1]
+    assert ns.matching({"v": [True, "x"]}).tolist() == [2, 3]
+    ns.append(["0"], data[:1], [{"v": 2}])
+    assert ns.matching({"v": 1}).tolist() == [3]
@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.services import vector
+from app.services.vector_disk import VectorFile
+
+
+def _docs(n, prefix="doc"):
+    return [{"id": f"{prefix}{i}", "text": f"column number {i} of table {prefix}", "metadata": {"i": i}}
+            for i in range(n)]
+
+
+def test_namespace_survives_reopen_and_compaction(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector, "STORE_DIR", str(tmp_path / "vectors"))
+    monkeypatch.setattr(vector, "COMPACT_MIN_ROWS", 10)
+    vector.upsert_batch("cols", _docs(8))
+    vector.upsert_batch("cols", _docs(8))  # same ids: the log now holds 16 rows, 8 live
+    assert vector._STORE["cols"].disk.generation == 1
+
+    monkeypatch.setattr(vector, "_STORE", {})  # another worker / a restart
+    ns = vector._namespace("cols")
+    assert isinstance(ns.base, np.memmap)
+    assert (ns.size, ns.live) == (8, 8)
+    hits = vector.search("cols", "column number 3 of table doc", top_k=1)
+    assert hits[0]["id"] == "doc3" and hits[0]["metadata"] == {"i": 3}
+
+
+def test_appends_of_another_worker_are_picked_up(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector, "STORE_DIR", str(tmp_path / "vectors"))
+    vector.upsert_batch("shared", _docs(3, "a"))
+    mine = vector._STORE["shared"]
+    other = vector._Namespace.open(VectorFile(str(tmp_path / "vectors"), "shared", vector._embedder()))
+    with other.disk.lock(exclusive=True):
+        ids, vectors, metadata = ["b0"], vector._embed_batch(["late arrival"]), [{}]
+        other.disk.append(ids, vectors, metadata)
+    assert vector._namespace("shared") is mine
+    assert mine.ids[-1] == "b0"
+
+
+@pytest.mark.parametrize("name", ["", ".", ".."])
+def test_names_outside_the_root_are_rejected(tmp_path, monkeypatch, name):
+    root = tmp_path / "store" / "vectors"
+    monkeypatch.setattr(vector, "STORE_DIR", str(root))
+    (tmp_path / "store").mkdir()
+    bystander = tmp_path / "store" / "base-0.json"
+    bystander.write_text("{}")
+    with pytest.raises(ValueError):
+        VectorFile(str(root), name, vector._embedder())
+    with pytest.raises(ValueError):
+        vector.upsert_batch(name, _docs(1))
+    assert os.listdir(tmp_path / "store") == ["base-0.json"]
+    # Escaped names stay inside the root
+    assert os.path.dirname(VectorFile(str(root), "../x/..", vector._embedder()).path) == str(root)
+
+
+def test_api_rejects_invalid_names(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    monkeypatch.setattr(vector, "STORE_DIR", str(tmp_path / "vectors"))
+    client = TestClient(app)
+    response = client.post("/vector/upsert", json={"namespace": "..", "id": "x", "text": "y"})
+    assert response.status_code == 400
+    assert client.post("/vector/compact", json={"namespace": "."}).status_code == 400
+
+
+def test_namespace_without_embedder_is_rebuilt_on_upsert(tmp_path, monkeypatch):
+    import json
+    from fastapi.testclient import TestClient
+    from app.main import app
+    monkeypatch.setattr(vector, "STORE_DIR", str(tmp_path / "vectors"))
+    vector.upsert_batch("legacy", _docs(3))
+    # Namespaces written before the embedder was recorded have no "embedder" in meta.json
+    meta_path = os.path.join(vector._STORE["legacy"].disk.path, "meta.json")
+    with open(meta_path) as fh:
+        meta = json.load(fh)
+    meta.pop("embedder")
+    with open(meta_path, "w") as fh:
+        json.dump(meta, fh)
+    monkeypatch.setattr(vector, "_STORE", {})
+
+    client = TestClient(app)
+    response = client.post("/vector/search", json={"namespace": "legacy", "query": "column"})
+    assert response.status_code == 400
+    assert "re-upsert" in response.json()["error"]
+
+    assert client.post("/vector/upsert", json={"namespace": "legacy", "id": "new", "text": "fresh column"}).status_code == 200
+    hits = client.post("/vector/search", json={"namespace": "legacy", "query": "column"}).json()["results"]
+    assert [h["id"] for h in hits] == ["new"]
+    with open(meta_path) as fh:
+        assert json.load(fh)["embedder"] == vector._embedder()